@@ -64,8 +64,10 @@ setup(
         "console_scripts": [
             "strix-train = strix.main_entry:train",
             "strix-train-from-cfg = strix.main_entry:train_cfg",
+            "strix-train-dist = strix.main_entry:train_dist",
             "strix-train-and-test = strix.main_entry:train_and_test",
             "strix-test-from-cfg = strix.main_entry:test_cfg",
+            "strix-export = strix.main_entry:export",
             "strix-nni-search = strix.nni_search:nni_search",
             "strix-check-data = strix.data_checker:check_data",
             "strix-gradcam-from-cfg = strix.interpreter:gradcam",
@@ -2,8 +2,6 @@ from configparser import ConfigParser
 from pathlib import Path
 
 from strix.configures import config as cfg
-from monai_ex.engines.utils import CustomKeys
-from monai_ex.engines.utils import get_keys_dict as keys_dict
 
 conf = ConfigParser()
 conf.optionxform = str
@@ -12,6 +10,9 @@ cfg_file = Path(__file__).parent.joinpath(fname)
 
 
 if not cfg_file.is_file():
+    from monai_ex.engines.utils import CustomKeys
+    from monai_ex.engines.utils import get_keys_dict as keys_dict
+
     with cfg_file.open('w') as cfgfile:
 
         conf.add_section("STRIX_CONFIG")
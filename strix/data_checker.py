@@ -2,15 +2,12 @@ import os
 import yaml
 import click
 import numpy as np
-import nibabel as nib
 from tqdm import tqdm
 from functools import partial
 from types import SimpleNamespace as sn
-from sklearn.model_selection import train_test_split
 from utils_cw import check_dir
 
 import torch
-from torchvision.utils import save_image
 
 from strix.utilities.arguments import data_select
 from strix.utilities.click import OptionEx, CommandEx
@@ -30,10 +27,11 @@ from strix.data_io import DATASET_MAPPING
 from strix.configures import config as cfg
 from monai.networks import one_hot
 from monai_ex.utils import first
-from monai_ex.data import DataLoader
 
 
 def save_raw_image(data, meta_dict, out_dir, phase, dataset_name, batch_index, logger_name=None):
+    import nibabel as nib
+
     if isinstance(data, torch.Tensor):
         data = data.cpu().numpy()
 
@@ -99,6 +97,8 @@ def save_2d_image_grid(
         isFile=True,
     )
 
+    from torchvision.utils import save_image
+
     save_image(images, output_path, nrow=nrow, padding=5, normalize=True, scale_each=True)
 
     return output_path
@@ -139,6 +139,8 @@ def save_3d_image_grid(
         output_fname = f"slice{slice_index}.png"
 
     output_path = check_dir(out_dir, dataset_name, f"{phase}-batch{batch_index}", output_fname, isFile=True)
+    from torchvision.utils import save_image
+
     save_image(data_slice, output_path, nrow=nrow, padding=5, normalize=True, scale_each=True)
 
     return output_path
@@ -171,6 +173,9 @@ check_cmd_history = os.path.join(cfg.get_strix_cfg("cache_dir"), '.strix_check_c
 @option("--dump-params", hidden=True, is_flag=True, default=False, callback=partial(dump_params, output_path=check_cmd_history))
 @click.pass_context
 def check_data(ctx, **args):
+    from sklearn.model_selection import train_test_split
+    from monai_ex.data import DataLoader
+
     cargs = sn(**args)
     auxilary_params = get_unknown_options(ctx, verbose=True)
     cargs.out_dir = check_dir(cargs.out_dir, "data checking")
@@ -1,30 +1,83 @@
+import importlib
 from pathlib import Path
-from strix.utilities.imports import import_file
 from strix.configures import config as cfg
-from strix.data_io.base_dataset.classification_dataset import *
-from strix.data_io.base_dataset.selflearning_dataset import *
-from strix.data_io.base_dataset.segmentation_dataset import *
-from strix.data_io.base_dataset.siamese_dataset import *
-
-from strix.data_io.dataio import (
-    CLASSIFICATION_DATASETS,
-    SEGMENTATION_DATASETS,
-    SIAMESE_DATASETS,
-    SELFLEARNING_DATASETS,
-    MULTITASK_DATASETS,
-    DATASET_MAPPING,
-)
-from strix.data_io.generate_dataset import register_dataset_from_cfg
+from strix.utilities.registry import DatasetRegistry
+from strix.utilities.manifest import CONFIG_SUFFIXES, load_source, register_lazy_sources
+
+CLASSIFICATION_DATASETS = DatasetRegistry()
+SEGMENTATION_DATASETS = DatasetRegistry()
+SELFLEARNING_DATASETS = DatasetRegistry()
+MULTITASK_DATASETS = DatasetRegistry()
+SIAMESE_DATASETS = DatasetRegistry()
+
+DATASET_MAPPING = {
+    "segmentation": SEGMENTATION_DATASETS,
+    "classification": CLASSIFICATION_DATASETS,
+    "selflearning": SELFLEARNING_DATASETS,
+    "multitask": MULTITASK_DATASETS,
+    "siamese": SIAMESE_DATASETS,
+}
+
+# heavy modules are imported on first access, see `__getattr__`
+_LAZY_MODULES = [
+    "strix.data_io.base_dataset.classification_dataset",
+    "strix.data_io.base_dataset.selflearning_dataset",
+    "strix.data_io.base_dataset.segmentation_dataset",
+    "strix.data_io.base_dataset.siamese_dataset",
+    "strix.data_io.generate_dataset",
+]
+_LAZY_ATTRS = {
+    "BasicClassificationDataset": _LAZY_MODULES[0],
+    "BasicSelflearningDataset": _LAZY_MODULES[1],
+    "BasicSegmentationDataset": _LAZY_MODULES[2],
+    "SiameseDatasetWrapper": _LAZY_MODULES[3],
+    "BasicSiameseDataset": _LAZY_MODULES[3],
+    "register_dataset_from_cfg": _LAZY_MODULES[4],
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        return getattr(importlib.import_module(_LAZY_ATTRS[name]), name)
+    # names previously re-exported by star imports of the base datasets
+    for module_name in _LAZY_MODULES[:4]:
+        module = importlib.import_module(module_name)
+        if hasattr(module, name):
+            return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 internal_dataset_dir = Path(__file__).parent.parent.joinpath("datasets")
 external_dataset_dir = Path(cfg.get_strix_cfg('EXTERNAL_DATASET_DIR'))
 
 dataset_dirs = [internal_dataset_dir, external_dataset_dir]
 
-for data_dir in dataset_dirs:
-    if data_dir.is_dir():
-        for f in data_dir.glob("*.py"):
-            # print('Import module from file:', str(f))
-            import_file(f.stem, str(f))
-        for j in data_dir.glob("*.yaml"):
-            register_dataset_from_cfg(j)
+_registries = {name: registry for name, registry in globals().items() if name.endswith("_DATASETS")}
+_registries.update({f"DATASET_MAPPING[{k}]": v for k, v in DATASET_MAPPING.items()})
+
+
+_loaded_configs = set()
+
+
+def _load_dataset_source(fpath, module_name=None):
+    if Path(fpath).suffix not in CONFIG_SUFFIXES:
+        return load_source(fpath, module_name)
+    if fpath not in _loaded_configs:
+        from strix.data_io.generate_dataset import register_dataset_from_cfg
+
+        register_dataset_from_cfg(Path(fpath))
+        _loaded_configs.add(fpath)
+
+
+register_lazy_sources(
+    _registries,
+    [
+        f
+        for data_dir in dataset_dirs
+        if data_dir.is_dir()
+        for f in data_dir.iterdir()
+        if f.suffix in (".py", *CONFIG_SUFFIXES)
+    ],
+    cache_name="datasets",
+    loader=_load_dataset_source,
+)
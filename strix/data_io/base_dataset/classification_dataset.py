@@ -3,7 +3,7 @@ from typing import Optional, Sequence, Union
 from monai_ex.data import Dataset
 from monai_ex.transforms import MapTransform, Compose
 from monai_ex.utils import ensure_list
-from strix.data_io.base_dataset.utils import get_input_data
+from strix.data_io.base_dataset.utils import get_input_data, get_cache_dataset_kwargs
 
 
 class BasicClassificationDataset(object):
@@ -46,6 +46,7 @@ class BasicClassificationDataset(object):
             self.transforms += ensure_list(spacer)
         if rescaler is not None:
             self.transforms += ensure_list(rescaler)
+        n_cached_stages = len(self.transforms)
         if resizer is not None:
             self.transforms += ensure_list(resizer)
         if cropper is not None:
@@ -58,6 +59,9 @@ class BasicClassificationDataset(object):
         if to_tensor is not None:
             self.transforms += ensure_list(to_tensor)
 
+        self.dataset_kwargs = get_cache_dataset_kwargs(
+            self.dataset, self.dataset_kwargs, self.transforms, n_cached_stages
+        )
         self.transforms = Compose(self.transforms)
 
         return self.dataset(
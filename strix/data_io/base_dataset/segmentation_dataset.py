@@ -4,7 +4,7 @@ from typing import Optional, Sequence, Union
 from monai_ex.data import Dataset
 from monai_ex.transforms import MapTransform, ComposeEx as Compose
 from monai_ex.utils import ensure_list
-from strix.data_io.base_dataset.utils import get_input_data
+from strix.data_io.base_dataset.utils import get_input_data, get_cache_dataset_kwargs
 
 
 class BasicSegmentationDataset(object):
@@ -47,6 +47,7 @@ class BasicSegmentationDataset(object):
             self.transforms += ensure_list(spacer)
         if rescaler is not None:
             self.transforms += ensure_list(rescaler)
+        n_cached_stages = len(self.transforms)
         if resizer is not None:
             self.transforms += ensure_list(resizer)
         if cropper is not None:
@@ -59,6 +60,9 @@ class BasicSegmentationDataset(object):
         if to_tensor is not None:
             self.transforms += ensure_list(to_tensor)
 
+        self.dataset_kwargs = get_cache_dataset_kwargs(
+            self.dataset, self.dataset_kwargs, self.transforms, n_cached_stages
+        )
         self.transforms = Compose(self.transforms)
 
         return self.dataset(self.input_data, transform=self.transforms, **self.dataset_kwargs)
@@ -13,10 +13,17 @@ from numpy.lib.npyio import load
 from strix.data_io.base_dataset.classification_dataset import BasicClassificationDataset
 
 
+PAIRING_MODES = ("random", "in_batch")
+
+
 class SiameseDatasetWrapper(Dataset):
     """Siamese dataset wrapper.
     Wrap other dataset type such as ClassificationDataset to SiameseDataset.
 
+    Args:
+        pairing: 'random' draws the second sample of each pair from the dataset,
+            'in_batch' returns plain samples, paired within the batch by the in-batch
+            siamese losses (eg. `InBatchContrastiveLoss`) without loading more samples.
     """
     def __init__(
         self,
@@ -24,13 +31,16 @@ class SiameseDatasetWrapper(Dataset):
         label_key: Optional[KeysCollection] = CustomKeys.LABEL,
         same_ratio: Optional[float] = None,
         max_loop_count: Optional[int] = 10,
+        pairing: str = "random",
     ) -> None:
-        super().__init__()
+        super().__init__(data=dataset)
+        assert pairing in PAIRING_MODES, f"pairing must be in {PAIRING_MODES}, but got {pairing}"
         self.dataset = dataset
         self.label_key = label_key
         self.same_ratio = same_ratio
         self.max_loop_count = max_loop_count
-        if self.same_ratio is not None:
+        self.pairing = pairing
+        if self.same_ratio is not None and self.pairing == "random":
             warnings.warn('Set same ratio may cause inefficient training!')
 
     def __len__(self):
@@ -38,6 +48,8 @@ class SiameseDatasetWrapper(Dataset):
 
     def __getitem__(self, idx):
         data1 = self.dataset[idx]
+        if self.pairing == "in_batch":
+            return data1
         data2 = None
 
         if self.same_ratio is None:
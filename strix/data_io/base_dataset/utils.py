@@ -1,5 +1,81 @@
 import os
+import json
+import hashlib
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Sequence, Set, Union
+
+from monai_ex.data import PersistentDataset
 from strix.configures import config as cfg
+from strix.data_io.fingerprint import chain_hash_func, deterministic_prefix
+from strix.data_io.memmap_dataset import MemmapDataset
+
+
+# files verified to exist, shared by train/valid/test datasets and cross-validation folds
+_existing_files: Set[str] = set()
+
+
+def _check_paths(paths: Iterable[str], num_workers: int = 16) -> Set[str]:
+    """Check existence of files in a thread pool, stat calls on NFS are mostly waiting.
+    Return the paths which are NOT existed.
+    """
+    paths = {str(p) for p in paths} - _existing_files
+    if not paths:
+        return set()
+
+    with ThreadPoolExecutor(max_workers=min(num_workers, len(paths))) as executor:
+        results = dict(zip(paths, executor.map(os.path.exists, paths)))
+
+    _existing_files.update(p for p, exists in results.items() if exists)
+    return {p for p, exists in results.items() if not exists}
+
+
+def _get_check_paths(files_list: Sequence, image_key: str) -> List[str]:
+    paths = []
+    for f in files_list:
+        if isinstance(f, (str, os.PathLike)):
+            paths.append(f)
+        elif isinstance(f, (list, tuple)):
+            paths += [p for p in f[:2] if isinstance(p, (str, os.PathLike))]
+        elif isinstance(f, dict) and isinstance(f.get(image_key), (str, os.PathLike)):
+            paths.append(f[image_key])
+    return paths
+
+
+def validate_datalist(datalist_path: Union[str, Path], files_list: Sequence, num_workers: int = 16) -> None:
+    """Check existence of all files in the datalist once, memoized by the datalist path and mtime
+    in Strix's `CACHE_DIR`. Later `get_input_data` calls of every phase and fold, as well as later
+    runs with the unchanged datalist, skip the filesystem walk.
+
+    Note: files removed after the memoization will not be detected until the datalist is modified.
+    """
+    datalist_path = Path(datalist_path).resolve()
+    cache_file = (
+        Path(cfg.get_strix_cfg("CACHE_DIR"))
+        / ".file_check"
+        / f"{hashlib.md5(str(datalist_path).encode('utf-8')).hexdigest()}.json"
+    )
+    mtime = datalist_path.stat().st_mtime_ns
+
+    if cache_file.is_file():
+        try:
+            with cache_file.open() as f:
+                cache = json.load(f)
+        except json.JSONDecodeError:
+            cache = {}
+        if cache.get("mtime") == mtime:
+            _existing_files.update(cache.get("existing", []))
+
+    paths = _get_check_paths(files_list, cfg.get_key("IMAGE"))
+    missing = _check_paths(paths, num_workers)
+    if missing:
+        return  # raise in get_input_data with detailed info
+
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    with cache_file.open("w") as f:
+        json.dump({"datalist": str(datalist_path), "mtime": mtime, "existing": sorted({str(p) for p in paths})}, f)
+
 
 def get_input_data(files_list, is_supervised, verbose, dataset_name=''):
     """
@@ -8,20 +84,28 @@ def get_input_data(files_list, is_supervised, verbose, dataset_name=''):
     if verbose:
         print('Custom keys:', cfg.get_keys_dict())
 
+    image_key, label_key = cfg.get_key("IMAGE"), cfg.get_key("LABEL")
+    custom_keys = set(cfg.get_keys_list())
+    missing = _check_paths(_get_check_paths(files_list, image_key))
+
+    def _check_exist(fpath, prefix="File"):
+        assert isinstance(fpath, (str, os.PathLike)), f"{prefix} path must be str, but got {type(fpath)}: {fpath}"
+        assert str(fpath) not in missing, f"{prefix} not exists: {fpath}"
+
     input_data = []
     for f in files_list:
         if is_supervised:
             if isinstance(f, (list, tuple)):  # Recognize f as ['image','label']
-                assert os.path.exists(f[0]), f"File not exists: {f[0]}"
-                assert os.path.exists(f[1]), f"File not exists: {f[1]}"
-                input_data.append({cfg.get_key("IMAGE"): f[0], cfg.get_key("LABEL"): f[1]})
+                _check_exist(f[0])
+                _check_exist(f[1])
+                input_data.append({image_key: f[0], label_key: f[1]})
             elif isinstance(f, dict):
-                assert cfg.get_key("IMAGE") in f, f"File {f} doesn't contain image keyword '{cfg.get_key('IMAGE')}'"
-                assert cfg.get_key("LABEL") in f, f"File {f} doesn't contain label keyword '{cfg.get_key('LABEL')}'"
-                assert os.path.exists(f[cfg.get_key("IMAGE")]), f"File not exists: {f[cfg.get_key('IMAGE')]}"
+                assert image_key in f, f"File {f} doesn't contain image keyword '{image_key}'"
+                assert label_key in f, f"File {f} doesn't contain label keyword '{label_key}'"
+                _check_exist(f[image_key])
 
                 input_data.append(  # filter the dict by keys defined in CustomKeys
-                    dict(filter(lambda k: k[0] in cfg.get_keys_list(), f.items()))
+                    {k: v for k, v in f.items() if k in custom_keys}
                 )
 
             else:
@@ -31,14 +115,14 @@ def get_input_data(files_list, is_supervised, verbose, dataset_name=''):
                 )
         else:
             if isinstance(f, str):
-                assert os.path.exists(f), f"Image file not exists: {f}"
-                input_data.append({cfg.get_key('IMAGE'): f})
+                _check_exist(f, "Image file")
+                input_data.append({image_key: f})
             elif isinstance(f, dict):
-                assert cfg.get_key('IMAGE') in f, f"File {f} doesn't contain image keyword '{cfg.get_key('IMAGE')}'"
-                assert os.path.exists(f[cfg.get_key('IMAGE')]), f"File not exists: {f[cfg.get_key('IMAGE')]}"
+                assert image_key in f, f"File {f} doesn't contain image keyword '{image_key}'"
+                _check_exist(f[image_key])
 
                 input_data.append(
-                    dict(filter(lambda k: k[0] in cfg.get_keys_list(), f.items()))
+                    {k: v for k, v in f.items() if k in custom_keys}
                 )
             else:
                 raise ValueError(
@@ -49,3 +133,25 @@ def get_input_data(files_list, is_supervised, verbose, dataset_name=''):
         print(f"Input data has {len(input_data)} items with keys: {list(input_data[0].keys())}")
 
     return input_data
+
+
+def get_cache_dataset_kwargs(
+    dataset_type: Callable, dataset_kwargs: Dict, transforms: Sequence[Callable], n_cached_stages: int
+) -> Dict:
+    """Key the persistent caches by the fingerprint of the transforms producing them.
+
+    `MemmapDataset` caches the first `n_cached_stages` transforms (loader -> rescaler),
+    so that changing the resizer, cropper or augmentations reuses the cached volumes.
+    `PersistentDataset` caches the transforms before the first random one,
+    so these transforms are hashed together with the data items.
+    """
+    if not inspect.isclass(dataset_type):
+        return dataset_kwargs
+
+    if issubclass(dataset_type, MemmapDataset):
+        return {"cache_n_trans": n_cached_stages, **dataset_kwargs}
+    if issubclass(dataset_type, PersistentDataset) and dataset_kwargs.get("hash_func") is None:
+        n_trans = dataset_kwargs.get("cache_n_trans")  # eg. CacheNTransDataset
+        cached_transforms = transforms[:n_trans] if n_trans is not None else deterministic_prefix(transforms)
+        return {**dataset_kwargs, "hash_func": chain_hash_func(cached_transforms)}
+    return dataset_kwargs
@@ -3,31 +3,32 @@ from typing import Mapping
 import sys
 import traceback
 
+import numpy as np
 import torch
 from torch.utils.data import DataLoader as _TorchDataLoader
 from torch.utils.data._utils.collate import default_collate
-from torch.utils.data.sampler import WeightedRandomSampler
-from strix.utilities.registry import DatasetRegistry
-from strix.utilities.enum import Phases
+from strix.data_io import (
+    CLASSIFICATION_DATASETS,
+    SEGMENTATION_DATASETS,
+    SELFLEARNING_DATASETS,
+    MULTITASK_DATASETS,
+    SIAMESE_DATASETS,
+    DATASET_MAPPING,
+)
+from strix.utilities.enum import Phases, ImbalanceSamplers, SampleWeightings
 from monai_ex.data import DataLoader
+from monai.data import DistributedSampler
 from monai_ex.utils.exceptions import DatasetException
 from strix.configures import config as cfg
-from strix.utilities.utils import trycatch
-import pandas as pd
+from strix.utilities.utils import trycatch, get_attr_
+from strix.utilities.distributed import is_distributed
+from strix.data_io.dataloader import build_dataloader
+from strix.data_io.samplers import (
+    ClassBalancedBatchSampler,
+    DistributedWeightedRandomSampler,
+    compute_sample_weights,
+)
 
-CLASSIFICATION_DATASETS = DatasetRegistry()
-SEGMENTATION_DATASETS = DatasetRegistry()
-SELFLEARNING_DATASETS = DatasetRegistry()
-MULTITASK_DATASETS = DatasetRegistry()
-SIAMESE_DATASETS = DatasetRegistry()
-
-DATASET_MAPPING = {
-    "segmentation": SEGMENTATION_DATASETS,
-    "classification": CLASSIFICATION_DATASETS,
-    "selflearning": SELFLEARNING_DATASETS,
-    "multitask": MULTITASK_DATASETS,
-    "siamese": SIAMESE_DATASETS,
-}
 
 
 def get_default_setting(phase, **kwargs):
@@ -37,18 +38,21 @@ def get_default_setting(phase, **kwargs):
         num_workers = kwargs.get("train_n_workers", 10)
         drop_last = kwargs.get("train_drop_last", True)
         pin_memory = kwargs.get("train_pin_memory", True)
+        persistent_workers = kwargs.get("train_persistent_workers", True)
     elif phase == Phases.VALID:
         shuffle = kwargs.get("valid_shuffle", True)
         batch_size = kwargs.get("valid_n_batch", 1)
-        num_workers = kwargs.get("valid_n_workers", min(batch_size//2, 1))
+        num_workers = kwargs.get("valid_n_workers", max(batch_size // 2, 1))
         drop_last = kwargs.get("valid_drop_last", False)
         pin_memory = kwargs.get("valid_pin_memory", True)
+        persistent_workers = kwargs.get("valid_persistent_workers", True)
     elif phase == Phases.TEST_IN or phase == Phases.TEST_EX:
         shuffle = kwargs.get("test_shuffle", False)
         batch_size = kwargs.get("test_n_batch", 1)
         num_workers = kwargs.get("test_n_workers", 1)
         drop_last = kwargs.get("test_drop_last", False)
         pin_memory = kwargs.get("test_pin_memory", True)
+        persistent_workers = kwargs.get("test_persistent_workers", False)
     else:
         raise ValueError(f"Phase must be in 'train,valid,test', but got {phase}")
 
@@ -58,53 +62,92 @@ def get_default_setting(phase, **kwargs):
         "drop_last": drop_last,
         "num_workers": num_workers,
         "pin_memory": pin_memory,
+        "persistent_workers": persistent_workers,
     }
 
 
+def get_imbalance_labels(files_list, label_key, multi_output_keys=None):
+    """Labels used for imbalanced sampling, labels of all tasks are gathered for multitask datasets."""
+    if multi_output_keys and all(key in files_list[0] for key in multi_output_keys):
+        return [np.concatenate([np.ravel(item[key]) for key in multi_output_keys]) for item in files_list]
+    return [item[label_key] for item in files_list]
+
+
+def set_siamese_pairing(dataset, args):
+    """Pair the samples of `SiameseDatasetWrapper` within the batches for the in-batch siamese
+    losses (eg. `BatchHardTripletLoss`), else draw the second sample of each pair randomly."""
+    from strix.data_io.base_dataset.siamese_dataset import SiameseDatasetWrapper
+    from strix.models.cnn.losses import is_in_batch_loss
+
+    if isinstance(dataset, _TorchDataLoader):
+        dataset = dataset.dataset
+    if isinstance(dataset, SiameseDatasetWrapper):
+        in_batch = is_in_batch_loss(args.framework, get_attr_(args, "criterion", None))
+        dataset.pairing = "in_batch" if in_batch else "random"
+
+
 @trycatch()
 def get_dataloader(args, files_list, phase):
     params = get_default_setting(
-        phase, train_n_batch=args.n_batch, valid_n_batch=args.n_batch_valid, train_n_workers=args.n_worker
-    )  #! How to customize?
+        phase,
+        train_n_batch=args.n_batch,
+        valid_n_batch=args.n_batch_valid,
+        train_n_workers=args.n_worker,
+        valid_n_workers=args.n_worker,
+    )
+    # customized by `DATALOADER` section of dataset config
+    dataset_info = DATASET_MAPPING[args.framework][args.tensor_dim][args.data_list]
+    phase_name = Phases.TEST_IN.value if Phases(phase) == Phases.TEST_EX else Phases(phase).value
+    loader_setting = dataset_info.get("DATALOADER", {}).get(phase_name)
     arguments = {"files_list": files_list, "phase": phase, "opts": vars(args)}
 
     try:
-        dataset_ = DATASET_MAPPING[args.framework][args.tensor_dim][args.data_list]["FN"](
+        dataset_ = dataset_info["FN"](
             **arguments
         )
     except Exception as e:
         msg = "".join(traceback.format_tb(sys.exc_info()[-1], limit=-1))
         raise DatasetException(f"Dataset {args.data_list} cannot be instantiated!\n{msg}") from e
 
+    set_siamese_pairing(dataset_, args)
+
     label_key = cfg.get_key("LABEL")
     if isinstance(dataset_, _TorchDataLoader):
         return dataset_
     elif (
-        phase == "train"
-        and args.imbalance_sample
+        Phases(phase) == Phases.TRAIN
+        and get_attr_(args, "imbalance_sample", False)
         and files_list[0].get(label_key) is not None
     ):
-        if isinstance(files_list[0][label_key], (list, tuple)):
-            raise NotImplementedError(
-                "Imbalanced dataset sampling cannot handle list&tuple label"
-            )
-
         print("Using imbalanced dataset sampling!")
-        params.update({"shuffle": False})
-        labels = [l[label_key] for l in files_list]
+        labels = get_imbalance_labels(files_list, label_key, dataset_info.get("M_OUT"))
+        sampler_type = get_attr_(args, "imbalance_sampler", ImbalanceSamplers.WEIGHTED.value)
+        seed = get_attr_(args, "seed", 0)
 
-        df = pd.DataFrame()
-        df["label"] = labels
-        df = df.sort_index()
+        if sampler_type == ImbalanceSamplers.BALANCED_BATCH.value:
+            batch_sampler = ClassBalancedBatchSampler(labels, batch_size=params.pop("batch_size"), seed=seed)
+            params.pop("shuffle")
+            params.pop("drop_last")
+            return build_dataloader(dataset_, loader_setting, batch_sampler=batch_sampler, **params)
 
-        label_to_count = df["label"].value_counts()
-        weights = 1.0 / label_to_count[df["label"]]
-        weights = torch.DoubleTensor(weights.to_list())
-
-        return DataLoader(
+        params.update({"shuffle": False})
+        weights = compute_sample_weights(
+            labels, get_attr_(args, "imbalance_weighting", SampleWeightings.JOINT.value)
+        )
+        return build_dataloader(
             dataset_,
-            sampler=WeightedRandomSampler(weights=weights, num_samples=len(dataset_)),
+            loader_setting,
+            sampler=DistributedWeightedRandomSampler(weights, num_samples=len(dataset_), seed=seed),
             **params,
         )
+    elif is_distributed() and Phases(phase) in (Phases.TRAIN, Phases.VALID):
+        # shard data across processes, valid data are not padded to keep metrics exact
+        sampler = DistributedSampler(
+            dataset_,
+            even_divisible=Phases(phase) == Phases.TRAIN,
+            shuffle=params.pop("shuffle"),
+            seed=get_attr_(args, "seed", 0),
+        )
+        return build_dataloader(dataset_, loader_setting, sampler=sampler, shuffle=False, **params)
     else:
-        return DataLoader(dataset_, **params)
+        return build_dataloader(dataset_, loader_setting, **params)
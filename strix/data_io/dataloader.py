@@ -0,0 +1,189 @@
+"""
+Settings of the `DATALOADER` section in dataset config, given per phase.
+
+Eg.
+    DATALOADER:
+        train:
+            num_workers: auto  # autotuned in the first epoch
+            prefetch_factor: 4
+            persistent_workers: true
+            pin_memory: true
+            seed: 42
+        valid:
+            num_workers: 8
+            persistent_workers: true
+"""
+import os
+import time
+import random
+import logging
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader as _TorchDataLoader
+from monai.data import worker_init_fn as monai_worker_init_fn
+from monai_ex.data import DataLoader
+
+DATALOADER_ARGS = (
+    "num_workers",
+    "prefetch_factor",
+    "persistent_workers",
+    "pin_memory",
+    "seed",
+    "auto_candidates",
+    "auto_probe_batches",
+)
+AUTO_WORKERS = "auto"
+
+
+def check_dataloader_setting(setting: Dict, phase: str) -> Dict:
+    for key in setting:
+        if key not in DATALOADER_ARGS:
+            raise ValueError(f"Unknown DATALOADER argument '{key}' in phase '{phase}', available: {DATALOADER_ARGS}")
+
+    num_workers = setting.get("num_workers", 0)
+    if num_workers != AUTO_WORKERS and not (isinstance(num_workers, int) and num_workers >= 0):
+        raise ValueError(f"num_workers must be a non-negative int or '{AUTO_WORKERS}', but got {num_workers}")
+    if setting.get("prefetch_factor", 2) < 1:
+        raise ValueError(f"prefetch_factor must be positive, but got {setting['prefetch_factor']}")
+    return dict(setting)
+
+
+def seed_worker_init_fn(worker_id: int) -> None:
+    """Seed python & numpy random states of the worker besides the transforms, derived from
+    the worker's torch seed, which is determined by the seeded `generator` of the dataloader.
+    """
+    seed = torch.initial_seed() % 2 ** 32
+    random.seed(seed)
+    np.random.seed(seed)
+    monai_worker_init_fn(worker_id)
+
+
+def _default_worker_candidates() -> Sequence[int]:
+    n_cpu = os.cpu_count() or 1
+    candidates = {n_cpu}
+    n = 2
+    while n < n_cpu:
+        candidates.add(n)
+        n *= 2
+    return sorted(candidates)[-4:]
+
+
+def _loader_kwargs(num_workers: int, prefetch_factor: int, persistent_workers: bool) -> Dict:
+    # torch refuses these arguments for single process loading
+    if num_workers == 0:
+        return {"num_workers": 0}
+    return {
+        "num_workers": num_workers,
+        "prefetch_factor": prefetch_factor,
+        "persistent_workers": persistent_workers,
+    }
+
+
+class AutoWorkersDataLoader(DataLoader):
+    """DataLoader which tunes `num_workers` in the first epoch.
+
+    The batches of the first epoch are split into chunks, each one is loaded with one of the
+    candidate worker counts while measuring batches per second. The fastest count is used
+    for the rest of the first epoch and locked in for the following epochs.
+
+    Args:
+        dataset: dataset from which to load the data.
+        candidates: worker counts to try. Defaults to powers of 2 up to the num of cpus.
+        probe_batches: num of batches loaded with each candidate.
+        prefetch_factor: num of batches loaded in advance by each worker.
+        persistent_workers: keep the workers alive between epochs after tuning.
+        kwargs: other arguments of `DataLoader`.
+    """
+
+    def __init__(
+        self,
+        dataset,
+        candidates: Optional[Sequence[int]] = None,
+        probe_batches: int = 10,
+        prefetch_factor: int = 2,
+        persistent_workers: bool = False,
+        **kwargs,
+    ) -> None:
+        self.candidates = sorted(set(candidates or _default_worker_candidates()))
+        self.probe_batches = max(probe_batches, 2)
+        self.tuned = False
+        super().__init__(
+            dataset,
+            **_loader_kwargs(max(self.candidates), prefetch_factor, persistent_workers),
+            **kwargs,
+        )
+        # probe loaders need it even if the tuned loader is single process
+        self._prefetch = prefetch_factor
+
+    def _probe_loader(self, batches: Sequence, num_workers: int) -> _TorchDataLoader:
+        return _TorchDataLoader(
+            self.dataset,
+            batch_sampler=batches,
+            collate_fn=self.collate_fn,
+            pin_memory=self.pin_memory,
+            worker_init_fn=self.worker_init_fn,
+            generator=self.generator,
+            **_loader_kwargs(num_workers, self._prefetch, False),
+        )
+
+    def _autotune_iter(self):
+        batches = list(self.batch_sampler)
+        rates, pos = {}, 0
+        for num_workers in self.candidates:
+            if len(batches) - pos < self.probe_batches:
+                break
+            chunk = batches[pos : pos + self.probe_batches]
+            pos += len(chunk)
+            start = None
+            for i, batch in enumerate(self._probe_loader(chunk, num_workers)):
+                if i == 0:  # exclude the startup of workers
+                    start = time.perf_counter()
+                yield batch
+            rates[num_workers] = (len(chunk) - 1) / max(time.perf_counter() - start, 1e-9)
+
+        if rates:
+            best = max(rates, key=rates.get)
+            logging.getLogger("strix").info(
+                "DataLoader workers autotune (batches/s): %s, use %d workers",
+                {k: round(v, 2) for k, v in rates.items()},
+                best,
+            )
+            self.num_workers = best
+            self._iterator = None
+            self.tuned = True
+
+        if pos < len(batches):
+            yield from self._probe_loader(batches[pos:], self.num_workers)
+
+    def __iter__(self):
+        if self.tuned or self.batch_sampler is None:
+            return super().__iter__()
+        return self._autotune_iter()
+
+
+def build_dataloader(dataset, setting: Optional[Dict] = None, **params) -> DataLoader:
+    """Create dataloader with the default `params` overridden by `DATALOADER` setting."""
+    params = {**params, **(setting or {})}
+    num_workers = params.pop("num_workers", 0)
+    prefetch_factor = params.pop("prefetch_factor", 2)
+    persistent_workers = params.pop("persistent_workers", False)
+    candidates = params.pop("auto_candidates", None)
+    probe_batches = params.pop("auto_probe_batches", 10)
+
+    seed = params.pop("seed", None)
+    if seed is not None:
+        params["generator"] = torch.Generator().manual_seed(int(seed))
+        params["worker_init_fn"] = seed_worker_init_fn
+
+    if num_workers == AUTO_WORKERS:
+        return AutoWorkersDataLoader(
+            dataset,
+            candidates=candidates,
+            probe_batches=probe_batches,
+            prefetch_factor=prefetch_factor,
+            persistent_workers=persistent_workers,
+            **params,
+        )
+    return DataLoader(dataset, **_loader_kwargs(num_workers, prefetch_factor, persistent_workers), **params)
@@ -0,0 +1,389 @@
+"""
+Batched on-device augmentations.
+
+Augmentors configured with `on_device: true` in the `AUGMENTATION` section of dataset config
+are applied on the whole batch after `prepare_batch` in the train engines, instead of per sample
+in the CPU dataloader workers, so their `phase` can only be `train`. Random parameters are drawn
+per sample, all spatial augmentors are merged into one sampling grid and applied with a single
+batched `grid_sample`.
+Each augmentor is only applied on the tensors of its `keys`, and unknown args raise `TypeError`.
+
+Eg.
+    AUGMENTATION:
+        RandAffineD:
+            args: {prob: 0.5, rotate_range: [0.2, 0.2, 0.2], scale_range: [0.1, 0.1, 0.1]}
+            on_device: true
+        RandGaussianNoiseD:
+            keys: image
+            args: {prob: 0.2, std: 0.05}
+            on_device: true
+"""
+import math
+from typing import Optional, Sequence, Tuple, Union
+
+import torch
+import torch.nn.functional as F
+from monai_ex.utils import ensure_tuple
+from strix.configures import config as cfg
+from strix.utilities.registry import Registry
+
+DEVICE_AUGMENTOR = Registry()
+
+
+def _rand_uniform(ranges: Sequence[float], batch_size: int, device: torch.device) -> torch.Tensor:
+    """Draw (batch_size, len(ranges)) values uniformly from [-r, r]."""
+    ranges = torch.as_tensor(ranges, dtype=torch.float32, device=device)
+    return (torch.rand(batch_size, len(ranges), device=device) * 2 - 1) * ranges
+
+
+def _ranges(value: Union[Sequence[float], float], n: int) -> Tuple[float, ...]:
+    """Scalar is repeated for all dims, missing dims of sequence are padded by 0, like monai."""
+    if isinstance(value, (int, float)):
+        return (float(value),) * n
+    value = tuple(value)[:n]
+    return value + (0.0,) * (n - len(value))
+
+
+def _rand_mask(prob: float, batch_size: int, device: torch.device) -> torch.Tensor:
+    return torch.rand(batch_size, device=device) < prob
+
+
+class BatchRandSpatial:
+    """Base class of batched spatial augmentors.
+
+    The grid of `grid_sample` is defined in normalized coords of `align_corners=True`,
+    with coords ordered as (x, y[, z]) -> (W, H[, D]), ie. reversed spatial dims.
+    """
+
+    def __init__(self, keys, prob: float = 0.1) -> None:
+        self.keys = ensure_tuple(keys)
+        self.prob = prob
+
+    def get_affine(self, batch_size: int, spatial_shape: Sequence[int], device: torch.device) -> Optional[torch.Tensor]:
+        """Homogeneous affine matrices (B, dim+1, dim+1) in normalized grid coords."""
+        return None
+
+    def get_displacement(
+        self, batch_size: int, spatial_shape: Sequence[int], device: torch.device
+    ) -> Optional[torch.Tensor]:
+        """Displacement fields (B, *spatial_shape, dim) in normalized grid coords."""
+        return None
+
+
+class BatchRandIntensity:
+    """Base class of batched intensity augmentors, which are only applied on the tensors of `keys`."""
+
+    def __init__(self, keys, prob: float = 0.1) -> None:
+        self.keys = ensure_tuple(keys)
+        self.prob = prob
+
+    def __call__(self, data: torch.Tensor) -> torch.Tensor:
+        mask = _rand_mask(self.prob, data.shape[0], data.device)
+        if not mask.any():
+            return data
+        view = (-1,) + (1,) * (data.dim() - 1)
+        return torch.where(mask.view(view), self.apply(data), data)
+
+    def apply(self, data: torch.Tensor) -> torch.Tensor:
+        raise NotImplementedError
+
+
+def _voxel_to_grid(spatial_shape: Sequence[int], device: torch.device) -> torch.Tensor:
+    """Scaling from voxel offsets to normalized grid coords, in grid order."""
+    sizes = torch.as_tensor(spatial_shape[::-1], dtype=torch.float32, device=device)
+    return 2.0 / (sizes - 1).clamp(min=1)
+
+
+@DEVICE_AUGMENTOR.register("RandAffineD")
+class BatchRandAffine(BatchRandSpatial):
+    """Batched version of `RandAffineD`. Ranges are given in spatial dim order, like monai.
+
+    Args:
+        rotate_range: angle range in radians, one value for 2D, three values for 3D.
+        shear_range: shear range for each spatial dim.
+        translate_range: translate range in voxels for each spatial dim.
+        scale_range: scaling range for each spatial dim, the scale factor is `1 + s`.
+    """
+
+    def __init__(
+        self,
+        keys,
+        prob: float = 0.1,
+        rotate_range: Optional[Union[Sequence[float], float]] = None,
+        shear_range: Optional[Union[Sequence[float], float]] = None,
+        translate_range: Optional[Union[Sequence[float], float]] = None,
+        scale_range: Optional[Union[Sequence[float], float]] = None,
+    ) -> None:
+        super().__init__(keys, prob)
+        self.rotate_range = rotate_range
+        self.shear_range = shear_range
+        self.translate_range = translate_range
+        self.scale_range = scale_range
+
+    @staticmethod
+    def _rotation(angles: torch.Tensor, dim: int) -> torch.Tensor:
+        cos, sin = torch.cos(angles), torch.sin(angles)
+        one, zero = torch.ones_like(cos[:, 0]), torch.zeros_like(cos[:, 0])
+        if dim == 2:
+            c, s = cos[:, 0], sin[:, 0]
+            return torch.stack([c, -s, s, c], dim=1).view(-1, 2, 2)
+
+        rot = torch.eye(3, device=angles.device).repeat(angles.shape[0], 1, 1)
+        for i, (a, b) in enumerate([(1, 2), (0, 2), (0, 1)]):
+            c, s = cos[:, i], sin[:, i]
+            r = torch.stack([one, zero, zero, zero, one, zero, zero, zero, one], dim=1).view(-1, 3, 3)
+            r[:, a, a], r[:, a, b], r[:, b, a], r[:, b, b] = c, -s, s, c
+            rot = rot @ r
+        return rot
+
+    def get_affine(self, batch_size, spatial_shape, device):
+        dim = len(spatial_shape)
+        mask = _rand_mask(self.prob, batch_size, device)
+        # affine in voxel coords, spatial dim order
+        linear = torch.eye(dim, device=device).repeat(batch_size, 1, 1)
+        if self.rotate_range is not None:
+            n_angles = 1 if dim == 2 else 3
+            angles = _rand_uniform(_ranges(self.rotate_range, n_angles), batch_size, device)
+            linear = linear @ self._rotation(angles, dim)
+        if self.shear_range is not None:
+            shear = torch.eye(dim, device=device).repeat(batch_size, 1, 1)
+            values = _rand_uniform(_ranges(self.shear_range, dim), batch_size, device)
+            for i in range(dim):
+                shear[:, i, (i + 1) % dim] = values[:, i]
+            linear = linear @ shear
+        if self.scale_range is not None:
+            scales = 1 + _rand_uniform(_ranges(self.scale_range, dim), batch_size, device)
+            linear = linear @ torch.diag_embed(scales)
+
+        translate = torch.zeros(batch_size, dim, device=device)
+        if self.translate_range is not None:
+            translate = _rand_uniform(_ranges(self.translate_range, dim), batch_size, device)
+
+        # reverse to grid order, then convert voxel coords to normalized coords: S^-1 A S
+        linear, translate = linear.flip(1, 2), translate.flip(1)
+        scale = _voxel_to_grid(spatial_shape, device)
+        linear = linear * scale.view(1, -1, 1) / scale.view(1, 1, -1)
+        translate = translate * scale
+
+        affine = torch.eye(dim + 1, device=device).repeat(batch_size, 1, 1)
+        affine[:, :dim, :dim] = linear
+        affine[:, :dim, dim] = translate
+        affine[~mask] = torch.eye(dim + 1, device=device)
+        return affine
+
+
+@DEVICE_AUGMENTOR.register("RandFlipD")
+class BatchRandFlip(BatchRandSpatial):
+    """Batched version of `RandFlipD`, merged into the sampling grid as an affine."""
+
+    def __init__(self, keys, prob: float = 0.1, spatial_axis: Optional[Union[Sequence[int], int]] = None) -> None:
+        super().__init__(keys, prob)
+        self.spatial_axis = spatial_axis
+
+    def get_affine(self, batch_size, spatial_shape, device):
+        dim = len(spatial_shape)
+        axes = range(dim) if self.spatial_axis is None else ensure_tuple(self.spatial_axis)
+        signs = torch.ones(batch_size, dim, device=device)
+        mask = _rand_mask(self.prob, batch_size, device)
+        for axis in axes:
+            signs[mask, dim - 1 - axis] = -1  # grid order
+
+        affine = torch.eye(dim + 1, device=device).repeat(batch_size, 1, 1)
+        affine[:, :dim, :dim] = torch.diag_embed(signs)
+        return affine
+
+
+def _gaussian_smooth(data: torch.Tensor, sigma: torch.Tensor) -> torch.Tensor:
+    """Separable gaussian smoothing of (B, C, *spatial) tensor, with `sigma` (B,) of each sample.
+    Samples and channels are smoothed as groups of one conv, the kernels are sized by the largest sigma.
+    """
+    radius = max(int(math.ceil(3 * float(sigma.max()))), 1)
+    x = torch.arange(-radius, radius + 1, dtype=data.dtype, device=data.device)
+    kernel = torch.exp(-(x ** 2) / (2 * sigma.to(data.dtype).view(-1, 1) ** 2))
+    kernel = kernel / kernel.sum(1, keepdim=True)
+
+    batch_size, channels, *spatial_shape = data.shape
+    dim = len(spatial_shape)
+    conv = [F.conv1d, F.conv2d, F.conv3d][dim - 1]
+    groups = batch_size * channels
+    kernel = kernel.repeat_interleave(channels, dim=0)
+    data = data.reshape(1, groups, *spatial_shape)
+    for axis in range(dim):
+        shape = [1] * dim
+        shape[axis] = kernel.shape[1]
+        padding = [0] * dim
+        padding[axis] = radius
+        data = conv(data, kernel.view(groups, 1, *shape), padding=padding, groups=groups)
+    return data.reshape(batch_size, channels, *spatial_shape)
+
+
+@DEVICE_AUGMENTOR.register("Rand3DElasticD")
+class BatchRandElastic(BatchRandSpatial):
+    """Batched elastic deformation. Uniform random offsets are smoothed by a gaussian filter
+    with `sigma` and scaled by `magnitude` (in voxels), like monai's `Rand3DElasticD`.
+    The displacements are added to the merged sampling grid in output space.
+    Not registered as `Rand2DElasticD`, whose `spacing` and `magnitude_range` have other meanings.
+    """
+
+    def __init__(
+        self,
+        keys,
+        sigma_range: Tuple[float, float] = (5.0, 7.0),
+        magnitude_range: Tuple[float, float] = (50.0, 150.0),
+        prob: float = 0.1,
+    ) -> None:
+        super().__init__(keys, prob)
+        self.sigma_range = sigma_range
+        self.magnitude_range = magnitude_range
+
+    def get_displacement(self, batch_size, spatial_shape, device):
+        dim = len(spatial_shape)
+        mask = _rand_mask(self.prob, batch_size, device)
+        if not mask.any():
+            return None
+
+        sigma = torch.empty(batch_size, device=device).uniform_(*self.sigma_range)
+        magnitude = torch.empty(batch_size, device=device).uniform_(*self.magnitude_range) * mask
+        offsets = torch.rand(batch_size, dim, *spatial_shape, device=device) * 2 - 1
+        offsets = _gaussian_smooth(offsets, sigma) * magnitude.view(-1, *([1] * (dim + 1)))
+
+        # (B, dim, *spatial) in spatial dim order -> (B, *spatial, dim) in grid order
+        offsets = offsets.flip(1).movedim(1, -1)
+        return offsets * _voxel_to_grid(spatial_shape, device)
+
+
+@DEVICE_AUGMENTOR.register("RandGaussianNoiseD")
+class BatchRandGaussianNoise(BatchRandIntensity):
+    def __init__(self, keys, prob: float = 0.1, mean: float = 0.0, std: float = 0.1) -> None:
+        super().__init__(keys, prob)
+        self.mean = mean
+        self.std = std
+
+    def apply(self, data):
+        std = torch.rand(data.shape[0], device=data.device) * self.std
+        return data + torch.randn_like(data) * std.view((-1,) + (1,) * (data.dim() - 1)) + self.mean
+
+
+@DEVICE_AUGMENTOR.register("RandScaleIntensityD")
+class BatchRandScaleIntensity(BatchRandIntensity):
+    def __init__(self, keys, factors: Union[Tuple[float, float], float], prob: float = 0.1) -> None:
+        super().__init__(keys, prob)
+        if isinstance(factors, (int, float)):
+            factors = (min(-factors, factors), max(-factors, factors))
+        self.factors = factors
+
+    def apply(self, data):
+        factors = torch.empty(data.shape[0], device=data.device).uniform_(*self.factors)
+        return data * (1 + factors.view((-1,) + (1,) * (data.dim() - 1)))
+
+
+@DEVICE_AUGMENTOR.register("RandShiftIntensityD")
+class BatchRandShiftIntensity(BatchRandIntensity):
+    def __init__(self, keys, offsets: Union[Tuple[float, float], float], prob: float = 0.1) -> None:
+        super().__init__(keys, prob)
+        if isinstance(offsets, (int, float)):
+            offsets = (min(-offsets, offsets), max(-offsets, offsets))
+        self.offsets = offsets
+
+    def apply(self, data):
+        offsets = torch.empty(data.shape[0], device=data.device).uniform_(*self.offsets)
+        return data + offsets.view((-1,) + (1,) * (data.dim() - 1))
+
+
+@DEVICE_AUGMENTOR.register("RandAdjustContrastD")
+class BatchRandAdjustContrast(BatchRandIntensity):
+    def __init__(self, keys, prob: float = 0.1, gamma: Union[Tuple[float, float], float] = (0.5, 4.5)) -> None:
+        super().__init__(keys, prob)
+        self.gamma = (0.5, gamma) if isinstance(gamma, (int, float)) else gamma
+
+    def apply(self, data):
+        view = (-1,) + (1,) * (data.dim() - 1)
+        gamma = torch.empty(data.shape[0], device=data.device).uniform_(*self.gamma).view(view)
+        flat = data.flatten(1)
+        img_min, img_max = flat.min(1)[0].view(view), flat.max(1)[0].view(view)
+        img_range = (img_max - img_min).clamp(min=1e-7)
+        return ((data - img_min) / img_range) ** gamma * img_range + img_min
+
+
+class BatchAugmentor:
+    """Apply on-device augmentors on a prepared batch.
+
+    All spatial augmentors are merged into one sampling grid: affines are composed exactly
+    and elastic displacements are added in output space. Network inputs are resampled
+    with `mode`, the spatial targets (eg. segmentation labels) with `nearest`.
+    A tensor is resampled if its key is in the keys of any spatial augmentor, and changed by
+    the intensity augmentors which keys contain it.
+    """
+
+    def __init__(
+        self,
+        augmentors: Sequence[Union[BatchRandSpatial, BatchRandIntensity]],
+        mode: str = "bilinear",
+        padding_mode: str = "zeros",
+    ) -> None:
+        self.spatial = [aug for aug in augmentors if isinstance(aug, BatchRandSpatial)]
+        self.intensity = [aug for aug in augmentors if isinstance(aug, BatchRandIntensity)]
+        self.mode = mode
+        self.padding_mode = padding_mode
+        self.image_key = cfg.get_key("IMAGE")
+        self.label_key = cfg.get_key("LABEL")
+
+    def _get_grid(self, batch_size, spatial_shape, device) -> Optional[torch.Tensor]:
+        dim = len(spatial_shape)
+        affine, displacement = None, None
+        for aug in self.spatial:
+            a = aug.get_affine(batch_size, spatial_shape, device)
+            if a is not None:
+                affine = a if affine is None else affine @ a
+            d = aug.get_displacement(batch_size, spatial_shape, device)
+            if d is not None:
+                displacement = d if displacement is None else displacement + d
+
+        if affine is None and displacement is None:
+            return None
+        if affine is None:
+            affine = torch.eye(dim + 1, device=device).repeat(batch_size, 1, 1)
+
+        grid = F.affine_grid(affine[:, :dim], [batch_size, 1, *spatial_shape], align_corners=True)
+        return grid + displacement if displacement is not None else grid
+
+    def _resample(self, data: torch.Tensor, grid: torch.Tensor, mode: str) -> torch.Tensor:
+        dtype = data.dtype
+        output = F.grid_sample(
+            data.float(), grid.to(data.device), mode=mode, padding_mode=self.padding_mode, align_corners=True
+        )
+        return output.to(dtype)
+
+    @torch.no_grad()
+    def __call__(self, inputs, targets, input_keys=None, target_keys=None):
+        """Augment the prepared `inputs` and `targets`, which are tensors or tuples of tensors.
+
+        Args:
+            input_keys: keys of inputs, the image key by default.
+            target_keys: keys of targets, the label key by default.
+        """
+        multi_input = isinstance(inputs, (list, tuple))
+        first_input = inputs[0] if multi_input else inputs
+        batch_size, spatial_shape = first_input.shape[0], first_input.shape[2:]
+        grid = self._get_grid(batch_size, spatial_shape, first_input.device) if self.spatial else None
+
+        def _augment(x, key, mode):
+            if not isinstance(x, torch.Tensor) or x.dim() != first_input.dim() or x.shape[2:] != spatial_shape:
+                return x  # eg. classification targets
+            if grid is not None and any(key in aug.keys for aug in self.spatial):
+                x = self._resample(x, grid, mode)
+            for aug in self.intensity:
+                if key in aug.keys:
+                    x = aug(x)
+            return x
+
+        def _apply(data, keys, default_key, mode):
+            if isinstance(data, (list, tuple)):
+                keys = ensure_tuple(keys) if keys is not None else (default_key,) * len(data)
+                return tuple(_augment(x, key, mode) for x, key in zip(data, keys))
+            return _augment(data, default_key if keys is None else keys, mode)
+
+        inputs = _apply(inputs, input_keys, self.image_key, self.mode)
+        if targets is not None:
+            targets = _apply(targets, target_keys, self.label_key, "nearest")
+        return inputs, targets
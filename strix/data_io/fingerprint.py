@@ -0,0 +1,132 @@
+"""
+Content hash of transform chains, used as the key of persistent caches.
+
+The fingerprint of a chain is computed stage by stage:
+    h_0 = hash(data item, mtime & size of its input files)
+    h_i = hash(h_(i-1), class & arguments of transform i)
+so changing one stage (eg. spacer) only changes the keys of the stages depending on it,
+while changing the stages after the cached prefix (eg. cropper, augmentations) keeps the keys.
+"""
+import os
+import hashlib
+import inspect
+from enum import Enum
+from pathlib import PurePath
+from functools import partial
+from typing import Any, Callable, List, Mapping, Sequence
+
+import numpy as np
+import torch
+from monai_ex.transforms import Randomizable, Transform
+
+# runtime states of transforms which should not affect the results
+_IGNORED_ATTRS = ("R", "training")
+_MAX_DEPTH = 8
+
+
+def _md5(content: str) -> str:
+    return hashlib.md5(content.encode("utf-8")).hexdigest()
+
+
+def _qualname(obj: Any) -> str:
+    return f"{getattr(obj, '__module__', '')}.{getattr(obj, '__qualname__', type(obj).__name__)}"
+
+
+def _stable_repr(obj: Any, depth: int = 0) -> str:
+    """Deterministic string representation of transform arguments.
+    Default `repr` of objects contains memory address, which differs between runs.
+    """
+    if depth > _MAX_DEPTH:
+        return type(obj).__name__
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        return repr(obj)
+    if isinstance(obj, Enum):
+        return f"{type(obj).__name__}.{obj.name}"
+    if isinstance(obj, (PurePath, np.dtype, torch.dtype, torch.device)):
+        return str(obj)
+    if isinstance(obj, np.generic):
+        return repr(obj.item())
+    if isinstance(obj, (np.ndarray, torch.Tensor)):
+        array = obj.detach().cpu().numpy() if isinstance(obj, torch.Tensor) else obj
+        array = np.ascontiguousarray(array)
+        return f"array({array.dtype},{array.shape},{hashlib.md5(array.tobytes()).hexdigest()})"
+    if isinstance(obj, Mapping):
+        items = sorted((str(k), _stable_repr(v, depth + 1)) for k, v in obj.items())
+        return "{" + ",".join(f"{k}:{v}" for k, v in items) + "}"
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        values = [_stable_repr(v, depth + 1) for v in obj]
+        if isinstance(obj, (set, frozenset)):
+            values = sorted(values)
+        return "[" + ",".join(values) + "]"
+    if isinstance(obj, np.random.RandomState):
+        return "RandomState"
+    if inspect.isclass(obj) or inspect.isroutine(obj):
+        return _qualname(obj)
+    if hasattr(obj, "__dict__"):
+        attrs = {
+            k: v for k, v in vars(obj).items() if not k.startswith("_") and k not in _IGNORED_ATTRS
+        }
+        return _qualname(type(obj)) + _stable_repr(attrs, depth + 1)
+    return _qualname(type(obj))
+
+
+def hash_transform(transform: Callable) -> str:
+    """Fingerprint of a single transform: its class and its arguments."""
+    return _md5(_stable_repr(transform))
+
+
+def _file_stats(value: Any):
+    if isinstance(value, (str, PurePath)):
+        try:
+            stat = os.stat(value)
+        except (OSError, ValueError):
+            return str(value)
+        return (str(value), stat.st_mtime_ns, stat.st_size)
+    if isinstance(value, Mapping):
+        return {k: _file_stats(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_file_stats(v) for v in value]
+    return value
+
+
+def hash_data_item(item: Any) -> bytes:
+    """Fingerprint of a data item. File paths in it are hashed with their mtime & size,
+    so that the cache is invalidated when the input files are modified.
+    Returns bytes to be compatible with the `hash_func` of monai's datasets.
+    """
+    return _md5(_stable_repr(_file_stats(item))).encode("utf-8")
+
+
+def hash_transform_chain(
+    item: Any, transforms: Sequence[Callable], hash_func: Callable[[Any], bytes] = hash_data_item
+) -> List[str]:
+    """Cumulative fingerprints of each stage of the transform chain applied on `item`.
+
+    Returns:
+        List[str]: `len(transforms)+1` hashes, the i-th one identifies the result of first i transforms.
+    """
+    fingerprints = [hash_func(item).decode("utf-8")]
+    for transform in transforms:
+        fingerprints.append(_md5(fingerprints[-1] + hash_transform(transform)))
+    return fingerprints
+
+
+def _chain_hash(item: Any, transforms: Sequence[Callable]) -> bytes:
+    return hash_transform_chain(item, transforms)[-1].encode("utf-8")
+
+
+def chain_hash_func(transforms: Sequence[Callable]) -> Callable[[Any], bytes]:
+    """Get a `hash_func` for monai's `PersistentDataset` which keys the cached data
+    by both the data item and the given deterministic transforms.
+    """
+    return partial(_chain_hash, transforms=transforms)
+
+
+def deterministic_prefix(transforms: Sequence[Callable]) -> List[Callable]:
+    """Transforms before the first `Randomizable` one, which are cached by `PersistentDataset`."""
+    prefix = []
+    for transform in transforms:
+        if isinstance(transform, Randomizable) or not isinstance(transform, Transform):
+            break
+        prefix.append(transform)
+    return prefix
@@ -8,6 +8,10 @@ from monai_ex.utils import ensure_tuple, first
 import strix.utilities.oyaml as yaml
 from strix.utilities.enum import DIMS, FRAMEWORKS, PHASES
 from strix.data_io.dataio import DATASET_MAPPING
+from strix.data_io.memmap_dataset import MemmapDataset
+from strix.data_io.fingerprint import chain_hash_func, deterministic_prefix
+from strix.data_io.device_augmentation import DEVICE_AUGMENTOR, BatchAugmentor
+from strix.data_io.dataloader import check_dataloader_setting
 from utils_cw import get_items_from_file
 
 root_tree = {
@@ -32,6 +36,8 @@ root_tree = {
     "DATALOADER": {},
 }
 
+DATASETYPE.update({"MemmapDataset": MemmapDataset})
+
 mapping = {
     "LOADER": LOADER,
     "CHANNELER": CHANNELER,
@@ -117,8 +123,10 @@ def parse_dataset_config(configs):
 
     #! Augmentation
     augmentations = {"train": [], "valid": [], "test": []}
+    device_augmentations = []
     if configs.get("AUGMENTATION", None):
         for processor in configs["AUGMENTATION"]:
+            on_device = configs["AUGMENTATION"][processor].get("on_device", False)
             arguments = {
                 "keys": configs["AUGMENTATION"][processor].get("keys", default_keys)
             }
@@ -132,7 +140,23 @@ def parse_dataset_config(configs):
                 f"args must be dict, but got {args} ({type(args)})"
             arguments.update(args)
 
-            func = mapping["AUGMENTOR"][processor]
+            if on_device:
+                # batched augmentors applied in train engine after prepare_batch
+                if processor not in DEVICE_AUGMENTOR:
+                    print(
+                        f"Error: {processor} is not supported on device.\n"
+                        f"Available: {list(DEVICE_AUGMENTOR.keys())}"
+                    )
+                    sys.exit(1)
+                if set(phases) != {"train"}:
+                    print(
+                        f"Error: {processor} is on device, which only runs in train phase, "
+                        f"but got phase: {list(phases)}"
+                    )
+                    sys.exit(1)
+                func = DEVICE_AUGMENTOR[processor]
+            else:
+                func = mapping["AUGMENTOR"][processor]
 
             try:
                 fn = func(**arguments)
@@ -154,6 +178,9 @@ def parse_dataset_config(configs):
                 print(f"Error msg: {e}")
                 sys.exit(1)
             else:
+                if on_device:
+                    device_augmentations.append(fn)
+                    continue
                 for p in augmentations:
                     augmentations[p].append(fn)
 
@@ -179,11 +206,23 @@ def parse_dataset_config(configs):
 
     #! DataLoader
     if configs.get("DATALOADER", None):
-        raise NotImplementedError
+        dataloader = {}
+        for phase, setting in configs["DATALOADER"].items():
+            assert phase in ["train", "valid", "test"],\
+                f"Phase of DATALOADER must be in 'train,valid,test', but got {phase}"
+            assert isinstance(setting, dict),\
+                f"DATALOADER setting must be dict, but got {setting} ({type(setting)})"
+            try:
+                dataloader[phase] = check_dataloader_setting(setting, phase)
+            except ValueError as e:
+                print(f"Error msg: {e}")
+                sys.exit(1)
     else:
         dataloader = None
 
-    return datasets, dataloader, transforms
+    device_augmentor = BatchAugmentor(device_augmentations) if device_augmentations else None
+
+    return datasets, dataloader, transforms, device_augmentor
 
 
 def create_dataset_from_cfg(
@@ -202,7 +241,10 @@ def create_dataset_from_cfg(
             args_ = {"cache_rate": 0.0 if phase == "test" else opts.get("preload", 1)}
         elif tensor_dim == "3D":
             dataset_ = DATASETYPE["PersistentDataset"]
-            args_ = {"cache_dir": opts.get("cache_dir", "./")}
+            args_ = {
+                "cache_dir": opts.get("cache_dir", "./"),
+                "hash_func": chain_hash_func(deterministic_prefix(transforms[phase].transforms)),
+            }
         else:
             raise ValueError(
                 f"Invalid tensor dim '{tensor_dim}'"
@@ -217,10 +259,8 @@ def create_dataset_from_cfg(
     args = {"data": files_list, "transform": transforms[phase]}
     args.update(args_)
 
-    if dataloader is None:
-        return dataset_(**args)
-    else:
-        raise NotImplementedError
+    # dataloader settings are applied in `get_dataloader`
+    return dataset_(**args)
 
 
 def register_dataset_from_cfg(config_path):
@@ -228,26 +268,31 @@ def register_dataset_from_cfg(config_path):
     with config_path.open() as f:
         configs = yaml.full_load(f)
 
-    datasets_, dataloader_, transforms_ = parse_dataset_config(configs)
+    datasets_, dataloader_, transforms_, device_augmentor_ = parse_dataset_config(configs)
 
+    dataset_fn = partial(
+        create_dataset_from_cfg,
+        datasets=datasets_,
+        dataloader=dataloader_,
+        transforms=transforms_,
+    )
     DATASET_MAPPING[configs["ATTRIBUTE"]["FRAMEWORK"]].register(
         configs["ATTRIBUTE"]["DIM"],
         configs["ATTRIBUTE"]["NAME"],
         configs["ATTRIBUTE"]["FILES_LIST"],
-        partial(
-            create_dataset_from_cfg,
-            datasets=datasets_,
-            dataloader=dataloader_,
-            transforms=transforms_,
-        ),
+        module=dataset_fn,
     )
+    if device_augmentor_ is not None:
+        DATASET_MAPPING[configs["ATTRIBUTE"]["FRAMEWORK"]].device_augment(device_augmentor_)(dataset_fn)
+    if dataloader_ is not None:
+        DATASET_MAPPING[configs["ATTRIBUTE"]["FRAMEWORK"]].dataloader(**dataloader_)(dataset_fn)
 
 def test_dataset_from_config(config_path, phase, opts):
     assert config_path.is_file(), f"Config file is not found: {config_path}"
     with config_path.open() as f:
         configs = yaml.full_load(f)
 
-    datasets_, dataloader_, transforms_ = parse_dataset_config(configs)
+    datasets_, dataloader_, transforms_, _ = parse_dataset_config(configs)
     transforms_[phase].add_transforms(
         DataStatsD(
             keys=configs["ATTRIBUTE"]["KEYS"],
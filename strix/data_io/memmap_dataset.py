@@ -0,0 +1,236 @@
+import os
+import copy
+import pickle
+import tempfile
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+from typing import Callable, Dict, Mapping, Optional, Sequence, Union
+
+import numpy as np
+import torch
+from monai_ex.data import PersistentDataset
+from monai_ex.transforms import Compose, Randomizable, Transform, apply_transform
+from strix.configures import config as cfg
+from strix.data_io.fingerprint import hash_data_item, hash_transform_chain
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+
+@contextmanager
+def _file_lock(lock_path: Path):
+    """Exclusive inter-process lock, used to serialize the shard writers."""
+    with open(lock_path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class MemmapDataset(PersistentDataset):
+    """Persistent dataset which stores the deterministic prefix of the transform chain
+    (eg. loader -> channeler -> orienter -> spacer -> rescaler) in large sharded raw files.
+
+    Compared with `PersistentDataset`, which pickles one torch file per sample and unpickles
+    it every epoch, the array items of a sample are appended to a shard file and located by a
+    small index (`index.pkl`). Dataloader workers then `np.memmap` the shards and slice
+    the arrays out without any copy or unpickling. Non-array items (eg. meta dicts, labels)
+    are kept in the index.
+
+    The cache is built once in the main process when the dataset is created, only missing
+    samples are processed. Cache entries are keyed by the fingerprint of the data item
+    (incl. mtime & size of its files) and of the class & arguments of each cached transform,
+    so experiments can safely share the same `cache_dir`, and changing the transforms after
+    the cached prefix (eg. cropper, augmentations) reuses the cached volumes.
+
+    Cache dir layout::
+
+        cache_dir/
+            index.pkl
+            shard_00000.raw
+            shard_00001.raw
+            ...
+
+    Args:
+        data: input data to load and transform to generate dataset for model.
+        transform: transforms to execute operations on input data.
+        cache_dir: location of the sharded cache. Defaults to `CACHE_DIR/memmap_cache`.
+        cache_n_trans: cache the result of first N transforms. If None, cache the transforms
+            before the first `Randomizable` transform.
+        shard_size: max size of each shard file in bytes. Defaults to 2GB.
+        num_workers: num of threads used to compute the missing cache items.
+        hash_func: a callable to compute hash from data items to be cached,
+            defaults to `strix.data_io.fingerprint.hash_data_item`.
+    """
+
+    index_fname = "index.pkl"
+    shard_fname = "shard_{:05d}.raw"
+    alignment = 64
+
+    def __init__(
+        self,
+        data: Sequence,
+        transform: Union[Sequence[Callable], Callable],
+        cache_dir: Optional[Union[Path, str]] = None,
+        cache_n_trans: Optional[int] = None,
+        shard_size: int = 2 * 1024 ** 3,
+        num_workers: int = 0,
+        hash_func: Callable[..., bytes] = hash_data_item,
+    ) -> None:
+        if cache_dir is None:
+            cache_dir = Path(cfg.get_strix_cfg("CACHE_DIR")) / "memmap_cache"
+        super().__init__(data=data, transform=transform, cache_dir=cache_dir, hash_func=hash_func)
+        self.cache_n_trans = cache_n_trans
+        self.shard_size = shard_size
+        self.num_workers = num_workers
+        self._shards: Dict[str, np.memmap] = {}
+        self._build_cache(self.data)
+
+    def set_data(self, data: Sequence):
+        """Set the input data and cache the new items. Existing shards are kept."""
+        self.data = data
+        self._build_cache(self.data)
+
+    def _n_cached_transforms(self) -> int:
+        if self.cache_n_trans is not None:
+            return self.cache_n_trans
+
+        for i, _transform in enumerate(self.transform.transforms):
+            if isinstance(_transform, Randomizable) or not isinstance(_transform, Transform):
+                return i
+        return len(self.transform.transforms)
+
+    def _pre_transform(self, item_transformed):
+        if not isinstance(self.transform, Compose):
+            raise ValueError("transform must be an instance of monai.transforms.Compose.")
+
+        for _transform in self.transform.transforms[: self._n_cached_transforms()]:
+            item_transformed = apply_transform(_transform, item_transformed)
+        return item_transformed
+
+    def _post_transform(self, item_transformed):
+        if not isinstance(self.transform, Compose):
+            raise ValueError("transform must be an instance of monai.transforms.Compose.")
+
+        for _transform in self.transform.transforms[self._n_cached_transforms() :]:
+            item_transformed = apply_transform(_transform, item_transformed)
+        return item_transformed
+
+    def _read_index(self) -> Dict:
+        index_file = self.cache_dir / self.index_fname
+        if index_file.is_file():
+            with index_file.open("rb") as f:
+                return pickle.load(f)
+        return {"shards": [], "items": {}}
+
+    def _write_index(self, index: Dict) -> None:
+        # write to a temp file then rename, so that readers never see a partial index
+        fd, tmp_fname = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fname, self.cache_dir / self.index_fname)
+
+    def _hash_key(self, item) -> str:
+        cached_transforms = self.transform.transforms[: self._n_cached_transforms()]
+        return hash_transform_chain(item, cached_transforms, self.hash_func)[-1]
+
+    def _compute(self, item):
+        item_transformed = self._pre_transform(copy.deepcopy(item))
+        if not isinstance(item_transformed, Mapping):
+            raise TypeError(
+                f"{self.__class__.__name__} can only cache dict data, but got {type(item_transformed)}. "
+                "Please check the deterministic transforms."
+            )
+        return item_transformed
+
+    def _build_cache(self, data: Sequence) -> None:
+        with _file_lock(self.cache_dir / "index.lock"):
+            index = self._read_index()  # other process may have updated it
+            missing, seen = [], set()
+            self._keys = [self._hash_key(item) for item in data]
+            for key, item in zip(self._keys, data):
+                if key not in index["items"] and key not in seen:
+                    seen.add(key)
+                    missing.append((key, item))
+
+            if missing:
+                if self.num_workers > 0:
+                    with ThreadPool(self.num_workers) as p:
+                        results = p.imap(self._compute, [item for _, item in missing])
+                        for (key, _), item_transformed in zip(missing, results):
+                            index["items"][key] = self._append_item(index, item_transformed)
+                else:
+                    for key, item in missing:
+                        index["items"][key] = self._append_item(index, self._compute(item))
+                self._write_index(index)
+
+        self._index = index
+
+    def _append_item(self, index: Dict, item_transformed: Mapping) -> Dict:
+        record = {"arrays": {}, "others": {}}
+        for key, value in item_transformed.items():
+            is_tensor = isinstance(value, torch.Tensor)
+            if is_tensor:
+                value = value.detach().cpu().numpy()
+            if not isinstance(value, np.ndarray) or value.dtype == object:
+                record["others"][key] = value
+                continue
+
+            value = np.ascontiguousarray(value)
+            if not index["shards"] or index["shards"][-1]["size"] + value.nbytes > self.shard_size:
+                index["shards"].append({"name": self.shard_fname.format(len(index["shards"])), "size": 0})
+
+            shard = index["shards"][-1]
+            offset = shard["size"]
+            with (self.cache_dir / shard["name"]).open("ab") as f:
+                f.truncate(offset)  # drop the leftovers of an interrupted writer
+                f.write(value.tobytes())
+                padding = -f.tell() % self.alignment
+                f.write(b"\0" * padding)
+            shard["size"] = offset + value.nbytes + padding
+
+            record["arrays"][key] = {
+                "shard": shard["name"],
+                "offset": offset,
+                "shape": value.shape,
+                "dtype": value.dtype.str,
+                "tensor": is_tensor,
+            }
+        return record
+
+    def _get_shard(self, name: str) -> np.memmap:
+        if name not in self._shards:
+            # copy-on-write mapping, later transforms may modify arrays inplace
+            self._shards[name] = np.memmap(self.cache_dir / name, dtype=np.uint8, mode="c")
+        return self._shards[name]
+
+    def _load_item(self, record: Dict) -> Dict:
+        item = copy.deepcopy(record["others"])
+        for key, array in record["arrays"].items():
+            dtype = np.dtype(array["dtype"])
+            nbytes = int(np.prod(array["shape"], dtype=np.int64)) * dtype.itemsize
+            buffer = self._get_shard(array["shard"])[array["offset"] : array["offset"] + nbytes]
+            value = np.asarray(buffer.view(dtype).reshape(array["shape"]))
+            item[key] = torch.from_numpy(value) if array["tensor"] else value
+        return item
+
+    def _transform(self, index: int):
+        # keys are computed once when building, avoid stat-ing the files in every iteration
+        record = self._index["items"].get(self._keys[index])
+        if record is None:
+            pre_random_item = self._compute(self.data[index])
+        else:
+            pre_random_item = self._load_item(record)
+        return self._post_transform(pre_random_item)
+
+    def __getstate__(self):
+        # opened shards are not picklable across spawned workers, reopen them lazily
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        return state
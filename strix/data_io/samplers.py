@@ -0,0 +1,193 @@
+"""
+Samplers for imbalanced datasets.
+
+Labels are given per sample as a scalar (single label), or a fixed-length sequence
+(multi-label one-hot/multi-hot vector, or one label per task for multitask).
+Multi-column labels are weighted either jointly, ie. each label combination as a class,
+or per task, ie. the mean of the inverse class frequencies of each column.
+"""
+import math
+from functools import lru_cache
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+from torch.utils.data.sampler import Sampler
+from strix.utilities.enum import SampleWeightings
+from strix.utilities.distributed import get_dist_info
+
+
+def label_matrix(labels: Sequence) -> np.ndarray:
+    """Stack labels of samples to a (N, T) array, T is the num of label columns."""
+    matrix = np.asarray(labels)
+    if matrix.dtype == object:
+        raise ValueError("Labels of all samples must have the same length")
+    if matrix.ndim == 0 or len(matrix) == 0:
+        raise ValueError("Labels must be a non-empty sequence")
+    return matrix.reshape(len(matrix), -1)
+
+
+def _inverse_frequency(matrix: np.ndarray) -> np.ndarray:
+    _, inverse, counts = np.unique(matrix, axis=0, return_inverse=True, return_counts=True)
+    weights = 1.0 / counts[inverse.reshape(-1)]
+    return weights / weights.sum()
+
+
+@lru_cache(maxsize=32)
+def _cached_weights(buffer: bytes, shape: Tuple[int, ...], dtype: str, weighting: str) -> np.ndarray:
+    matrix = np.frombuffer(buffer, dtype=np.dtype(dtype)).reshape(shape)
+    if weighting == SampleWeightings.JOINT.value or shape[1] == 1:
+        weights = _inverse_frequency(matrix)
+    elif weighting == SampleWeightings.PER_TASK.value:
+        weights = np.mean([_inverse_frequency(matrix[:, [i]]) for i in range(shape[1])], axis=0)
+    else:
+        raise ValueError(f"Weighting must be in {[w.value for w in SampleWeightings]}, but got {weighting}")
+    weights.setflags(write=False)
+    return weights
+
+
+def compute_sample_weights(labels: Sequence, weighting: str = SampleWeightings.JOINT.value) -> np.ndarray:
+    """Inverse class frequency weight of each sample, normalized to sum to 1.
+
+    Results are cached by the content of labels, so re-running the same folds
+    doesn't recompute them.
+
+    Args:
+        labels: label of each sample, see module docstring.
+        weighting: 'joint' or 'per_task' weighting of multi-column labels.
+    """
+    matrix = np.ascontiguousarray(label_matrix(labels))
+    return _cached_weights(matrix.tobytes(), matrix.shape, matrix.dtype.str, weighting)
+
+
+def encode_classes(labels: Sequence, task: Optional[int] = None) -> np.ndarray:
+    """Class id of each sample, by label combination if `task` is None else by the `task`-th column."""
+    matrix = label_matrix(labels)
+    if task is not None:
+        matrix = matrix[:, [task]]
+    _, inverse = np.unique(matrix, axis=0, return_inverse=True)
+    return inverse.reshape(-1)
+
+
+class DistributedWeightedRandomSampler(Sampler):
+    """Epoch-aware `WeightedRandomSampler` sharded across distributed processes.
+
+    All processes draw the same `num_samples` indices with the seed of the epoch,
+    and each one takes its own part of them.
+
+    Args:
+        weights: weight of each sample.
+        num_samples: total num of samples drawn per epoch over all processes.
+        replacement: draw samples with replacement.
+        seed: random seed shared by all processes.
+        num_replicas: num of processes, defaults to the world size.
+        rank: rank of current process, defaults to the rank in the current group.
+    """
+
+    def __init__(
+        self,
+        weights: Sequence[float],
+        num_samples: Optional[int] = None,
+        replacement: bool = True,
+        seed: int = 0,
+        num_replicas: Optional[int] = None,
+        rank: Optional[int] = None,
+    ) -> None:
+        self.weights = torch.tensor(np.asarray(weights), dtype=torch.double)
+        self.num_replicas, self.rank = get_dist_info(num_replicas, rank)
+        total = len(self.weights) if num_samples is None else num_samples
+        self.num_samples = int(math.ceil(total / self.num_replicas))
+        self.total_size = self.num_samples * self.num_replicas
+        self.replacement = replacement
+        self.seed = seed
+        self.epoch = 0
+
+    def __iter__(self) -> Iterator[int]:
+        g = torch.Generator()
+        g.manual_seed(self.seed + self.epoch)
+        self.epoch += 1  # next epoch if `set_epoch` is not called
+        indices = torch.multinomial(self.weights, self.total_size, self.replacement, generator=g)
+        return iter(indices[self.rank : self.total_size : self.num_replicas].tolist())
+
+    def __len__(self) -> int:
+        return self.num_samples
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+
+class ClassBalancedBatchSampler(Sampler):
+    """Epoch-aware batch sampler which guarantees a class mix within each batch.
+
+    Each batch holds `batch_size // n_classes` samples of every class, the remaining slots
+    are given to randomly chosen classes. If `batch_size < n_classes`, each batch holds
+    `batch_size` distinct classes. Samples of each class are drawn without replacement
+    until the class is exhausted, then it's reshuffled.
+
+    Args:
+        labels: label of each sample, multi-column labels are balanced by their combinations
+            or by the `task`-th column.
+        batch_size: size of each batch.
+        num_batches: num of batches per epoch of each process.
+            Defaults to `ceil(len(labels) / batch_size / num_replicas)`.
+        task: column of multi-column labels used as classes.
+        seed: random seed shared by all processes.
+        num_replicas: num of processes, defaults to the world size.
+        rank: rank of current process, defaults to the rank in the current group.
+    """
+
+    def __init__(
+        self,
+        labels: Sequence,
+        batch_size: int,
+        num_batches: Optional[int] = None,
+        task: Optional[int] = None,
+        seed: int = 0,
+        num_replicas: Optional[int] = None,
+        rank: Optional[int] = None,
+    ) -> None:
+        classes = encode_classes(labels, task)
+        self.n_classes = int(classes.max()) + 1
+        order = np.argsort(classes, kind="stable")
+        self.class_indices = np.split(order, np.cumsum(np.bincount(classes))[:-1])
+        self.batch_size = batch_size
+        self.num_replicas, self.rank = get_dist_info(num_replicas, rank)
+        self.num_batches = num_batches or int(math.ceil(len(classes) / batch_size / self.num_replicas))
+        self.seed = seed
+        self.epoch = 0
+
+    def _class_stream(self, rng: np.random.Generator, c: int, n: int) -> np.ndarray:
+        indices = self.class_indices[c]
+        if n == 0:
+            return indices[:0]
+        n_perm = int(math.ceil(n / len(indices)))
+        return np.concatenate([rng.permutation(indices) for _ in range(n_perm)])[:n]
+
+    def __iter__(self) -> Iterator[List[int]]:
+        rng = np.random.default_rng(self.seed + self.epoch)
+        self.epoch += 1  # next epoch if `set_epoch` is not called
+        n_total = self.num_batches * self.num_replicas
+
+        # num of samples of each class in each batch
+        base, remainder = divmod(self.batch_size, self.n_classes)
+        counts = np.full((n_total, self.n_classes), base, dtype=np.int64)
+        if remainder:
+            extra = rng.permuted(np.tile(np.arange(self.n_classes), (n_total, 1)), axis=1)[:, :remainder]
+            np.add.at(counts, (np.arange(n_total)[:, None], extra), 1)
+
+        batch_ids, indices = [], []
+        for c in range(self.n_classes):
+            batch_ids.append(np.repeat(np.arange(n_total), counts[:, c]))
+            indices.append(self._class_stream(rng, c, int(counts[:, c].sum())))
+        batch_ids, indices = np.concatenate(batch_ids), np.concatenate(indices)
+
+        # group by batch, shuffle within batch
+        order = np.lexsort((rng.random(len(indices)), batch_ids))
+        batches = indices[order].reshape(n_total, self.batch_size)
+        return iter(batches[self.rank :: self.num_replicas].tolist())
+
+    def __len__(self) -> int:
+        return self.num_batches
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
@@ -24,7 +24,9 @@ if __name__ == "__main__":
 
     from strix.main_entry import train
     from strix.main_entry import train_cfg
+    from strix.main_entry import train_dist
     from strix.main_entry import test_cfg
+    from strix.main_entry import export
     from strix.main_entry import train_and_test
     from nni_search import nni_search
     from nni_search import train_nni
@@ -34,7 +36,9 @@ if __name__ == "__main__":
 
     main.add_command(train)
     main.add_command(train_cfg)
+    main.add_command(train_dist)
     main.add_command(test_cfg)
+    main.add_command(export)
     main.add_command(train_and_test)
     main.add_command(nni_search)
     main.add_command(train_nni)
@@ -9,17 +9,14 @@ import torch
 import numpy as np
 from pathlib import Path
 from functools import partial
-from torch.utils.tensorboard import SummaryWriter
 from types import SimpleNamespace as sn
 
-from strix.models import get_engine, get_test_engine
 from strix.data_io import DATASET_MAPPING
-from strix.data_io.dataio import get_dataloader
 from strix.configures import config as cfg
 from strix.utilities.enum import Phases
 from strix.utilities.click import OptionEx, CommandEx
 import strix.utilities.arguments as arguments
-from strix.utilities.utils import setup_logger, get_items
+from strix.utilities.utils import setup_logger, get_items, get_attr_
 from strix.utilities.click_callbacks import (
     get_unknown_options,
     get_exp_name,
@@ -31,7 +28,6 @@ from strix.utilities.click_callbacks import (
     dump_params
 )
 
-from sklearn.model_selection import train_test_split, KFold, ShuffleSplit
 from utils_cw import (
     Print,
     prompt_when,
@@ -43,9 +39,6 @@ from utils_cw import (
 )
 
 import click
-from ignite.engine import Events
-from monai_ex.handlers import SNIP_prune_handler
-from monai_ex.engines import SupervisedEvaluator, EnsembleEvaluator
 
 option = partial(click.option, cls=OptionEx)
 command = partial(click.command, cls=CommandEx)
@@ -58,21 +51,36 @@ def train_core(cargs, files_train, files_valid):
         files_train (list): Train file list.
         files_valid (list): Valid file list.
     """
+    from torch.utils.tensorboard import SummaryWriter
+    from ignite.engine import Events
+    from monai_ex.handlers import SNIP_prune_handler
+    from strix.models import get_engine
+    from strix.data_io.dataio import get_dataloader
+    from strix.utilities.distributed import init_distributed, is_distributed, is_main_process, launch
+
+    n_proc = get_attr_(cargs, "ddp_nproc", 0)
+    if n_proc > 1 and not is_distributed():  # spawn a process per device, each runs `train_core`
+        launch(train_core, n_proc, (cargs, files_train, files_valid), cargs.ddp_backend, cargs.ddp_port)
+        return
+    if not is_distributed() and int(os.environ.get("WORLD_SIZE", 1)) > 1:  # launched by torchrun
+        init_distributed(backend=get_attr_(cargs, "ddp_backend", None))
+
     logger = setup_logger(cargs.logger_name)
     logger.info(f"Get {len(files_train)} training data, {len(files_valid)} validation data")
 
     # Save param and datalist
-    with open(os.path.join(cargs.experiment_path, "train_files.yml"), "w") as f:
-        yaml.dump(files_train, f)
-    with open(os.path.join(cargs.experiment_path, "valid_files.yml"), "w") as f:
-        yaml.dump(files_valid, f)
+    if is_main_process():
+        with open(os.path.join(cargs.experiment_path, "train_files.yml"), "w") as f:
+            yaml.dump(files_train, f)
+        with open(os.path.join(cargs.experiment_path, "valid_files.yml"), "w") as f:
+            yaml.dump(files_valid, f)
 
     train_loader = get_dataloader(cargs, files_train, phase=Phases.TRAIN)
     valid_loader = get_dataloader(cargs, files_valid, phase=Phases.VALID)
 
-    # Tensorboard Logger
-    writer = SummaryWriter(log_dir=os.path.join(cargs.experiment_path, "tensorboard"))
-    if not cargs.debug and cargs.symbolic_tb:
+    # Tensorboard Logger, only written by rank 0 in distributed training
+    writer = SummaryWriter(log_dir=os.path.join(cargs.experiment_path, "tensorboard")) if is_main_process() else None
+    if writer is not None and not cargs.debug and cargs.symbolic_tb:
         tb_dir = check_dir(os.path.dirname(cargs.experiment_path), "tb")
         target_dir = os.path.join(tb_dir, os.path.basename(cargs.experiment_path))
         if os.path.islink(target_dir):
@@ -150,6 +158,9 @@ train_cmd_history = os.path.join(cfg.get_strix_cfg("cache_dir"), '.strix_train_c
 @click.pass_context
 def train(ctx, **args):
     """Entry of train command."""
+    from sklearn.model_selection import train_test_split, KFold, ShuffleSplit
+    from strix.data_io.base_dataset.utils import validate_datalist
+
     auxilary_params = get_unknown_options(ctx)
     args.update(auxilary_params)
     cargs = sn(**args)
@@ -185,6 +196,8 @@ def train(ctx, **args):
     if cargs.train_list and cargs.valid_list:
         files_train = get_items(cargs.train_list, format="auto")
         files_valid = get_items(cargs.valid_list, format="auto")
+        validate_datalist(cargs.train_list, files_train)
+        validate_datalist(cargs.valid_list, files_valid)
         train_core(cargs, files_train, files_valid)
         return cargs
 
@@ -202,6 +215,7 @@ def train(ctx, **args):
     else:
         assert os.path.isfile(data_list), f"Data list '{data_list}' not exists!"
         train_datalist = get_items(data_list, format="auto")
+        validate_datalist(data_list, train_datalist)
 
     if cargs.do_test and (test_file is None or not os.path.isfile(test_file)):
         logger.warn(
@@ -305,6 +319,33 @@ def train_cfg(**args):
     )
 
 
+@click.command("train-dist", context_settings={"allow_extra_args": True, "ignore_unknown_options": True})
+@option("--config", type=click.Path(exists=True))
+@option("--nproc", type=int, default=None, help="Num of processes, defaults to the num of GPUs")
+@option("--backend", type=click.Choice(["nccl", "gloo"]), default=None, help="Defaults to nccl for GPU, gloo for CPU")
+@option("--port", type=int, default=29500, help="Port of the master process")
+def train_dist(**args):
+    """Entry of train-dist command, distributed data parallel training from config file.
+    Each process loads `n_batch` samples per iteration.
+    """
+    configures = get_items(args["config"], format="json")
+
+    configures["smi"] = False
+    gpu_id = click.prompt(f"Current GPU id", default=configures["gpus"])
+    n_gpu = 0 if gpu_id == "-1" else len(str(gpu_id).split(","))
+    configures["gpus"] = gpu_id
+    configures["config"] = args["config"]
+    configures["ddp_nproc"] = args["nproc"] or n_gpu
+    configures["ddp_backend"] = args["backend"] or ("nccl" if n_gpu > 0 else "gloo")
+    configures["ddp_port"] = args["port"]
+    if configures["ddp_nproc"] < 2:
+        raise click.BadParameter(f"Distributed training needs at least 2 processes, got {configures['ddp_nproc']}")
+
+    train(
+        default_map=configures, prompt_in_default_map=False,
+    )
+
+
 @click.command("test-from-cfg", context_settings={"allow_extra_args": True, "ignore_unknown_options": True})
 @option("--config", type=click.Path(exists=True), default="YourConfigFle")
 @option("--test-files", type=str, default="", help="External files (json/yaml) for testing")
@@ -315,6 +356,26 @@ def train_cfg(**args):
     callback=input_cropsize,
     help="Use slidingwindow sampling",
 )
+@option("--sw-overlap", type=float, default=0.5, help="Overlap ratio of sliding windows")
+@option(
+    "--sw-mode", type=click.Choice(["constant", "gaussian"]), default="gaussian", help="Blending of sliding windows"
+)
+@option("--sw-batch-size", type=int, default=0, help="Num of windows in a batch, 0 to size it by GPU memory")
+@option("--sw-fg-threshold", type=float, default=None, help="Skip the windows without intensity above it")
+@option("--sw-coarse", is_flag=True, help="Skip the windows without foreground in a coarse low-res prediction")
+@option("--sw-margin", type=int, default=8, help="Margin (voxels) of foreground to keep windows")
+@option("--sw-cpu-output", is_flag=True, help="Accumulate the output of sliding windows on CPU")
+@option("--tta", type=click.Choice(["none", "flip", "rot90", "flip+rot90"]), default="none", help="Test-time augment")
+@option("--tta-batch", type=int, default=0, help="Max batch size of the TTA variants in one forward, 0 for all")
+@option("--save-workers", type=int, default=0, help="Num of processes writing the results, 0 to write synchronously")
+@option(
+    "--save-compress-level", type=click.IntRange(0, 9), default=1, help="Gzip level of results, 0 for uncompressed .nii"
+)
+@option("--cascade", is_flag=True, help="Coarse-to-fine inference in ROIs of low-res prediction, with slidingwindow")
+@option("--cascade-scale", type=float, default=0.25, help="Downsampling factor of the coarse pass")
+@option("--cascade-margin", type=int, default=16, help="Margin (voxels) of ROIs at full resolution")
+@option("--cascade-model", type=str, default=None, help="Checkpoint of low-res network for the coarse pass")
+@option("--cascade-archi", type=str, default=None, help="Registered name of the low-res network")
 @option("--with-label", is_flag=True, help="whether test data has label")
 @option("--save-image", is_flag=True, help="Save the tested image data")
 @option("--save-label", is_flag=True, help="Save the tested label data (image type)")
@@ -327,6 +388,13 @@ def train_cfg(**args):
     help="Target layer of saving latent code",
 )
 @option("--use-best-model", is_flag=True, help="Automatically select best model for testing")
+@option(
+    "--ensemble", type=click.Choice(["mean", "vote"]), default="mean", help="Ensemble mode of cross-validation models"
+)
+@option("--ensemble-group", type=int, default=0, help="Num of cross-validation models run in one forward, 0 for all")
+@option("--compile", type=click.Choice(["none", "script", "compile"]), default="none", help="Compile the network")
+@option("--precision", type=click.Choice(["fp32", "fp16", "bf16"]), default=None, help="fp16 if amp else fp32")
+@option("--memory-format", type=click.Choice(["contiguous", "channels_last"]), default="contiguous")
 @option("--smi", default=True, callback=print_smi, help="Print GPU usage")
 @option("--gpus", prompt="Choose GPUs[eg: 0]", type=str, help="The ID of active GPU")
 def test_cfg(**args):
@@ -336,6 +404,12 @@ def test_cfg(**args):
         ValueError: External test file (.json/.yaml) must be provided for cross-validation exp!
         ValueError: Test file not exist error.
     """
+    from monai_ex.engines import SupervisedEvaluator, EnsembleEvaluator
+    from strix.models import get_test_engine
+    from strix.models.cnn.layers.ensemble import StackedEnsemble
+    from strix.data_io.dataio import get_dataloader
+    from strix.data_io.base_dataset.utils import validate_datalist
+
     configures = get_items(args["config"], format="json")
 
     logger_name = f"{configures['tensor_dim']}-Tester"
@@ -365,6 +439,8 @@ def test_cfg(**args):
         else:
             raise ValueError(f"Test/Valid file does not exists in {exp_dir}!")
 
+    validate_datalist(test_fpath, test_files)
+
     if args["use_best_model"]: #! refactor this!
         model_list = arguments.get_best_trained_models(exp_dir)
         if is_crossvalid:
@@ -385,7 +461,23 @@ def test_cfg(**args):
     configures["experiment_path"] = exp_dir
     configures["resample"] = True  # ! departure
     configures["slidingwindow"] = args["slidingwindow"]
+    for key in ("sw_overlap", "sw_mode", "sw_batch_size", "sw_fg_threshold", "sw_coarse", "sw_margin", "sw_cpu_output"):
+        configures[key] = args[key]
+    configures["tta"] = args["tta"]
+    configures["tta_batch"] = args["tta_batch"]
+    configures["save_workers"] = args["save_workers"]
+    configures["save_compress_level"] = args["save_compress_level"]
+    for key in ("cascade", "cascade_scale", "cascade_margin", "cascade_model", "cascade_archi"):
+        configures[key] = args[key]
+    if args["cascade"] and not args["slidingwindow"]:
+        raise click.BadParameter("Cascade inference needs --slidingwindow for the full resolution ROIs")
     configures["save_latent"] = args["save_latent"]
+    configures["ensemble"] = args["ensemble"]
+    configures["ensemble_group"] = args["ensemble_group"]
+    configures["compile"] = args["compile"]
+    configures["memory_format"] = args["memory_format"]
+    if args["precision"]:
+        configures["precision"] = args["precision"]
     configures["target_layer"] = args["target_layer"]
     if args.get("crop_size", None):
         configures["crop_size"] = args["crop_size"]
@@ -401,10 +493,10 @@ def test_cfg(**args):
 
         engine = get_test_engine(sn(**configures), test_loader)
 
-        if isinstance(engine, SupervisedEvaluator):
-            logger.info(" ==== Begin testing ====")
-        elif isinstance(engine, EnsembleEvaluator):
+        if isinstance(engine, EnsembleEvaluator) or isinstance(engine.network, StackedEnsemble):
             logger.info(" ==== Begin ensemble testing ====")
+        elif isinstance(engine, SupervisedEvaluator):
+            logger.info(" ==== Begin testing ====")
 
         shutil.copyfile(test_fpath, check_dir(configures["out_dir"]) / os.path.basename(test_fpath))
         engine.run()
@@ -425,6 +517,53 @@ def test_cfg(**args):
             os.rename(configures["out_dir"], str(configures["out_dir"]) + "-" + postfix)
 
 
+@click.command("export")
+@option("--config", type=click.Path(exists=True), default="YourConfigFle")
+@option("--model-path", type=click.Path(exists=True), default=None, help="Checkpoint to export, defaults to the best")
+@option("--format", "fmt", type=click.Choice(["torchscript", "onnx"]), default="torchscript", help="Export format")
+@option("--out", type=str, default=None, help="Output path without suffix, defaults to the checkpoint path")
+@option(
+    "--input-size", type=str, default=None, help="Spatial size of example input, defaults to crop size. eg: 96,96,96"
+)
+@option("--opset", type=int, default=13, help="ONNX opset version")
+def export(**args):
+    """Entry of export command, export trained network to TorchScript/ONNX with its metadata."""
+    from ignite.handlers import Checkpoint
+    from strix.models import get_network
+    from strix.models.compile import export_network, get_export_metadata
+
+    configures = get_items(args["config"], format="json")
+    configures["pretrained"] = False
+    exp_dir = Path(configures.get("experiment_path", os.path.dirname(args["config"])))
+
+    model_path = args["model_path"]
+    if model_path is None:
+        best_models = arguments.get_best_trained_models(exp_dir)
+        if not best_models:
+            raise click.BadParameter(f"No trained model found in {exp_dir}, please specify --model-path")
+        model_path = best_models[0]
+
+    input_size = args["input_size"] or configures.get("crop_size")
+    if not input_size:
+        raise click.BadParameter("Size of example input is unknown, please specify --input-size")
+    if isinstance(input_size, str):
+        input_size = [int(s) for s in input_size.split(",")]
+    input_shape = [1, configures["input_nc"], *input_size]
+
+    net = get_network(sn(**configures))
+    Checkpoint.load_objects({"net": net}, torch.load(model_path, map_location="cpu"))
+
+    output_path = export_network(
+        net,
+        args["out"] or Path(model_path).with_suffix(""),
+        torch.rand(input_shape),
+        fmt=args["fmt"],
+        metadata=get_export_metadata(configures, input_shape, args["fmt"]),
+        opset_version=args["opset"],
+    )
+    Print(f"Exported {model_path} to {output_path}", color="g")
+
+
 @click.command(
     "train-and-test",
     context_settings={"allow_extra_args": True, "ignore_unknown_options": True},
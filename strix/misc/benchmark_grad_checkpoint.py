@@ -0,0 +1,95 @@
+"""
+Memory and throughput of training DynUNet with activation checkpointing (`--grad-checkpoint`)
+on the `SyntheticData` dataset.
+
+Each setting runs in its own process, the peak memory is `torch.cuda.max_memory_allocated`
+on GPU, else the peak resident memory of the process.
+
+Usage: python -m strix.misc.benchmark_grad_checkpoint --segments 0 1 2 4 --crop-size 96 --n-batch 2
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import torch
+
+
+def _get_batch(crop_size, n_batch, device):
+    from strix.data_io import SEGMENTATION_DATASETS
+    from strix.utilities.enum import Phases
+
+    dataset_fn = SEGMENTATION_DATASETS["3D"]["SyntheticData"]["FN"]
+    files_list = [{"image": f"{i}.nii", "label": f"{i}.1.nii"} for i in range(n_batch)]
+    dataset = dataset_fn(files_list, Phases.TRAIN, {"output_nc": 1, "tensor_dim": "3D"})
+    data = [dataset[i] for i in range(n_batch)]
+    image = torch.stack([d["image"] for d in data]).float()
+    label = torch.stack([d["label"] for d in data]).float()
+    # synthetic volumes are 64^3, tile them to the crop size
+    reps = [1, 1] + [-(-crop_size // s) for s in image.shape[2:]]
+    crop = (slice(None), slice(None)) + (slice(0, crop_size),) * 3
+    return image.repeat(reps)[crop].to(device), label.repeat(reps)[crop].to(device)
+
+
+def run(segments, crop_size, n_batch, n_iter, device):
+    from strix.models.cnn.nets.dynunet import DynUNet
+
+    device = torch.device(device)
+    net = DynUNet(
+        3, 1, 1, (3,) * 5, (1,) + (2,) * 4, (1,) + (2,) * 4, norm_name="batch", grad_checkpoint=segments
+    ).to(device)
+    optimizer = torch.optim.SGD(net.parameters(), lr=0.01)
+    image, label = _get_batch(crop_size, n_batch, device)
+
+    def _step():
+        optimizer.zero_grad()
+        loss = torch.nn.functional.binary_cross_entropy_with_logits(net(image), label)
+        loss.backward()
+        optimizer.step()
+
+    _step()  # warm up
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats(device)
+    start = time.perf_counter()
+    for _ in range(n_iter):
+        _step()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+        peak_mb = torch.cuda.max_memory_allocated(device) / 2**20
+    else:
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+    elapsed = time.perf_counter() - start
+    return {"segments": segments, "peak_mb": peak_mb, "samples_per_sec": n_iter * n_batch / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--crop-size", type=int, default=96)
+    parser.add_argument("--n-batch", type=int, default=2)
+    parser.add_argument("--n-iter", type=int, default=5)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run(args.segments[0], args.crop_size, args.n_batch, args.n_iter, args.device)
+        print(json.dumps(result))
+        return
+
+    print(f"DynUNet, crop {args.crop_size}^3, batch {args.n_batch}, {args.device}")
+    print(f"{'segments':>8} {'peak memory (MB)':>17} {'samples/s':>10}")
+    for segments in args.segments:
+        cmd = [sys.executable, "-m", __spec__.name, "--worker", "--segments", str(segments)]
+        cmd += ["--crop-size", str(args.crop_size), "--n-batch", str(args.n_batch)]
+        cmd += ["--n-iter", str(args.n_iter), "--device", args.device]
+        output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{segments:>8} {result['peak_mb']:>17.1f} {result['samples_per_sec']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
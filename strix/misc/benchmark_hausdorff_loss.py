@@ -0,0 +1,47 @@
+"""
+Time and accuracy of the distance transform engines of `HausdorffDTLoss`,
+the batched torch EDT vs. the per-sample SciPy EDT on CPU.
+
+Usage: python -m strix.misc.benchmark_hausdorff_loss --n-batch 4 --size 96 --dim 3
+"""
+import argparse
+
+import torch
+
+from strix.misc.benchmark_utils import timeit
+from strix.models.cnn.losses.hd_loss import HausdorffDTLoss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n-batch", type=int, default=4)
+    parser.add_argument("--size", type=int, default=96)
+    parser.add_argument("--dim", type=int, default=3)
+    parser.add_argument("--n-iter", type=int, default=5)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    shape = (args.n_batch, 1) + (args.size,) * args.dim
+    torch.manual_seed(0)
+    # smooth blobs as predictions, thresholded as targets
+    pred = torch.nn.functional.avg_pool3d if args.dim == 3 else torch.nn.functional.avg_pool2d
+    pred = pred(torch.rand(shape), kernel_size=7, stride=1, padding=3).to(device)
+    pred = (pred - pred.amin()) / (pred.amax() - pred.amin())
+    target = (pred > 0.55).float()
+    pred.requires_grad_(True)
+
+    losses = {engine: HausdorffDTLoss(dt_engine=engine) for engine in ("scipy", "torch")}
+    print(f"HausdorffDTLoss, input {shape}, {args.device}")
+    print(f"{'engine':>7} {'fwd+bwd (ms)':>13} {'loss':>12}")
+    for engine, loss_fn in losses.items():
+        elapsed = timeit(lambda: loss_fn(pred, target).backward(), args.n_iter, device, n_warmup=1)
+        print(f"{engine:>7} {elapsed:>13.1f} {loss_fn(pred, target).item():>12.6f}")
+
+    field = losses["torch"].torch_distance_field(target)
+    ref_field = torch.from_numpy(losses["scipy"].distance_field(target.cpu().numpy())).to(field)
+    print(f"max abs error of distance field: {(field - ref_field).abs().max().item():.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Forward and backward time of HESAM's `MultiChannelLinear`, vectorized vs. the former per-channel loop.
+
+Usage: python -m strix.misc.benchmark_multichannel_linear --n-batch 16 --n-channels 256 --sam-size 6 --dim 3
+"""
+import argparse
+
+import torch
+
+from strix.misc.benchmark_utils import timeit
+from strix.models.cnn.nets.hesam import MultiChannelLinear
+
+
+def _loop_forward(layer, x):
+    # per-channel implementation before vectorization
+    outputs = []
+    for i, x_i in enumerate(torch.unbind(x, dim=1)):
+        outputs.append(torch.add(torch.mm(x_i, layer.weights[i : i + 1].t()), layer.bias[i]))
+    return torch.stack(outputs, dim=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n-batch", type=int, default=16)
+    parser.add_argument("--n-channels", type=int, default=256)
+    parser.add_argument("--sam-size", type=int, default=6)
+    parser.add_argument("--dim", type=int, default=3)
+    parser.add_argument("--n-iter", type=int, default=200)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    layer = MultiChannelLinear(args.sam_size**args.dim, args.n_channels).to(device)
+    x = torch.rand(args.n_batch, args.n_channels, args.sam_size**args.dim, device=device, requires_grad=True)
+
+    print(f"MultiChannelLinear, input {tuple(x.shape)}, {args.device}")
+    print(f"{'impl':>10} {'forward (ms)':>13} {'fwd+bwd (ms)':>13}")
+    for name, forward in [("loop", lambda: _loop_forward(layer, x)), ("vectorized", lambda: layer(x))]:
+        with torch.no_grad():
+            fwd = timeit(forward, args.n_iter, device)
+        fwd_bwd = timeit(lambda: forward().sum().backward(), args.n_iter, device)
+        print(f"{name:>10} {fwd:>13.3f} {fwd_bwd:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Step time of the `RAdam` optimizer, the per-parameter loop vs. the foreach multi-tensor step,
+and `torch.optim.RAdam` for reference, on a stack of small conv blocks (many parameter tensors).
+
+Usage: python -m strix.misc.benchmark_radam --n-blocks 64 --channels 32
+"""
+import argparse
+
+import torch
+
+from strix.misc.benchmark_utils import conv_blocks, timeit
+from strix.models.cnn.layers.radam import RAdam
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n-blocks", type=int, default=64)
+    parser.add_argument("--channels", type=int, default=32)
+    parser.add_argument("--n-iter", type=int, default=50)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    torch.manual_seed(0)
+    net = conv_blocks(args.n_blocks, args.channels).to(device)
+    params = list(net.parameters())
+    grads = [torch.randn_like(p) for p in params]
+
+    optimizers = {
+        "loop": lambda: RAdam(params, 1e-3, weight_decay=1e-4, foreach=False),
+        "foreach": lambda: RAdam(params, 1e-3, weight_decay=1e-4, foreach=True),
+        "torch": lambda: torch.optim.RAdam(params, 1e-3, weight_decay=1e-4, foreach=False),
+        "torch-foreach": lambda: torch.optim.RAdam(params, 1e-3, weight_decay=1e-4, foreach=True),
+    }
+    print(f"RAdam, {len(params)} tensors, {sum(p.numel() for p in params)} params, {args.device}")
+    print(f"{'impl':>14} {'step (ms)':>10}")
+    for name, optim_fn in optimizers.items():
+        optim = optim_fn()
+
+        def _step():
+            for p, g in zip(params, grads):
+                p.grad = g.clone()
+            optim.step()
+
+        print(f"{name:>14} {timeit(_step, args.n_iter, device):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
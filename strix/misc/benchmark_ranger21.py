@@ -0,0 +1,47 @@
+"""
+Step time of the `Ranger21` optimizer, the per-parameter loop vs. the foreach multi-tensor step,
+on a stack of small conv blocks (many parameter tensors, as the segmentation nets).
+
+Usage: python -m strix.misc.benchmark_ranger21 --n-blocks 64 --channels 32
+"""
+import argparse
+import contextlib
+import io
+
+import torch
+
+from strix.misc.benchmark_utils import conv_blocks, timeit
+from strix.models.cnn.layers.ranger21 import Ranger21
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n-blocks", type=int, default=64)
+    parser.add_argument("--channels", type=int, default=32)
+    parser.add_argument("--n-iter", type=int, default=50)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    torch.manual_seed(0)
+    net = conv_blocks(args.n_blocks, args.channels).to(device)
+    params = list(net.parameters())
+    grads = [torch.randn_like(p) for p in params]
+
+    print(f"Ranger21, {len(params)} tensors, {sum(p.numel() for p in params)} params, {args.device}")
+    print(f"{'impl':>8} {'step (ms)':>10}")
+    for name, foreach in [("loop", False), ("foreach", True)]:
+        def _step():
+            for p, g in zip(params, grads):
+                p.grad = g.clone()
+            optim.step()
+
+        # the optimizer prints its settings and param size at the first step
+        with contextlib.redirect_stdout(io.StringIO()):
+            optim = Ranger21(params, 1e-3, num_batches_per_epoch=100, num_epochs=100, foreach=foreach)
+            _step()
+        print(f"{name:>8} {timeit(_step, args.n_iter, device):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Helpers shared by the benchmark scripts of strix/misc.
+"""
+import time
+
+import torch
+from torch import nn
+
+
+def conv_blocks(n_blocks: int, channels: int) -> nn.Module:
+    """Stack of small 3D conv blocks, many parameter tensors as the segmentation nets."""
+    blocks = [
+        nn.Sequential(nn.Conv3d(channels, channels, 3, padding=1), nn.InstanceNorm3d(channels, affine=True))
+        for _ in range(n_blocks)
+    ]
+    return nn.Sequential(*blocks)
+
+
+def timeit(fn, n_iter: int, device: torch.device, n_warmup: int = 3) -> float:
+    """Mean time of `fn` in ms, after `n_warmup` calls, synchronized on CUDA devices."""
+    for _ in range(n_warmup):
+        fn()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(n_iter):
+        fn()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / n_iter * 1000
@@ -1,5 +1,6 @@
+import math
 from pathlib import Path
-from utils_cw import check_dir
+from types import SimpleNamespace
 import torch
 from strix.utilities.registry import NetworkRegistry
 
@@ -17,24 +18,28 @@ ARCHI_MAPPING = {
     "siamese": SIAMESE_ARCHI,
 }
 
-from strix.models.cnn.utils import print_network, PolynomialLRDecay
-from strix.models.cnn.layers.radam import RAdam
-from strix.models.cnn.layers.ranger21 import Ranger21
-from strix.models.cnn.engines import TRAIN_ENGINES, TEST_ENGINES, ENSEMBLE_TEST_ENGINES
 from strix.data_io import DATASET_MAPPING
 from strix.utilities.utils import get_attr_
-from strix.models.cnn.losses import LOSS_MAPPING, ContrastiveLoss
-from strix.utilities.imports import import_file
 from strix.utilities.enum import Frameworks
+from strix.utilities.manifest import register_lazy_sources
 from strix.configures import config as cfg
-from strix.models.cnn.cnn_nets import *
-from strix.models.transformer.transformer_nets import *
-from monai_ex.utils import WorkflowException
 
+# builtin & external networks are imported on first access of their names
+_builtin_network_files = {
+    str(Path(__file__).parent.joinpath("cnn", "cnn_nets.py")): "strix.models.cnn.cnn_nets",
+    str(Path(__file__).parent.joinpath("transformer", "transformer_nets.py")): "strix.models.transformer.transformer_nets",
+}
 external_network_dir = Path(cfg.get_strix_cfg("EXTERNAL_NETWORK_DIR"))
+_network_files = list(map(Path, _builtin_network_files))
 if external_network_dir.is_dir():
-    for f in external_network_dir.glob("*.py"):
-        import_file(f.stem, str(f))
+    _network_files += list(external_network_dir.glob("*.py"))
+
+register_lazy_sources(
+    {name: registry for name, registry in globals().items() if name.endswith("_ARCHI")},
+    _network_files,
+    cache_name="networks",
+    module_names=_builtin_network_files,
+)
 
 
 def create_feature_maps(init_channel_number, number_of_fmaps):
@@ -42,6 +47,8 @@ def create_feature_maps(init_channel_number, number_of_fmaps):
 
 
 def get_loss_fn(framework: str, loss_name: str, loss_params: dict, output_nc: int, deep_supervision: bool = False):
+    from strix.models.cnn.losses import LOSS_MAPPING
+
     loss_type = LOSS_MAPPING[framework][loss_name]
 
     if output_nc == 1:
@@ -59,7 +66,7 @@ def get_loss_fn(framework: str, loss_name: str, loss_params: dict, output_nc: in
             "to_onehot_y": True,
         }
 
-    if "Dice" in loss_type.__name__:
+    if "Dice" in loss_type.__name__ or "Hausdorff" in loss_type.__name__:
         kwargs.update(loss_params)
         loss = loss_type(**kwargs)
     else:
@@ -96,12 +103,14 @@ def get_network(opts):
     n_group = options.pop("n_group", 1)  # used for multi-group archi
     pretrained_model_path = options.pop("pretrained_model_path", None)
 
-    siamese = None
+    from strix.models.cnn.losses import LOSS_MAPPING, ContrastiveLoss, is_in_batch_loss
+
     siamese_latent_dim = options.pop("latent_dim", 512)
     if ARCHI_MAPPING[opts.framework] == SIAMESE_ARCHI:
+        # embedding networks for the losses of embeddings, else embeddings & logits
         loss_type = LOSS_MAPPING[opts.framework][opts.criterion]
-        siamese = "single" if loss_type == ContrastiveLoss else "multi"
-        raise NotImplementedError
+        in_batch = is_in_batch_loss(opts.framework, opts.criterion)
+        options["siamese"] = "single" if in_batch or loss_type == ContrastiveLoss else "multi"
 
     try:
         model = ARCHI_MAPPING[opts.framework][opts.tensor_dim][opts.model_name]
@@ -140,6 +149,17 @@ def get_engine(opts, train_loader, test_loader, writer=None):
     Returns:
         list: Return engine, net, loss
     """
+    from utils_cw import check_dir
+    from monai_ex.utils import WorkflowException
+    from strix.models.cnn.utils import print_network, PolynomialLRDecay
+    from strix.models.cnn.layers.radam import RAdam
+    from strix.models.cnn.layers.ranger21 import Ranger21
+    from strix.models.cnn.losses import LOSS_MAPPING
+    from strix.models.cnn.engines import TRAIN_ENGINES
+    from strix.models.cnn.engines.utils import get_memory_format, get_accumulation_steps
+    from strix.utilities.distributed import is_distributed, is_main_process, get_local_rank
+    from strix.models.compile import compile_network
+
     # Print the model type
     print("\nInitialising model {}".format(opts.model_name))
     weight_decay = get_attr_(opts, "l2_weight_decay", 0.0)
@@ -150,8 +170,12 @@ def get_engine(opts, train_loader, test_loader, writer=None):
     frame, dim, data = opts.framework, opts.tensor_dim, opts.data_list
     multi_input_keys = DATASET_MAPPING[frame][dim][data].get("M_IN", None)
     multi_output_keys = DATASET_MAPPING[frame][dim][data].get("M_OUT", None)
+    device_augmentor = DATASET_MAPPING[frame][dim][data].get("DEVICE_AUG", None)
 
-    device = torch.device("cuda") if opts.gpus != "-1" else torch.device("cpu")
+    if is_distributed():
+        device = torch.device(f"cuda:{get_local_rank()}") if opts.gpus != "-1" else torch.device("cpu")
+    else:
+        device = torch.device("cuda") if opts.gpus != "-1" else torch.device("cpu")
     model_dir = check_dir(opts.experiment_path, "Models")
 
     loss = lr_scheduler = None
@@ -163,13 +187,24 @@ def get_engine(opts, train_loader, test_loader, writer=None):
         loss = get_loss_fn(opts.framework, opts.criterion, opts.loss_params, opts.output_nc, opts.deep_supervision)
 
     net_ = get_network(opts)
-
-    if len(opts.gpu_ids) > 1:  # and not opts.amp:
+    memory_format = get_memory_format(opts)
+    if memory_format is not None:
+        net_ = net_.to(memory_format=memory_format)
+    compile_mode = get_attr_(opts, "compile", "none")
+    if len(opts.gpu_ids) > 1 and not is_distributed() and compile_mode != "none":
+        print("Compiled network is not supported by DataParallel, run in eager mode.")
+    else:  # only main process writes the cache
+        net_ = compile_network(net_.to(device), compile_mode, model_dir if is_main_process() else None)
+
+    if is_distributed():
+        device_ids = [device.index] if device.type == "cuda" else None
+        net = torch.nn.parallel.DistributedDataParallel(net_.to(device), device_ids=device_ids)
+    elif len(opts.gpu_ids) > 1:  # and not opts.amp:
         net = torch.nn.DataParallel(net_.to(device))
     else:
         net = net_.to(device)
 
-    if opts.visualize:
+    if opts.visualize and is_main_process():
         print_network(net)
 
     if opts.optim == "adam":
@@ -195,7 +230,8 @@ def get_engine(opts, train_loader, test_loader, writer=None):
             weight_decay=weight_decay,
             lookahead_active=True,
             use_warmup=True,
-            num_batches_per_epoch=len(train_loader),
+            # warmup and warmdown are scheduled by optimizer steps, one per accumulated group of batches
+            num_batches_per_epoch=math.ceil(len(train_loader) / get_accumulation_steps(opts)),
             num_epochs=opts.n_epoch,
         )
     else:
@@ -243,6 +279,7 @@ def get_engine(opts, train_loader, test_loader, writer=None):
         "logger_name": None,
         "multi_input_keys": multi_input_keys,
         "multi_output_keys": multi_output_keys,
+        "device_augmentor": device_augmentor,
     }
 
     try:
@@ -263,6 +300,9 @@ def get_test_engine(opts, test_loader):
     Returns:
         IgniteEngine: Return test engine.
     """
+    from strix.models.cnn.engines import TEST_ENGINES, ENSEMBLE_TEST_ENGINES
+    from strix.models.cnn.engines.utils import get_memory_format
+    from strix.models.compile import compile_network
 
     device = torch.device("cuda:0") if opts.gpus != "-1" else torch.device("cpu")
 
@@ -270,7 +310,16 @@ def get_test_engine(opts, test_loader):
     multi_input_keys = DATASET_MAPPING[frame][dim][data].get("M_IN", None)
     multi_output_keys = DATASET_MAPPING[frame][dim][data].get("M_OUT", None)
 
-    net = get_network(opts).to(device)
+    net_memory_format = get_memory_format(opts) or torch.preserve_format
+    net = get_network(opts).to(device, memory_format=net_memory_format)
+
+    coarse_network = None
+    if get_attr_(opts, "cascade_model", None):  # low-res network of cascade inference
+        from ignite.handlers import Checkpoint
+
+        coarse_opts = SimpleNamespace(**{**vars(opts), "model_name": opts.cascade_archi or opts.model_name})
+        coarse_network = get_network(coarse_opts).to(device, memory_format=net_memory_format).eval()
+        Checkpoint.load_objects({"net": coarse_network}, torch.load(opts.cascade_model, map_location=device))
 
     params = {
         "opts": opts,
@@ -283,10 +332,16 @@ def get_test_engine(opts, test_loader):
         "output_latent_code": opts.save_latent,
         "target_latent_layer": opts.target_layer,
     }
+    if coarse_network is not None:
+        params["coarse_network"] = coarse_network
 
     is_intra_ensemble = isinstance(opts.model_path, (list, tuple)) and len(opts.model_path) > 1
 
     if get_attr_(opts, "n_fold", 0) > 1 or get_attr_(opts, "n_repeat", 0) > 1 or is_intra_ensemble:
-        return ENSEMBLE_TEST_ENGINES[frame](**params)
+        return ENSEMBLE_TEST_ENGINES[frame](**params)  # stacked by functorch, kept in eager mode
     else:
+        model_dir = Path(get_attr_(opts, "experiment_path", "")) / "Models"
+        params["net"] = compile_network(
+            net, get_attr_(opts, "compile", "none"), model_dir if model_dir.is_dir() else None
+        )
         return TEST_ENGINES[frame](**params)
@@ -3,7 +3,7 @@ from typing import Any
 import os
 import torch
 
-from strix.models import CLASSIFICATION_ARCHI, SEGMENTATION_ARCHI
+from strix.models import CLASSIFICATION_ARCHI, SEGMENTATION_ARCHI, SIAMESE_ARCHI
 from strix.models.cnn.nets.resnet import resnet18, resnet34, resnet50
 from strix.models.cnn.nets.vgg import vgg9_bn, vgg11_bn
 from strix.models.cnn.nets.dynunet import DynUNet
@@ -89,6 +89,8 @@ def strix_resnet50(
 
 @CLASSIFICATION_ARCHI.register("2D", "vgg9")
 @CLASSIFICATION_ARCHI.register("3D", "vgg9")
+@SIAMESE_ARCHI.register("2D", "vgg9")
+@SIAMESE_ARCHI.register("3D", "vgg9")
 def strix_vgg9_bn(
     spatial_dims: int,
     in_channels: int,
@@ -110,12 +112,15 @@ def strix_vgg9_bn(
     inkwargs["is_prunable"] = is_prunable
     inkwargs["groups"] = n_group
     inkwargs["bottleneck_size"] = kwargs.get("bottleneck_size", 5)
+    inkwargs["siamese"] = kwargs.get("siamese")
 
     return vgg9_bn(pretrained=False, progress=True, **inkwargs)
 
 
 @CLASSIFICATION_ARCHI.register("2D", "vgg11")
 @CLASSIFICATION_ARCHI.register("3D", "vgg11")
+@SIAMESE_ARCHI.register("2D", "vgg11")
+@SIAMESE_ARCHI.register("3D", "vgg11")
 def strix_vgg11_bn(
     spatial_dims: int,
     in_channels: int,
@@ -137,6 +142,7 @@ def strix_vgg11_bn(
     inkwargs["is_prunable"] = is_prunable
     inkwargs["groups"] = n_group
     inkwargs["bottleneck_size"] = kwargs.get("bottleneck_size", 2)
+    inkwargs["siamese"] = kwargs.get("siamese")
 
     return vgg11_bn(pretrained=False, progress=True, **inkwargs)
 
@@ -169,6 +175,7 @@ def strix_dyn_unet(
     last_activation = None
     filters = kwargs.get("filters", None)
     output_bottleneck = kwargs.get("output_bottleneck", False)
+    grad_checkpoint = kwargs.get("grad_checkpoint", 0)
 
     return DynUNet(
         spatial_dims,
@@ -185,6 +192,7 @@ def strix_dyn_unet(
         is_prunable,
         filters,
         output_bottleneck,
+        grad_checkpoint,
     )
 
 
@@ -214,6 +222,7 @@ def strix_dyn_resunet(
     last_activation = None
     filters = kwargs.get("filters", None)
     output_bottleneck = kwargs.get("output_bottleneck", False)
+    grad_checkpoint = kwargs.get("grad_checkpoint", 0)
 
     return DynUNet(
         spatial_dims,
@@ -230,6 +239,7 @@ def strix_dyn_resunet(
         is_prunable,
         filters,
         output_bottleneck,
+        grad_checkpoint,
     )
 
 
@@ -276,6 +286,7 @@ def strix_hesam(
     last_feature = kwargs.get("last_feature", 64)
     upsample = kwargs.get("upsample", "deconv")
     sam_size = kwargs.get("sam_size", 6)
+    grad_checkpoint = kwargs.get("grad_checkpoint", 0)
 
     net = HESAM(
         spatial_dims,
@@ -289,6 +300,7 @@ def strix_hesam(
         drop_out,
         upsample,
         n_group,
+        grad_checkpoint,
     )
 
     if os.path.isfile(pretrained_model_path):
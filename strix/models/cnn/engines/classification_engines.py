@@ -1,4 +1,3 @@
-import copy
 import logging
 import re
 from types import SimpleNamespace
@@ -13,33 +12,38 @@ from ignite.metrics import Accuracy, Precision, Recall
 from strix.configures import config as cfg
 from strix.models.cnn.engines import ENSEMBLE_TEST_ENGINES, TEST_ENGINES, TRAIN_ENGINES
 from strix.models.cnn.engines.engine import StrixTestEngine, StrixTrainEngine
+from strix.models.cnn.layers.ensemble import StackedEnsemble
 from strix.models.cnn.engines.utils import (
     get_models,
     get_prepare_batch_fn,
     get_unsupervised_prepare_batch_fn,
+    get_device_augmented_prepare_batch_fn,
+    attach_prefetcher,
+    attach_gradient_accumulation,
 )
 from strix.models.cnn.utils import onehot_process
 from strix.utilities.enum import Phases
+from strix.utilities.distributed import sync_metric
 from strix.utilities.transforms import decollate_transform_adaptor as DTA
 from strix.utilities.utils import output_filename_check, setup_logger, get_attr_
-from monai_ex.engines import EnsembleEvaluator, SupervisedEvaluatorEx, SupervisedTrainerEx
+from monai_ex.engines import SupervisedEvaluatorEx, SupervisedTrainerEx
 from monai_ex.handlers import (
     ROCAUC,
     CheckpointLoaderEx,
     ClassificationSaverEx,
     EarlyStopHandler,
     LatentCodeSaver,
-    LrScheduleTensorboardHandler,
     ValidationHandler,
 )
 from monai_ex.handlers import from_engine_ex as from_engine
 from monai_ex.handlers import stopping_fn_from_metric
 from monai_ex.inferers import SimpleInfererEx
+from strix.models.cnn.inferers import get_tta_inferer, get_precision_inferer, is_engine_amp
 from monai_ex.metrics import DrawRocCurve
 from monai_ex.transforms import ActivationsD
 from monai_ex.transforms import AsDiscreteExD as AsDiscreteD
 from monai_ex.transforms import ComposeEx as Compose
-from monai_ex.transforms import EnsureTypeD, GetItemD, MeanEnsembleD, SqueezeDimD, VoteEnsembleD
+from monai_ex.transforms import EnsureTypeD, GetItemD, SqueezeDimD
 from monai_ex.utils import ensure_tuple
 
 
@@ -63,6 +67,7 @@ class ClassificationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
         valid_interval = kwargs.get("valid_interval", 1)
         multi_input_keys = kwargs.get("multi_input_keys", None)
         multi_output_keys = kwargs.get("multi_output_keys", None)
+        device_augmentor = kwargs.get("device_augmentor", None)
         decollate = False
         logger_name = get_attr_(opts, 'logger_name', logger_name)
         _image = cfg.get_key("image")
@@ -116,14 +121,16 @@ class ClassificationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
             network=net,
             epoch_length=int(opts.n_epoch_len) if opts.n_epoch_len > 1.0 else int(opts.n_epoch_len * len(test_loader)),
             prepare_batch=prepare_batch_fn,
-            inferer=SimpleInfererEx(),
+            non_blocking=True,
+            inferer=get_precision_inferer(opts, SimpleInfererEx(), device),
             postprocessing=None,
             key_val_metric=key_val_metric,
             val_handlers=val_handlers,
-            amp=opts.amp,
+            amp=is_engine_amp(opts, device),
             decollate=decollate,
             custom_keys=cfg.get_keys_dict(),
         )
+        attach_prefetcher(evaluator, prepare_batch_fn, get_attr_(opts, "prefetch_batch", 0))
         evaluator.logger = setup_logger(logger_name)
 
         if isinstance(lr_scheduler, torch.optim.lr_scheduler.ReduceLROnPlateau):
@@ -133,12 +140,7 @@ class ClassificationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
 
         train_handlers = [
             ValidationHandler(validator=evaluator, interval=valid_interval, epoch_level=True),
-            LrScheduleTensorboardHandler(
-                lr_scheduler=lr_scheduler,
-                summary_writer=writer,
-                name=logger_name,
-                step_transform=lr_step_transform,
-            ),
+            StrixTrainEngine.get_lr_schedule_handler(lr_scheduler, writer, logger_name, lr_step_transform),
         ]
 
         train_handlers += StrixTrainEngine.get_basic_handlers(
@@ -167,17 +169,20 @@ class ClassificationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
             optimizer=optim,
             loss_function=loss,
             epoch_length=int(opts.n_epoch_len) if opts.n_epoch_len > 1.0 else int(opts.n_epoch_len * len(train_loader)),
-            prepare_batch=prepare_batch_fn,
-            inferer=SimpleInfererEx(logger_name),
+            prepare_batch=get_device_augmented_prepare_batch_fn(prepare_batch_fn, device_augmentor),
+            non_blocking=True,
+            inferer=get_precision_inferer(opts, SimpleInfererEx(logger_name), device),
             postprocessing=None,
             key_train_metric=key_train_metric,
             # additional_metrics={"roccurve": add_roc_metric},
             train_handlers=train_handlers,
-            amp=opts.amp,
+            amp=is_engine_amp(opts, device),
             decollate=decollate,
             custom_keys=cfg.get_keys_dict(),
             ensure_dims=True,
         )
+        attach_prefetcher(self, prepare_batch_fn, get_attr_(opts, "prefetch_batch", 0))
+        attach_gradient_accumulation(self, opts)
         self.logger = setup_logger(logger_name)
 
     @staticmethod
@@ -200,7 +205,7 @@ class ClassificationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
             return {f"{phase.value}_acc_{suffix}": key_val_metric} if suffix else {f"{phase.value}_acc": key_val_metric}
         else:
             transform = ClassificationTrainEngine.get_auc_post_transform(output_nc, decollate, item_index)
-            key_val_metric = ROCAUC(output_transform=transform)
+            key_val_metric = sync_metric(ROCAUC(output_transform=transform))
             return {f"{phase.value}_auc_{suffix}": key_val_metric} if suffix else {f"{phase.value}_auc": key_val_metric}
 
     @staticmethod
@@ -338,17 +343,20 @@ class ClassificationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
             val_data_loader=test_loader,
             network=net,
             prepare_batch=prepare_batch_fn,
-            inferer=SimpleInfererEx(),  # SlidingWindowClassify(roi_size=opts.crop_size, sw_batch_size=4, overlap=0.3),
+            non_blocking=True,
+            # SlidingWindowClassify(roi_size=opts.crop_size, sw_batch_size=4, overlap=0.3),
+            inferer=get_precision_inferer(opts, get_tta_inferer(opts, SimpleInfererEx()), device),
             postprocessing=None,  # post_transforms,
             val_handlers=handlers,
             key_val_metric=key_val_metric if is_supervised else None,
             additional_metrics=additional_val_metrics if is_supervised else None,
-            amp=opts.amp,
+            amp=is_engine_amp(opts, device),
             decollate=decollate,
             custom_keys=cfg.get_keys_dict(),
             output_latent_code=output_latent_code,
             target_latent_layer=target_latent_layer,
         )
+        attach_prefetcher(self, prepare_batch_fn, get_attr_(opts, "prefetch_batch", 0))
 
     @staticmethod
     def get_metric(
@@ -504,7 +512,7 @@ class ClassificationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
 
 
 @ENSEMBLE_TEST_ENGINES.register("classification")
-class ClassificationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
+class ClassificationEnsembleTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
     def __init__(
         self,
         opts: SimpleNamespace,
@@ -542,18 +550,16 @@ class ClassificationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
             )
         print(f"Using models: {[m.name for m in model_list]}")
 
-        nets = [copy.deepcopy(net),] * len(model_list)
-        for net, m in zip(nets, model_list):
-            CheckpointLoaderEx(load_path=str(m), load_dict={"net": net}, name=logger_name)(None)
-
-        pred_keys = [f"{_pred}{i}" for i in range(len(model_list))]
-        w_ = [float(re.search(float_regex, m.name).group(1)) for m in best_models] if use_best_model else None
-
-        post_transforms = MeanEnsembleD(
-            keys=pred_keys,
-            output_key=_pred,
+        w_ = [float(re.search(float_regex, m.name).group(1)) for m in model_list] if use_best_model else None
+        ensemble_net = StackedEnsemble(
+            net,
+            len(model_list),
             weights=w_,
-        )
+            mode=get_attr_(opts, "ensemble", "mean"),
+            group_size=get_attr_(opts, "ensemble_group", 0),
+        ).eval()
+        for model, m in zip(ensemble_net.models, model_list):
+            CheckpointLoaderEx(load_path=str(m), load_dict={"net": model}, name=logger_name)(None)
 
         key_val_metric = ClassificationTestEngine.get_metric(opts.phase, opts.output_nc, decollate, metric_names="acc")
         additional_val_metrics = ClassificationTestEngine.get_metric(
@@ -563,8 +569,8 @@ class ClassificationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
         handlers = StrixTestEngine.get_basic_handlers(
             phase=opts.phase,
             out_dir=opts.out_dir,
-            model_path=best_models,
-            load_dict=[{"net": net} for net in nets],
+            model_path=model_list,
+            load_dict=[{"net": model} for model in ensemble_net.models],
             logger_name=logger_name,
             stats_dicts={"Metrics": lambda x: None},
             save_image=opts.save_image,
@@ -586,19 +592,21 @@ class ClassificationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
         else:
             raise ValueError(f"Got unexpected phase here {opts.phase}, expect testing.")
 
-        EnsembleEvaluator.__init__(
+        SupervisedEvaluatorEx.__init__(
             self,
             device=device,
             val_data_loader=test_loader,
-            networks=nets,
-            pred_keys=pred_keys,
+            network=ensemble_net,
             prepare_batch=prepare_batch_fn,
-            inferer=SimpleInfererEx(),
-            postprocessing=post_transforms,
+            non_blocking=True,
+            inferer=get_precision_inferer(opts, get_tta_inferer(opts, SimpleInfererEx()), device),
+            postprocessing=None,
             key_val_metric=key_val_metric,
             additional_metrics=additional_val_metrics,
             val_handlers=handlers,
-            amp=opts.amp,
-            decollate=decollate
+            amp=is_engine_amp(opts, device),
+            decollate=decollate,
+            custom_keys=cfg.get_keys_dict(),
         )
+        attach_prefetcher(self, prepare_batch_fn, get_attr_(opts, "prefetch_batch", 0))
 
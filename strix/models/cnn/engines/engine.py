@@ -7,9 +7,12 @@ import torch
 
 from strix.configures import config as cfg
 from strix.utilities.utils import output_filename_check
+from strix.utilities.distributed import is_main_process
 from monai_ex.handlers import (
     CheckpointLoader,
     CheckpointSaverEx,
+    LrScheduleHandler,
+    LrScheduleTensorboardHandler,
     NNIReporterHandler,
     ImageBatchSaver,
     StatsHandlerEx as StatsHandler,
@@ -68,6 +71,8 @@ class StrixTrainEngine(ABC):
         nni_kwargs: Optional[Dict] = None,
     ):
         handlers = []
+        if not is_main_process():  # logging, checkpoints and tensorboard are done by rank 0
+            return handlers
 
         if stats_dicts is not None:
             for key, output_transform_fn in stats_dicts.items():
@@ -145,6 +150,20 @@ class StrixTrainEngine(ABC):
 
         return handlers
 
+    @staticmethod
+    def get_lr_schedule_handler(lr_scheduler, tb_summary_writer, logger_name: Optional[str], step_transform: Callable):
+        """LR schedule handler, without tensorboard if `tb_summary_writer` is None,
+        eg. in the non-main processes of distributed training.
+        """
+        if tb_summary_writer is None:
+            return LrScheduleHandler(lr_scheduler=lr_scheduler, name=logger_name, step_transform=step_transform)
+        return LrScheduleTensorboardHandler(
+            lr_scheduler=lr_scheduler,
+            summary_writer=tb_summary_writer,
+            name=logger_name,
+            step_transform=step_transform,
+        )
+
 
 class StrixTestEngine(ABC):
     """A base class for strix inner test engines."""
@@ -175,6 +194,7 @@ class StrixTestEngine(ABC):
         image_resample: bool = False,
         test_loader: Optional[DataLoader] = None,
         image_batch_transform: Callable = lambda x: (),
+        output_ext: str = ".nii.gz",
     ):
         handlers = []
         
@@ -198,7 +218,7 @@ class StrixTestEngine(ABC):
             handlers += [
                 ImageBatchSaver(
                     output_dir=out_dir,
-                    output_ext=".nii.gz",
+                    output_ext=output_ext,
                     output_postfix=_image,
                     data_root_dir=output_filename_check(test_loader.dataset, meta_key=_image+"_meta_dict"),
                     resample=image_resample,
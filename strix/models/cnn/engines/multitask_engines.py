@@ -5,15 +5,22 @@ import torch
 import logging
 from strix.configures import config as cfg
 from strix.models.cnn.engines import TEST_ENGINES, TRAIN_ENGINES, StrixTestEngine, StrixTrainEngine, ENSEMBLE_TEST_ENGINES
-from strix.models.cnn.engines.utils import get_prepare_batch_fn, get_unsupervised_prepare_batch_fn, get_models
+from strix.models.cnn.engines.utils import (
+    get_prepare_batch_fn,
+    get_unsupervised_prepare_batch_fn,
+    get_device_augmented_prepare_batch_fn,
+    attach_prefetcher,
+    get_models,
+)
 from strix.utilities.utils import setup_logger, output_filename_check, get_attr_
 from strix.utilities.enum import Phases
 from monai_ex.engines import MultiTaskTrainer, SupervisedEvaluatorEx, EnsembleEvaluatorEx
 from monai_ex.transforms import MeanEnsembleD, MultitaskMeanEnsembleD
-from monai_ex.handlers import EarlyStopHandler, LrScheduleTensorboardHandler, ValidationHandler
+from monai_ex.handlers import EarlyStopHandler, ValidationHandler
 from monai_ex.handlers import from_engine_ex as from_engine
 from monai_ex.handlers import stopping_fn_from_metric
 from monai_ex.inferers import SimpleInfererEx as SimpleInferer
+from strix.models.cnn.inferers import get_precision_inferer, is_engine_amp
 
 
 @TRAIN_ENGINES.register("multitask")
@@ -36,6 +43,7 @@ class MultiTaskTrainEngine(StrixTrainEngine, MultiTaskTrainer):
         valid_interval = kwargs.get("valid_interval", 1)
         multi_input_keys = kwargs.get("multi_input_keys", None)
         multi_output_keys = kwargs.get("multi_output_keys", None)
+        device_augmentor = kwargs.get("device_augmentor", None)
         _image = cfg.get_key("image")
         _label = cfg.get_key("label")
         _pred = cfg.get_key("pred")
@@ -109,15 +117,17 @@ class MultiTaskTrainEngine(StrixTrainEngine, MultiTaskTrainer):
             network=net,
             epoch_length=int(opts.n_epoch_len) if opts.n_epoch_len > 1.0 else int(opts.n_epoch_len * len(test_loader)),
             prepare_batch=prepare_batch_fn,
-            inferer=SimpleInferer(),
+            non_blocking=True,
+            inferer=get_precision_inferer(opts, SimpleInferer(), device),
             postprocessing=None,
             key_val_metric=subtask1_val_metric,
             additional_metrics=subtask2_val_metric,
             val_handlers=val_handlers,
-            amp=opts.amp,
+            amp=is_engine_amp(opts, device),
             decollate=decollate,
             custom_keys=cfg.get_keys_dict(),
         )
+        attach_prefetcher(evaluator, prepare_batch_fn, get_attr_(opts, "prefetch_batch", 0))
         evaluator.logger = setup_logger(logger_name)
 
         if isinstance(lr_scheduler, torch.optim.lr_scheduler.ReduceLROnPlateau):
@@ -127,12 +137,7 @@ class MultiTaskTrainEngine(StrixTrainEngine, MultiTaskTrainer):
 
         train_handlers = [
             ValidationHandler(validator=evaluator, interval=valid_interval, epoch_level=True),
-            LrScheduleTensorboardHandler(
-                lr_scheduler=lr_scheduler,
-                summary_writer=writer,
-                name=logger_name,
-                step_transform=lr_step_transform,
-            ),
+            StrixTrainEngine.get_lr_schedule_handler(lr_scheduler, writer, logger_name, lr_step_transform),
         ]
         train_handlers += StrixTrainEngine.get_basic_handlers(
             phase=Phases.TRAIN.value,
@@ -159,16 +164,18 @@ class MultiTaskTrainEngine(StrixTrainEngine, MultiTaskTrainer):
             optimizer=optim,
             loss_function=loss,
             epoch_length=int(opts.n_epoch_len) if opts.n_epoch_len > 1.0 else int(opts.n_epoch_len * len(train_loader)),
-            prepare_batch=prepare_batch_fn,
-            inferer=SimpleInferer(),
+            prepare_batch=get_device_augmented_prepare_batch_fn(prepare_batch_fn, device_augmentor),
+            non_blocking=True,
+            inferer=get_precision_inferer(opts, SimpleInferer(), device),
             postprocessing=None,
             key_train_metric=subtask1_train_metric,
             additional_metrics=subtask2_train_metric,
             train_handlers=train_handlers,
-            amp=opts.amp,
+            amp=is_engine_amp(opts, device),
             decollate=decollate,
             custom_keys=cfg.get_keys_dict(),
         )
+        attach_prefetcher(self, prepare_batch_fn, get_attr_(opts, "prefetch_batch", 0))
         self.logger = setup_logger(logger_name)
 
 
@@ -242,15 +249,17 @@ class MultiTaskTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
             network=net,
             epoch_length=int(opts.n_epoch_len) if opts.n_epoch_len > 1.0 else int(opts.n_epoch_len * len(test_loader)),
             prepare_batch=prepare_batch_fn,
-            inferer=SimpleInferer(),
+            non_blocking=True,
+            inferer=get_precision_inferer(opts, SimpleInferer(), device),
             postprocessing=None,
             key_val_metric=subtask1_val_metric,
             additional_metrics=subtask2_val_metric,
             val_handlers=handlers,
-            amp=opts.amp,
+            amp=is_engine_amp(opts, device),
             decollate=decollate,
             custom_keys=cfg.get_keys_dict()
         )
+        attach_prefetcher(self, prepare_batch_fn, get_attr_(opts, "prefetch_batch", 0))
 
 
 @ENSEMBLE_TEST_ENGINES.register("multitask")
@@ -298,7 +307,7 @@ class MultitaskEnsembleTestEngine(StrixTestEngine, EnsembleEvaluatorEx):
             )
         self.logger.info(f"Using models: {[m.name for m in best_models]}")
 
-        nets = [copy.deepcopy(net),] * len(best_models)
+        nets = [copy.deepcopy(net) for _ in best_models]  # independent weights of each fold
         pred_keys = [f"{_pred}{i}" for i in range(len(best_models))]
         w_ = [float(re.search(float_regex, m.name).group(1)) for m in best_models] if use_best_model else None
 
@@ -348,12 +357,14 @@ class MultitaskEnsembleTestEngine(StrixTestEngine, EnsembleEvaluatorEx):
             networks=nets,
             pred_keys=pred_keys,
             prepare_batch=prepare_batch_fn,
-            inferer=SimpleInferer(),
+            non_blocking=True,
+            inferer=get_precision_inferer(opts, SimpleInferer(), device),
             postprocessing=post_transforms,
             key_val_metric=subtask1_val_metric,
             additional_metrics=subtask2_val_metric,
             val_handlers=handlers,
-            amp=opts.amp,
+            amp=is_engine_amp(opts, device),
             decollate=decollate,
             custom_keys=cfg.get_keys_dict()
         )
+        attach_prefetcher(self, prepare_batch_fn, get_attr_(opts, "prefetch_batch", 0))
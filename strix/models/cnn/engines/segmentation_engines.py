@@ -1,7 +1,6 @@
 from types import SimpleNamespace
 from typing import Optional, Union, Sequence, Dict
 import re
-import copy
 from pathlib import Path
 
 import torch
@@ -11,28 +10,39 @@ from strix.models.cnn.engines.utils import (
     get_models,
     get_prepare_batch_fn,
     get_unsupervised_prepare_batch_fn,
+    get_device_augmented_prepare_batch_fn,
+    attach_prefetcher,
+    attach_gradient_accumulation,
     get_dice_metric_transform_fn,
 )
 from strix.utilities.utils import setup_logger, output_filename_check, get_attr_
 from strix.utilities.enum import Phases
+from strix.utilities.distributed import sync_metric
+from strix.utilities.async_writer import attach_async_writer, get_output_ext
 from strix.utilities.transforms import decollate_transform_adaptor as DTA
 from strix.configures import config as cfg
 from strix.models.cnn.engines.engine import StrixTrainEngine, StrixTestEngine
+from strix.models.cnn.layers.ensemble import StackedEnsemble
+from strix.models.cnn.inferers import (
+    get_cascade_inferer,
+    get_sliding_window_inferer,
+    get_tta_inferer,
+    get_precision_inferer,
+    is_engine_amp,
+)
 
-from monai_ex.inferers import SimpleInfererEx as SimpleInferer, SlidingWindowInferer
+from monai_ex.inferers import SimpleInfererEx as SimpleInferer
 
-from monai_ex.engines import SupervisedTrainerEx, SupervisedEvaluatorEx, EnsembleEvaluator
+from monai_ex.engines import SupervisedTrainerEx, SupervisedEvaluatorEx
 
 from monai_ex.transforms import (
     ComposeEx as Compose,
     ActivationsD,
     AsDiscreteExD as AsDiscreteD,
-    MeanEnsembleD,
     GetItemD,
 )
 from monai_ex.handlers import (
     ValidationHandler,
-    LrScheduleTensorboardHandler,
     SegmentationSaver,
     MeanDice,
     stopping_fn_from_metric,
@@ -62,6 +72,7 @@ class SegmentationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
         valid_interval = kwargs.get("valid_interval", 1)
         multi_input_keys = kwargs.get("multi_input_keys", None)
         multi_output_keys = kwargs.get("multi_output_keys", None)
+        device_augmentor = kwargs.get("device_augmentor", None)
         _image = cfg.get_key("image")
         _label = cfg.get_key("label")
         _loss = cfg.get_key("loss")
@@ -114,14 +125,16 @@ class SegmentationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
             network=net,
             epoch_length=int(opts.n_epoch_len) if opts.n_epoch_len > 1.0 else int(opts.n_epoch_len * len(test_loader)),
             prepare_batch=prepare_batch_fn,
-            inferer=SimpleInferer(),
+            non_blocking=True,
+            inferer=get_precision_inferer(opts, SimpleInferer(), device),
             postprocessing=None,
             key_val_metric=val_metric,
             val_handlers=val_handlers,
-            amp=opts.amp,
+            amp=is_engine_amp(opts, device),
             decollate=decollate,
             custom_keys=cfg.get_keys_dict()
         )
+        attach_prefetcher(evaluator, prepare_batch_fn, get_attr_(opts, "prefetch_batch", 0))
         evaluator.logger = setup_logger(logger_name)
 
         if isinstance(lr_scheduler, torch.optim.lr_scheduler.ReduceLROnPlateau):
@@ -131,12 +144,7 @@ class SegmentationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
 
         train_handlers = [
             ValidationHandler(validator=evaluator, interval=valid_interval, epoch_level=True),
-            LrScheduleTensorboardHandler(
-                lr_scheduler=lr_scheduler,
-                summary_writer=writer,
-                name=logger_name,
-                step_transform=lr_step_transform,
-            ),
+            StrixTrainEngine.get_lr_schedule_handler(lr_scheduler, writer, logger_name, lr_step_transform),
         ]
         train_handlers += StrixTrainEngine.get_basic_handlers(
             phase="train",
@@ -164,22 +172,25 @@ class SegmentationTrainEngine(StrixTrainEngine, SupervisedTrainerEx):
             optimizer=optim,
             loss_function=loss,
             epoch_length=int(opts.n_epoch_len) if opts.n_epoch_len > 1.0 else int(opts.n_epoch_len * len(train_loader)),
-            prepare_batch=prepare_batch_fn,
-            inferer=SimpleInferer(),
+            prepare_batch=get_device_augmented_prepare_batch_fn(prepare_batch_fn, device_augmentor),
+            non_blocking=True,
+            inferer=get_precision_inferer(opts, SimpleInferer(), device),
             postprocessing=None,
             key_train_metric=train_metric,
             train_handlers=train_handlers,
-            amp=opts.amp,
+            amp=is_engine_amp(opts, device),
             decollate=decollate,
             custom_keys=cfg.get_keys_dict(),
             ensure_dims=True,
         )
+        attach_prefetcher(self, prepare_batch_fn, get_attr_(opts, "prefetch_batch", 0))
+        attach_gradient_accumulation(self, opts)
         self.logger = setup_logger(logger_name)
 
     @staticmethod
     def get_metric(phase: Phases, output_nc: int, decollate: bool, item_index: Optional[int] = None, suffix: str = ''):
         transform = SegmentationTrainEngine.get_dice_post_transform(output_nc, decollate, item_index)
-        key_metric = MeanDice(include_background=False, output_transform=transform)
+        key_metric = sync_metric(MeanDice(include_background=False, output_transform=transform))
         return {f"{phase.value}_mean_dice_{suffix}": key_metric} if suffix else {f"{phase.value}_mean_dice": key_metric}
 
     @staticmethod
@@ -303,6 +314,7 @@ class SegmentationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
             image_resample=opts.resample,
             test_loader=test_loader,
             image_batch_transform=from_engine([_image, _image + "_meta_dict"]),
+            output_ext=get_output_ext(opts),
         )
         extra_handlers = SegmentationTestEngine.get_extra_handlers(
             opts=opts, test_loader=test_loader, decollate=decollate, logger_name=logger_name, **kwargs
@@ -316,10 +328,13 @@ class SegmentationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
         elif opts.phase == Phases.TEST_IN:
             prepare_batch_fn = get_prepare_batch_fn(opts, _image, _label, multi_input_keys, multi_output_keys)
 
-        if use_slidingwindow:
-            inferer = SlidingWindowInferer(roi_size=crop_size, sw_batch_size=opts.n_batch, overlap=0.5)
+        if use_slidingwindow and get_attr_(opts, "cascade", False):
+            inferer = get_cascade_inferer(opts, crop_size, kwargs.get("coarse_network"))
+        elif use_slidingwindow:
+            inferer = get_sliding_window_inferer(opts, crop_size)
         else:
             inferer = SimpleInferer()
+        inferer = get_tta_inferer(opts, inferer)
 
         SupervisedEvaluatorEx.__init__(
             self,
@@ -327,14 +342,19 @@ class SegmentationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
             val_data_loader=test_loader,
             network=net,
             prepare_batch=prepare_batch_fn,
-            inferer=inferer,
+            non_blocking=True,
+            inferer=get_precision_inferer(opts, inferer, device),
             postprocessing=None,
             key_val_metric=key_val_metric,
             val_handlers=handlers,
-            amp=opts.amp,
+            amp=is_engine_amp(opts, device),
             decollate=decollate,
             custom_keys=cfg.get_keys_dict()
         )
+        attach_prefetcher(self, prepare_batch_fn, get_attr_(opts, "prefetch_batch", 0))
+        attach_async_writer(
+            self, handlers, get_attr_(opts, "save_workers", 0), get_attr_(opts, "save_compress_level", 1)
+        )
 
     @staticmethod
     def get_metric(
@@ -375,12 +395,13 @@ class SegmentationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
         suffix = kwargs.get("suffix", '')
         output_nc = opts.output_nc if item_index is None else opts.output_nc[item_index]
 
+        output_ext = get_output_ext(opts)
         data_root_dir = output_filename_check(test_loader.dataset, meta_key=_image+"_meta_dict")
         extra_handlers = [
             SegmentationSaver(
                 output_dir=opts.out_dir,
                 output_postfix=f"{suffix}_seg",
-                output_ext=".nii.gz",
+                output_ext=output_ext,
                 resample=opts.resample,
                 data_root_dir=data_root_dir,
                 batch_transform=from_engine(_image + "_meta_dict"), 
@@ -394,7 +415,7 @@ class SegmentationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
                 SegmentationSaver(
                     output_dir=opts.out_dir,
                     output_postfix=f"{suffix}_prob",
-                    output_ext=".nii.gz",
+                    output_ext=output_ext,
                     resample=opts.resample,
                     data_root_dir=data_root_dir,
                     batch_transform=from_engine(_image + "_meta_dict"),
@@ -414,7 +435,7 @@ class SegmentationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
             extra_handlers += [
                 ImageBatchSaver(
                     output_dir=opts.out_dir,
-                    output_ext=".nii.gz",
+                    output_ext=output_ext,
                     output_postfix=f"{suffix}_label",
                     data_root_dir=output_filename_check(test_loader.dataset, meta_key=_label+"_meta_dict"),
                     resample=False,  # opts.resample,
@@ -457,7 +478,7 @@ class SegmentationTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
 
 
 @ENSEMBLE_TEST_ENGINES.register("segmentation")
-class SegmentationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
+class SegmentationEnsembleTestEngine(StrixTestEngine, SupervisedEvaluatorEx):
     def __init__(
         self,
         opts: SimpleNamespace,
@@ -480,7 +501,7 @@ class SegmentationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
             raise NotImplementedError("Intra ensemble testing not tested yet")
         
         if use_slidingwindow:
-            self.logger.info(f"---Use slidingwindow infer!---","\nPatch size: {crop_size}")
+            self.logger.info(f"---Use slidingwindow infer!---\nPatch size: {crop_size}")
         else:
             self.logger.info("---Use simple infer!---")
 
@@ -503,17 +524,15 @@ class SegmentationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
             )
         self.logger.info(f"Using models: {[m.name for m in best_models]}")
 
-        nets = [copy.deepcopy(net),] * len(best_models)
-
-        pred_keys = [f"{_pred}{i}" for i in range(len(best_models))]
+        # use validation metrics as weights
         w_ = [float(re.search(float_regex, m.name).group(1)) for m in best_models] if use_best_model else None
-
-        post_transforms = MeanEnsembleD(
-            keys=pred_keys,
-            output_key=_pred,
-            # in this particular example, we use validation metrics as weights
+        ensemble_net = StackedEnsemble(
+            net,
+            len(best_models),
             weights=w_,
-        )
+            mode=get_attr_(opts, "ensemble", "mean"),
+            group_size=get_attr_(opts, "ensemble_group", 0),
+        ).eval()
 
         key_val_metric = SegmentationTestEngine.get_metric(opts.phase, opts.output_nc, decollate)
         val_metric_name = list(key_val_metric.keys())[0]
@@ -522,13 +541,14 @@ class SegmentationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
             phase=opts.phase,
             out_dir=opts.out_dir,
             model_path=best_models,
-            load_dict=[{"net": net} for net in nets],
+            load_dict=[{"net": model} for model in ensemble_net.models],
             logger_name=logger_name,
             stats_dicts={val_metric_name: lambda x: None},
             save_image=opts.save_image,
             image_resample=opts.resample,
             test_loader=test_loader,
             image_batch_transform=from_engine([_image, _image + "_meta_dict"]),
+            output_ext=get_output_ext(opts),
         )
         extra_handlers = SegmentationTestEngine.get_extra_handlers(
             opts=opts, test_loader=test_loader, decollate=decollate, logger_name=logger_name, **kwargs
@@ -544,22 +564,30 @@ class SegmentationEnsembleTestEngine(StrixTestEngine, EnsembleEvaluator):
         else:
             raise ValueError(f"Got unexpected phase here {opts.phase}, expect testing.")
 
-        if use_slidingwindow:
-            inferer = SlidingWindowInferer(roi_size=crop_size, sw_batch_size=opts.n_batch, overlap=0.5)
+        if use_slidingwindow and get_attr_(opts, "cascade", False):
+            inferer = get_cascade_inferer(opts, crop_size, kwargs.get("coarse_network"))
+        elif use_slidingwindow:
+            inferer = get_sliding_window_inferer(opts, crop_size)
         else:
             inferer = SimpleInferer()
+        inferer = get_tta_inferer(opts, inferer)
 
-        EnsembleEvaluator.__init__(
+        SupervisedEvaluatorEx.__init__(
             self,
             device=device,
             val_data_loader=test_loader,
-            networks=nets,
-            pred_keys=pred_keys,
+            network=ensemble_net,
             prepare_batch=prepare_batch_fn,
-            inferer=inferer,
-            postprocessing=post_transforms,
+            non_blocking=True,
+            inferer=get_precision_inferer(opts, inferer, device),
+            postprocessing=None,
             key_val_metric=key_val_metric,
             val_handlers=handlers,
-            amp=opts.amp,
+            amp=is_engine_amp(opts, device),
             decollate=decollate,
+            custom_keys=cfg.get_keys_dict()
+        )
+        attach_prefetcher(self, prepare_batch_fn, get_attr_(opts, "prefetch_batch", 0))
+        attach_async_writer(
+            self, handlers, get_attr_(opts, "save_workers", 0), get_attr_(opts, "save_compress_level", 1)
         )
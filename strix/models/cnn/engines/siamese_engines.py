@@ -13,8 +13,8 @@ from strix.models.cnn.engines.utils import output_onehot_transform
 from strix.models.cnn.losses.losses import ContrastiveLoss
 from strix.configures import config as cfg
 
-from monai_ex.inferers import SimpleInferer
-from ignite.metrics import Accuracy
+from monai_ex.inferers import SimpleInferer, SimpleInfererEx
+from ignite.metrics import Accuracy, Loss
 from ignite.handlers import EarlyStopping, ModelCheckpoint
 from ignite.engine import Events
 
@@ -29,6 +29,8 @@ from monai_ex.engines import (
     SiameseTrainer,
     SiameseEvaluator,
     SupervisedEvaluator,
+    SupervisedTrainerEx,
+    SupervisedEvaluatorEx,
     EnsembleEvaluator
 )
 
@@ -67,7 +69,9 @@ def build_siamese_engine(**kwargs):
     model_dir = kwargs["model_dir"]
     logger_name = kwargs.get("logger_name", None)
     is_multilabel = opts.output_nc > 1
-    single_output = isinstance(loss, ContrastiveLoss)
+    # in-batch losses pair the samples of plain batches, trained as supervised
+    in_batch = getattr(loss, "in_batch", False)
+    single_output = isinstance(loss, ContrastiveLoss) or in_batch
     image_ = cfg.get_key("image")
     label_ = cfg.get_key("label")
     loss_ = cfg.get_key("loss")
@@ -96,26 +100,31 @@ def build_siamese_engine(**kwargs):
             output_transform=lambda x: None,
             name=logger_name
         ),
+        # val_loss of in-batch losses is a metric, logged at the end of the epochs
         TensorBoardStatsHandler(
             summary_writer=writer,
             tag_name='val_loss',
-            output_transform=lambda x: x[loss_]
+            output_transform=(lambda x: None) if in_batch else (lambda x: x[loss_])
         ),
         CheckpointSaverEx(
             save_dir=model_dir,
             save_dict={"net": net},
             save_key_metric=True,
             key_metric_n_saved=4,
-            key_metric_save_after_epoch=0
+            key_metric_save_after_epoch=0,
+            key_metric_negative_sign=in_batch,
         ),
-        TensorBoardImageHandlerEx(
-            summary_writer=writer,
-            batch_transform=lambda x: (None, None),
-            output_transform=lambda x: x[label_],
-            max_channels=3,
-            prefix_name='Val'
-        )
     ]
+    if not in_batch:  # labels of in-batch losses are class labels
+        val_handlers.append(
+            TensorBoardImageHandlerEx(
+                summary_writer=writer,
+                batch_transform=lambda x: (None, None),
+                output_transform=lambda x: x[label_],
+                max_channels=3,
+                prefix_name='Val'
+            )
+        )
     if single_output:
         train_post_transforms = None
     elif opts.output_nc == 1:
@@ -132,30 +141,50 @@ def build_siamese_engine(**kwargs):
     else:
         key_val_metric = ROCAUC(output_transform=partial(output_onehot_transform, n_classes=opts.output_nc))
 
-    evaluator = SiameseEvaluator(
-        device=device,
-        val_data_loader=test_loader,
-        network=net,
-        loss_function=loss,
-        epoch_length=int(opts.n_epoch_len)
-        if opts.n_epoch_len > 1.0
-        else int(opts.n_epoch_len*len(test_loader)),
-        prepare_batch=prepare_batch_fn,
-        inferer=SimpleInferer(),
-        post_transform=train_post_transforms,
-        key_val_metric={val_metric_name: key_val_metric}
-        if not single_output
-        else None,
-        val_handlers=val_handlers,
-        amp=opts.amp
-    )
+    if in_batch:
+        # the lowest val_loss is the best
+        evaluator = SupervisedEvaluatorEx(
+            device=device,
+            val_data_loader=test_loader,
+            network=net,
+            epoch_length=int(opts.n_epoch_len)
+            if opts.n_epoch_len > 1.0
+            else int(opts.n_epoch_len*len(test_loader)),
+            prepare_batch=prepare_batch_fn,
+            inferer=SimpleInfererEx(),
+            postprocessing=None,
+            key_val_metric={"val_loss": Loss(loss, output_transform=lambda x: (x[pred_], x[label_]))},
+            metric_cmp_fn=lambda current, prev: current < prev,
+            val_handlers=val_handlers,
+            amp=opts.amp,
+            decollate=False,
+            custom_keys=cfg.get_keys_dict(),
+        )
+    else:
+        evaluator = SiameseEvaluator(
+            device=device,
+            val_data_loader=test_loader,
+            network=net,
+            loss_function=loss,
+            epoch_length=int(opts.n_epoch_len)
+            if opts.n_epoch_len > 1.0
+            else int(opts.n_epoch_len*len(test_loader)),
+            prepare_batch=prepare_batch_fn,
+            inferer=SimpleInferer(),
+            post_transform=train_post_transforms,
+            key_val_metric={val_metric_name: key_val_metric}
+            if not single_output
+            else None,
+            val_handlers=val_handlers,
+            amp=opts.amp
+        )
 
     if single_output:
         save_handler = ModelCheckpoint(
             dirname=model_dir/'Best_Models',
             filename_prefix='Best',
             n_saved=2,
-            score_function=lambda x: -x[loss_],
+            score_function=(lambda x: -x.state.metrics["val_loss"]) if in_batch else (lambda x: -x[loss_]),
             score_name="val_loss"
         )
         evaluator.add_event_handler(Events.EPOCH_COMPLETED(every=1), save_handler, {'net': net})
@@ -205,25 +234,45 @@ def build_siamese_engine(**kwargs):
         )
     ]
 
-    trainer = SiameseTrainer(
-        device=device,
-        max_epochs=opts.n_epoch,
-        train_data_loader=train_loader,
-        network=net,
-        optimizer=optim,
-        loss_function=loss,
-        epoch_length=int(opts.n_epoch_len)
-        if opts.n_epoch_len > 1.0
-        else int(opts.n_epoch_len * len(train_loader)),
-        prepare_batch=prepare_batch_fn,
-        inferer=SimpleInferer(),
-        post_transform=train_post_transforms,
-        key_train_metric={train_metric_name: key_val_metric}
-        if not single_output
-        else None,
-        train_handlers=train_handlers,
-        amp=opts.amp,
-    )
+    if in_batch:
+        trainer = SupervisedTrainerEx(
+            device=device,
+            max_epochs=opts.n_epoch,
+            train_data_loader=train_loader,
+            network=net,
+            optimizer=optim,
+            loss_function=loss,
+            epoch_length=int(opts.n_epoch_len)
+            if opts.n_epoch_len > 1.0
+            else int(opts.n_epoch_len * len(train_loader)),
+            prepare_batch=prepare_batch_fn,
+            inferer=SimpleInfererEx(),
+            postprocessing=None,
+            train_handlers=train_handlers,
+            amp=opts.amp,
+            decollate=False,
+            custom_keys=cfg.get_keys_dict(),
+        )
+    else:
+        trainer = SiameseTrainer(
+            device=device,
+            max_epochs=opts.n_epoch,
+            train_data_loader=train_loader,
+            network=net,
+            optimizer=optim,
+            loss_function=loss,
+            epoch_length=int(opts.n_epoch_len)
+            if opts.n_epoch_len > 1.0
+            else int(opts.n_epoch_len * len(train_loader)),
+            prepare_batch=prepare_batch_fn,
+            inferer=SimpleInferer(),
+            post_transform=train_post_transforms,
+            key_train_metric={train_metric_name: key_val_metric}
+            if not single_output
+            else None,
+            train_handlers=train_handlers,
+            amp=opts.amp,
+        )
 
     # if opts.early_stop > 0:
     #     early_stopper = EarlyStopping(
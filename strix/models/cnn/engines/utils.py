@@ -1,7 +1,19 @@
 import re
+import math
+import queue
+import logging
+import threading
+from contextlib import nullcontext
+from typing import Optional, Sequence, Tuple, Union
+
 from monai.networks import one_hot
 import torch
+from monai.engines.utils import IterationEvents
 from monai_ex.handlers import from_engine_ex as from_engine
+from monai_ex.utils import ensure_same_dim
+from strix.configures import config as cfg
+from strix.utilities.utils import get_attr_
+from strix.utilities.distributed import get_world_size
 
 def get_best_model(folder, float_regex=r"=(-?\d+\.\d+).pt"):
     models = list(
@@ -87,49 +99,389 @@ def output_onehot_transform(output, n_classes=3, verbose=False):
     return pred_, true_
 
 
+MEMORY_FORMAT_NDIM = {torch.channels_last: 4, torch.channels_last_3d: 5}
+
+
+def _to_device(data, device, non_blocking=False, dtype=None, memory_format=None):
+    # copy first then cast, so the cast runs on device instead of CPU
+    data = data.to(device, non_blocking=non_blocking) if device is not None else data
+    if memory_format is not None and data.ndim == MEMORY_FORMAT_NDIM[memory_format]:
+        data = data.contiguous(memory_format=memory_format)
+    return data.to(dtype) if dtype is not None else data
+
+
+def get_memory_format(opts) -> Optional[torch.memory_format]:
+    """`channels_last` (2D) or `channels_last_3d` (3D) if `memory_format` option is 'channels_last'."""
+    if get_attr_(opts, "memory_format", "contiguous") != "channels_last":
+        return None
+    return torch.channels_last_3d if get_attr_(opts, "tensor_dim", "3D") == "3D" else torch.channels_last
+
+
+class PrepareBatch:
+    """Prepare `(inputs, targets)` of the batch on device.
+
+    Tensors are copied with `non_blocking` (effective with pinned memory), and targets are
+    cast to `target_dtype` after the copy, on device.
+
+    Args:
+        input_keys: key of inputs, or tuple of keys for multi-input networks.
+        target_keys: key of targets, or tuple of keys for multi-output networks.
+            None for unsupervised batch, which targets are None.
+        target_dtype: dtype of targets, keep the original dtype if None.
+        memory_format: memory format of inputs, eg. `torch.channels_last_3d` for
+            the networks converted to channels last. Keep the original format if None.
+    """
+
+    def __init__(
+        self,
+        input_keys: Union[str, Tuple[str, ...]],
+        target_keys: Optional[Union[str, Tuple[str, ...]]] = None,
+        target_dtype: Optional[torch.dtype] = None,
+        memory_format: Optional[torch.memory_format] = None,
+    ):
+        self.input_keys = tuple(input_keys) if isinstance(input_keys, (list, tuple)) else input_keys
+        self.target_keys = tuple(target_keys) if isinstance(target_keys, (list, tuple)) else target_keys
+        self.target_dtype = target_dtype
+        self.memory_format = memory_format
+
+    @property
+    def keys(self) -> Tuple[str, ...]:
+        """All the keys of batch used by this function."""
+        keys = ()
+        for key in (self.input_keys, self.target_keys):
+            if key is not None:
+                keys += key if isinstance(key, tuple) else (key,)
+        return keys
+
+    @staticmethod
+    def _prepare(batchdata, keys, device, non_blocking, dtype=None, memory_format=None):
+        if isinstance(keys, tuple):
+            return tuple(_to_device(batchdata[key], device, non_blocking, dtype, memory_format) for key in keys)
+        return _to_device(batchdata[keys], device, non_blocking, dtype, memory_format)
+
+    def __call__(self, batchdata, device=None, non_blocking=False):
+        inputs = self._prepare(batchdata, self.input_keys, device, non_blocking, memory_format=self.memory_format)
+        if self.target_keys is None:
+            return inputs, None
+        return inputs, self._prepare(batchdata, self.target_keys, device, non_blocking, self.target_dtype)
+
+
 def get_prepare_batch_fn(
     opts, image_key, label_key, multi_input_keys, multi_output_keys
 ): 
-    target_type = torch.FloatTensor
+    target_type = torch.float32
     if opts.criterion in ["BCE", "WBCE", "FocalLoss"]:
-        target_type = torch.FloatTensor
+        target_type = torch.float32
     elif opts.criterion in ["CE", "WCE"]:
-        target_type = torch.LongTensor
+        target_type = torch.long
 
-    if multi_input_keys is not None and multi_output_keys is not None:
-        prepare_batch_fn = lambda x, device, nb: (
-            tuple(x[key].to(device) for key in multi_input_keys),
-            tuple(x[key].type(target_type).to(device) for key in multi_output_keys),
-        )
-    elif multi_input_keys is not None:
-        prepare_batch_fn = lambda x, device, nb: (
-            tuple(x[key].to(device) for key in multi_input_keys),
-            x[label_key].type(target_type).to(device),
-        )
-    elif multi_output_keys is not None:
-        prepare_batch_fn = lambda x, device, nb: (
-            x[image_key].to(device),
-            tuple(x[key].type(target_type).to(device) for key in multi_output_keys),
-        )
-    else:
-        prepare_batch_fn = lambda x, device, nb: (
-            x[image_key].to(device),
-            x[label_key].type(target_type).to(device),
-        )
+    return PrepareBatch(
+        input_keys=multi_input_keys if multi_input_keys is not None else image_key,
+        target_keys=multi_output_keys if multi_output_keys is not None else label_key,
+        target_dtype=target_type,
+        memory_format=get_memory_format(opts),
+    )
+
+
+def get_device_augmented_prepare_batch_fn(prepare_batch_fn, device_augmentor=None):
+    """Apply the on-device augmentations on the batch prepared by `prepare_batch_fn`."""
+    if device_augmentor is None:
+        return prepare_batch_fn
 
-    return prepare_batch_fn
+    input_keys = getattr(prepare_batch_fn, "input_keys", None)
+    target_keys = getattr(prepare_batch_fn, "target_keys", None)
+
+    def _prepare_batch_fn(x, device, nb):
+        inputs, targets = prepare_batch_fn(x, device, nb)
+        return device_augmentor(inputs, targets, input_keys, target_keys)
+
+    return _prepare_batch_fn
 
 
 def get_unsupervised_prepare_batch_fn(opts, image_key, multi_input_keys):
-    if multi_input_keys is not None:
-        prepare_batch_fn = lambda x, device, nb: (
-            tuple(x[key].to(device) for key in multi_input_keys),
-            None,
+    return PrepareBatch(
+        input_keys=multi_input_keys if multi_input_keys is not None else image_key,
+        memory_format=get_memory_format(opts),
+    )
+
+
+class BatchPrefetcher:
+    """Iterate the dataloader while loading the next `num_prefetch` batches in advance.
+
+    On CUDA device, the `keys` of the next batch are copied to device on a side stream,
+    overlapping with the computation of current batch. Otherwise, batches are loaded
+    by a background thread.
+    Other attributes are read from the wrapped dataloader.
+
+    Args:
+        data_loader: dataloader to wrap.
+        device: device to copy the batches on.
+        keys: keys of the batch copied to device, eg. `PrepareBatch.keys`.
+        num_prefetch: num of batches loaded in advance by the background thread.
+    """
+
+    def __init__(self, data_loader, device, keys: Sequence[str], num_prefetch: int = 1):
+        self.data_loader = data_loader
+        self.device = torch.device(device)
+        self.keys = tuple(keys)
+        self.num_prefetch = max(num_prefetch, 1)
+
+    def __len__(self):
+        return len(self.data_loader)
+
+    def __getattr__(self, name):
+        if name == "data_loader":  # not set yet, eg. when unpickling
+            raise AttributeError(name)
+        return getattr(self.data_loader, name)
+
+    def __iter__(self):
+        if self.device.type == "cuda" and torch.cuda.is_available():
+            return self._stream_iter()
+        return self._thread_iter()
+
+    def _stream_iter(self):
+        stream = torch.cuda.Stream(self.device)
+        current_stream = torch.cuda.current_stream(self.device)
+
+        def _load(iterator):
+            batch = next(iterator, None)
+            if batch is not None:
+                with torch.cuda.stream(stream):
+                    for key in self.keys:
+                        if isinstance(batch.get(key), torch.Tensor):
+                            batch[key] = batch[key].to(self.device, non_blocking=True)
+            return batch
+
+        iterator = iter(self.data_loader)
+        next_batch = _load(iterator)
+        while next_batch is not None:
+            current_stream.wait_stream(stream)
+            batch = next_batch
+            for key in self.keys:
+                if isinstance(batch.get(key), torch.Tensor):
+                    batch[key].record_stream(current_stream)
+            next_batch = _load(iterator)
+            yield batch
+
+    def _thread_iter(self):
+        batches, stop, end = queue.Queue(self.num_prefetch), threading.Event(), object()
+
+        def _put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def _load():
+            try:
+                for batch in self.data_loader:
+                    if stop.is_set():
+                        return
+                    _put(batch)
+            except Exception as e:
+                _put(e)
+            _put(end)
+
+        thread = threading.Thread(target=_load, daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is end:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+            thread.join()
+
+
+def attach_prefetcher(engine, prepare_batch_fn, num_prefetch: int = 0):
+    """Prefetch the batches of the engine's dataloader, disabled if `num_prefetch` is 0.
+    Called after the workflow is initialized, which has set up the epoch length and
+    the epoch of distributed sampler from the original dataloader.
+    """
+    if num_prefetch > 0 and isinstance(prepare_batch_fn, PrepareBatch):
+        engine.data_loader = BatchPrefetcher(
+            engine.data_loader, engine.state.device, prepare_batch_fn.keys, num_prefetch
         )
-    else:
-        prepare_batch_fn = lambda x, device, nb: (x[image_key].to(device), None)
+    return engine
+
+
+def _is_oom(e: RuntimeError) -> bool:
+    return "out of memory" in str(e)
+
+
+def _split_batch(data, sizes):
+    # split tensors along batch dim, others (eg. None) are shared by all micro-batches
+    if isinstance(data, torch.Tensor):
+        return data.split(sizes)
+    if isinstance(data, (list, tuple)):
+        return [type(data)(items) for items in zip(*(_split_batch(d, sizes) for d in data))]
+    return [data] * len(sizes)
+
+
+def _cat_batch(outputs):
+    first = outputs[0]
+    if isinstance(first, torch.Tensor):
+        return torch.cat(outputs)
+    if isinstance(first, (list, tuple)):
+        return type(first)(_cat_batch(list(items)) for items in zip(*outputs))
+    return first
+
+
+def _detach(data):
+    if isinstance(data, torch.Tensor):
+        return data.detach()
+    if isinstance(data, (list, tuple)):
+        return type(data)(_detach(d) for d in data)
+    return data
+
+
+class GradientAccumulation:
+    """Process function of the train engines, which accumulates gradients over micro-batches
+    and loader batches. It replaces the iteration of `SupervisedTrainerEx`, and keeps its
+    `prepare_batch` and `ensure_dims` handling of predictions and labels.
+
+    Each loader batch is split into micro-batches of `micro_batch` samples, and the optimizer
+    steps every `accumulation_steps` loader batches, and at the end of each epoch (`epoch_length`).
+    Losses are weighted by the size of micro-batches, so gradients are the same as
+    one batch of all accumulated samples (except for BatchNorm statistics).
+    AMP losses are scaled by the `GradScaler` of the trainer, which steps only with the optimizer.
+    The lr scheduler of epoch is not affected. In distributed training, gradients are
+    synchronized only at the last backward before each optimizer step.
+
+    Args:
+        trainer: `SupervisedTrainerEx` to run.
+        accumulation_steps: num of loader batches per optimizer step.
+        micro_batch: num of samples per forward, the whole loader batch if 0.
+        split_on_oom: halve the micro-batch on out of memory error and retry the loader batch.
+    """
+
+    def __init__(self, trainer, accumulation_steps: int = 1, micro_batch: int = 0, split_on_oom: bool = False):
+        if accumulation_steps < 1:
+            raise ValueError(f"accumulation_steps must be positive, but got {accumulation_steps}")
+        self.trainer = trainer
+        self.accumulation_steps = accumulation_steps
+        self.micro_batch = micro_batch
+        self.split_on_oom = split_on_oom
+        self.n_accumulated = 0
+        self.group_size = accumulation_steps
+        self.logger = logging.getLogger("strix")
+
+    @property
+    def params(self):
+        return [p for group in self.trainer.optimizer.param_groups for p in group["params"]]
+
+    @property
+    def use_scaler(self) -> bool:
+        return bool(self.trainer.amp) and self.trainer.scaler is not None
+
+    def _zero_grad(self):
+        self.trainer.optimizer.zero_grad(set_to_none=self.trainer.optim_set_to_none)
+
+    def _step(self):
+        if self.use_scaler:
+            self.trainer.scaler.step(self.trainer.optimizer)
+            self.trainer.scaler.update()
+        else:
+            self.trainer.optimizer.step()
+
+    def _run(self, inputs, targets, args, kwargs, batch_size: int, last_iteration: bool):
+        trainer = self.trainer
+        micro = self.micro_batch if 0 < self.micro_batch < batch_size else batch_size
+        sizes = [micro] * (batch_size // micro) + ([batch_size % micro] if batch_size % micro else [])
+        is_ddp = isinstance(trainer.network, torch.nn.parallel.DistributedDataParallel)
+
+        preds, loss = [], 0.0
+        for i, (x, y) in enumerate(zip(_split_batch(inputs, sizes), _split_batch(targets, sizes))):
+            weight = sizes[i] / batch_size
+            sync = last_iteration and i == len(sizes) - 1
+            with trainer.network.no_sync() if is_ddp and not sync else nullcontext():
+                with torch.cuda.amp.autocast(enabled=self.use_scaler):
+                    pred = trainer.inferer(x, trainer.network, *args, **kwargs)
+                    if getattr(trainer, "ensure_dims", False):
+                        pred, y = ensure_same_dim(pred, y)
+                    micro_loss = trainer.loss_function(pred, y).mean()
+                scaled_loss = micro_loss * weight / self.group_size
+                (trainer.scaler.scale(scaled_loss) if self.use_scaler else scaled_loss).backward()
+            preds.append(_detach(pred))
+            loss += micro_loss.detach() * weight
+        return _cat_batch(preds), loss
+
+    def __call__(self, engine, batchdata):
+        if batchdata is None:
+            raise ValueError("Must provide batch data for current iteration.")
+        trainer = self.trainer
+        batch = trainer.prepare_batch(batchdata, engine.state.device, engine.non_blocking)
+        inputs, targets, args, kwargs = batch if len(batch) == 4 else (*batch, (), {})
+        batch_size = len(inputs[0] if isinstance(inputs, (list, tuple)) else inputs)
+        engine.state.output = {cfg.get_key("image"): inputs, cfg.get_key("label"): targets}
+
+        trainer.network.train()
+        if self.n_accumulated == 0:
+            self._zero_grad()
+            remaining = engine.state.epoch_length - (engine.state.iteration - 1) % engine.state.epoch_length
+            self.group_size = min(self.accumulation_steps, remaining)
+        last_iteration = self.n_accumulated + 1 == self.group_size
+        snapshot = None
+        if self.split_on_oom and self.n_accumulated > 0:  # to roll back the partial backward
+            snapshot = [None if p.grad is None else p.grad.clone() for p in self.params]
+
+        while True:
+            try:
+                pred, loss = self._run(inputs, targets, args, kwargs, batch_size, last_iteration)
+                break
+            except RuntimeError as e:
+                micro = self.micro_batch if 0 < self.micro_batch < batch_size else batch_size
+                if not (self.split_on_oom and _is_oom(e) and micro > 1):
+                    raise
+                self.micro_batch = micro // 2
+                if snapshot is None:
+                    self.trainer.optimizer.zero_grad(set_to_none=True)
+                else:
+                    for p, grad in zip(self.params, snapshot):
+                        p.grad = None if grad is None else grad.clone()
+                torch.cuda.empty_cache()
+                self.logger.warning(f"Out of memory, split batches into micro-batches of {self.micro_batch}")
+
+        engine.state.output[cfg.get_key("pred")] = pred
+        engine.state.output[cfg.get_key("loss")] = loss
+        engine.fire_event(IterationEvents.FORWARD_COMPLETED)
+        engine.fire_event(IterationEvents.LOSS_COMPLETED)
+        engine.fire_event(IterationEvents.BACKWARD_COMPLETED)
+
+        self.n_accumulated += 1
+        if last_iteration:
+            self._step()
+            self.n_accumulated = 0
+        engine.fire_event(IterationEvents.MODEL_COMPLETED)
+        return engine.state.output
+
+
+def get_accumulation_steps(opts) -> int:
+    """Num of loader batches per optimizer step, from `effective_batch` (over all processes)
+    or `accumulation_steps` option.
+    """
+    effective_batch = get_attr_(opts, "effective_batch", 0)
+    if effective_batch:
+        return max(math.ceil(effective_batch / (opts.n_batch * get_world_size())), 1)
+    return max(get_attr_(opts, "accumulation_steps", 1), 1)
+
 
-    return prepare_batch_fn
+def attach_gradient_accumulation(engine, opts):
+    """Replace the iteration of train engine by `GradientAccumulation` if it's enabled by the options.
+    Called after the workflow is initialized.
+    """
+    accumulation_steps = get_accumulation_steps(opts)
+    micro_batch = get_attr_(opts, "micro_batch", 0)
+    split_on_oom = get_attr_(opts, "split_on_oom", False)
+    if accumulation_steps > 1 or micro_batch > 0 or split_on_oom:
+        engine._process_function = GradientAccumulation(engine, accumulation_steps, micro_batch, split_on_oom)
+    return engine
 
 
 def get_dice_metric_transform_fn(output_nc, pred_key, label_key, decollate):
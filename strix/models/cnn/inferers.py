@@ -0,0 +1,537 @@
+"""
+Inferers of large volumes which skip the background.
+
+Large volumes (eg. whole-body CT) are mostly background. `ROISlidingWindowInferer` computes
+a foreground mask from an intensity threshold of the image, or from a coarse prediction of
+the whole image downsampled to one window. Only the windows near the mask are predicted,
+the others are filled with the background logits.
+
+`CascadeInferer` predicts the downsampled image first, then runs the sliding window
+inference at full resolution only inside the bounding boxes of the coarse foreground.
+
+`TTAInferer` wraps any of them with batched test-time augmentation.
+
+`AutocastInferer` runs any of them in bfloat16 autocast, on CPU or GPU, which the float16
+AMP of engines doesn't cover.
+"""
+import logging
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from scipy import ndimage
+from monai.data.utils import compute_importance_map, dense_patch_slices, get_valid_patch_size
+from monai.inferers import Inferer
+from monai.inferers.utils import _get_scan_interval
+from monai.utils import BlendMode, fall_back_tuple
+
+from strix.utilities.utils import bbox_2D, bbox_3D, get_attr_
+
+# num of windows in a batch if it's not sized by device memory
+MAX_SW_BATCH_SIZE = 32
+
+
+def _is_oom(e: RuntimeError) -> bool:
+    return "out of memory" in str(e)
+
+
+def expand_window(window: Sequence[slice], margin: int) -> Tuple[slice, ...]:
+    """Spatial window expanded by `margin` voxels on each side, clipped at 0."""
+    return tuple(slice(max(s.start - margin, 0), s.stop + margin) for s in window)
+
+
+def threshold_foreground(inputs: torch.Tensor, threshold: float) -> torch.Tensor:
+    """Foreground mask of voxels brighter than `threshold` in any channel."""
+    return (inputs > threshold).any(dim=1, keepdim=True)
+
+
+def coarse_foreground(
+    inputs: torch.Tensor, roi_size: Sequence[int], predictor: Callable, *args, **kwargs
+) -> torch.Tensor:
+    """Foreground mask from the prediction of the image downsampled to `roi_size`,
+    non-background voxels of the prediction are foreground.
+    """
+    mode = ("linear", "bilinear", "trilinear")[inputs.ndim - 3]
+    coarse = F.interpolate(inputs.float(), size=tuple(roi_size), mode=mode, align_corners=False)
+    pred = predictor(coarse.to(inputs.dtype), *args, **kwargs)
+    pred = pred[0] if isinstance(pred, (list, tuple)) else pred
+    mask = pred > 0 if pred.shape[1] == 1 else pred.argmax(dim=1, keepdim=True) > 0
+    return F.interpolate(mask.float(), size=inputs.shape[2:], mode="nearest") > 0
+
+
+def background_logits(n_channels: int, background: Optional[Sequence[float]] = None, device=None) -> torch.Tensor:
+    """Logits of each channel predicted as background, defaults to -10 for single channel output,
+    or 10 for the first (background) channel and -10 for the others.
+    """
+    if background is None:
+        background = [-10.0] if n_channels == 1 else [10.0] + [-10.0] * (n_channels - 1)
+    if len(background) != n_channels:
+        raise ValueError(f"Got {len(background)} background logits for {n_channels} output channels")
+    return torch.tensor(list(background), dtype=torch.float32, device=device)
+
+
+def foreground_boxes(mask: np.ndarray, margin: int = 0) -> List[Tuple[slice, ...]]:
+    """Bounding boxes of the connected components of the mask, expanded by `margin` voxels.
+    Overlapping boxes are merged.
+    """
+    labels, n_components = ndimage.label(mask)
+    bbox_fn = bbox_3D if mask.ndim == 3 else bbox_2D
+    boxes = []
+    for i in range(1, n_components + 1):
+        bbox = bbox_fn(labels == i)
+        boxes.append(
+            [[max(bbox[2 * k] - margin, 0), min(bbox[2 * k + 1] + 1 + margin, mask.shape[k])] for k in range(mask.ndim)]
+        )
+
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                if all(a[0] < b[1] and b[0] < a[1] for a, b in zip(boxes[i], boxes[j])):
+                    boxes[i] = [[min(a[0], b[0]), max(a[1], b[1])] for a, b in zip(boxes[i], boxes[j])]
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(slice(int(start), int(stop)) for start, stop in box) for box in boxes]
+
+
+class ROISlidingWindowInferer(Inferer):
+    """Sliding window inference with importance blending, foreground window skipping,
+    and patch batches sized to device memory.
+
+    Args:
+        roi_size: window size.
+        sw_batch_size: num of windows in one forward. If 0, it's estimated from the free memory
+            of CUDA device by the first window, and halved on out of memory error.
+        overlap: overlap ratio of windows.
+        mode: blending mode of overlapped windows, 'constant' or 'gaussian'.
+        sigma_scale: std of the gaussian importance map, relative to `roi_size`.
+        fg_threshold: windows without voxels brighter than it are skipped.
+        coarse: compute the foreground mask by a coarse prediction of the downsampled image.
+        fg_margin: windows within `fg_margin` voxels to the foreground are kept.
+        background: logits of each output channel filled in the skipped windows,
+            see `background_logits`.
+        sw_device: device of windows fed to the network, defaults to the device of inputs.
+        device: device where the output is accumulated, defaults to the device of inputs.
+            Use 'cpu' to keep the GPU memory independent of the image size.
+    """
+
+    def __init__(
+        self,
+        roi_size: Union[Sequence[int], int],
+        sw_batch_size: int = 1,
+        overlap: float = 0.25,
+        mode: Union[BlendMode, str] = BlendMode.GAUSSIAN,
+        sigma_scale: Union[Sequence[float], float] = 0.125,
+        fg_threshold: Optional[float] = None,
+        coarse: bool = False,
+        fg_margin: int = 0,
+        background: Optional[Sequence[float]] = None,
+        sw_device: Optional[Union[torch.device, str]] = None,
+        device: Optional[Union[torch.device, str]] = None,
+    ) -> None:
+        Inferer.__init__(self)
+        if not 0 <= overlap < 1:
+            raise ValueError(f"overlap must be >= 0 and < 1, but got {overlap}")
+        if sw_batch_size < 0:
+            raise ValueError(f"sw_batch_size must be non-negative, but got {sw_batch_size}")
+        self.roi_size = roi_size
+        self.sw_batch_size = sw_batch_size
+        self.overlap = overlap
+        self.mode = BlendMode(mode)
+        self.sigma_scale = sigma_scale
+        self.fg_threshold = fg_threshold
+        self.coarse = coarse
+        self.fg_margin = fg_margin
+        self.background = background
+        self.sw_device = sw_device
+        self.device = device
+        self.n_skipped = self.n_windows = self.n_channels = 0  # of the last call
+
+    def foreground(self, inputs: torch.Tensor, roi_size: Sequence[int], network: Callable, *args, **kwargs):
+        """Foreground mask of inputs, None if windows are not skipped."""
+        mask = None
+        if self.fg_threshold is not None:
+            mask = threshold_foreground(inputs, self.fg_threshold)
+        if self.coarse:
+            coarse_mask = coarse_foreground(inputs, roi_size, network, *args, **kwargs)
+            mask = coarse_mask if mask is None else mask & coarse_mask
+        return mask
+
+    def _auto_batch_size(self, window_bytes: int, n_windows: int, device: torch.device) -> int:
+        if device.type != "cuda":
+            return min(MAX_SW_BATCH_SIZE, n_windows)
+        free, _ = torch.cuda.mem_get_info(device)
+        return max(1, min(int(0.8 * free / max(window_bytes, 1)), MAX_SW_BATCH_SIZE, n_windows))
+
+    def _predict(self, network, windows: torch.Tensor, *args, **kwargs) -> torch.Tensor:
+        pred = network(windows, *args, **kwargs)
+        return pred[0] if isinstance(pred, (list, tuple)) else pred  # eg. deep supervision
+
+    def _predict_windows(self, inputs, windows, network, *args, **kwargs):
+        """Yield (windows of this batch, predictions), batches are halved on OOM if auto sized."""
+        sw_device = torch.device(self.sw_device) if self.sw_device is not None else inputs.device
+        batch_size, pos = self.sw_batch_size, 0
+        while pos < len(windows):
+            if batch_size == 0:  # probe the memory cost by one window
+                size = 1
+                if sw_device.type == "cuda":
+                    torch.cuda.reset_peak_memory_stats(sw_device)
+                    start = torch.cuda.memory_allocated(sw_device)
+            else:
+                size = batch_size
+            batch = windows[pos : pos + size]
+            try:
+                data = torch.cat([inputs[w] for w in batch]).to(sw_device)
+                pred = self._predict(network, data, *args, **kwargs)
+            except RuntimeError as e:
+                if not (self.sw_batch_size == 0 and _is_oom(e) and size > 1):
+                    raise
+                batch_size = size // 2
+                torch.cuda.empty_cache()
+                logging.getLogger("strix").warning(f"Out of memory, reduce sliding window batch to {batch_size}")
+                continue
+            if batch_size == 0:
+                cost = torch.cuda.max_memory_allocated(sw_device) - start if sw_device.type == "cuda" else 0
+                batch_size = self._auto_batch_size(cost, len(windows), sw_device)
+            pos += len(batch)
+            yield batch, pred
+
+    def __call__(self, inputs: torch.Tensor, network: Callable, *args, **kwargs) -> torch.Tensor:
+        n_dims = inputs.ndim - 2
+        device = torch.device(self.device) if self.device is not None else inputs.device
+        image_size_ = list(inputs.shape[2:])
+        roi_size = fall_back_tuple(self.roi_size, image_size_)
+
+        # pad image smaller than roi size
+        image_size = tuple(max(image_size_[i], roi_size[i]) for i in range(n_dims))
+        pad_size: List[int] = []
+        for k in range(n_dims - 1, -1, -1):
+            diff = max(roi_size[k] - image_size_[k], 0)
+            pad_size.extend([diff // 2, diff - diff // 2])
+        inputs = F.pad(inputs, pad=pad_size)
+
+        with torch.no_grad():
+            mask = self.foreground(inputs, roi_size, network, *args, **kwargs)
+
+        scan_interval = _get_scan_interval(image_size, roi_size, n_dims, self.overlap)
+        slices = dense_patch_slices(image_size, roi_size, scan_interval)
+        windows: List[Tuple[slice, ...]] = []
+        for b in range(inputs.shape[0]):
+            for s in slices:
+                window = (slice(b, b + 1), slice(None)) + tuple(s)
+                if mask is None or mask[(b, slice(None)) + expand_window(s, self.fg_margin)].any():
+                    windows.append(window)
+        self.n_windows, self.n_skipped = len(slices) * inputs.shape[0], len(slices) * inputs.shape[0] - len(windows)
+
+        importance_map = compute_importance_map(
+            get_valid_patch_size(image_size, roi_size), mode=self.mode, sigma_scale=self.sigma_scale, device=device
+        )
+        output = count = None
+        for batch, pred in self._predict_windows(inputs, windows, network, *args, **kwargs):
+            pred = pred.to(device)
+            if output is None:
+                shape = [inputs.shape[0], pred.shape[1], *image_size]
+                output = torch.zeros(shape, dtype=torch.float32, device=device)
+                count = torch.zeros([inputs.shape[0], 1, *image_size], dtype=torch.float32, device=device)
+            for window, window_pred in zip(batch, pred):
+                output[window] += importance_map * window_pred
+                count[window] += importance_map
+
+        if output is None:  # no foreground at all, probe the num of output channels
+            with torch.no_grad():
+                n_channels = self._predict(network, inputs[(slice(0, 1), slice(None)) + tuple(slices[0])]).shape[1]
+            output = torch.zeros([inputs.shape[0], n_channels, *image_size], dtype=torch.float32, device=device)
+            count = torch.zeros([inputs.shape[0], 1, *image_size], dtype=torch.float32, device=device)
+
+        self.n_channels = output.shape[1]
+        covered = count > 0
+        output = torch.where(
+            covered,
+            output / count.clamp(min=torch.finfo(count.dtype).tiny),
+            background_logits(output.shape[1], self.background, device).view(1, -1, *([1] * n_dims)),
+        )
+
+        crop = [slice(None), slice(None)]
+        for k in range(n_dims):
+            pad = pad_size[(n_dims - 1 - k) * 2]
+            crop.append(slice(pad, pad + image_size_[k]))
+        return output[tuple(crop)]
+
+
+def get_sliding_window_inferer(opts, roi_size: Sequence[int]) -> ROISlidingWindowInferer:
+    """Sliding window inferer configured by the `sw_*` options of `test-from-cfg`."""
+    return ROISlidingWindowInferer(
+        roi_size=roi_size,
+        sw_batch_size=get_attr_(opts, "sw_batch_size", opts.n_batch),
+        overlap=get_attr_(opts, "sw_overlap", 0.5),
+        mode=get_attr_(opts, "sw_mode", BlendMode.GAUSSIAN.value),
+        fg_threshold=get_attr_(opts, "sw_fg_threshold", None),
+        coarse=get_attr_(opts, "sw_coarse", False),
+        fg_margin=get_attr_(opts, "sw_margin", 0),
+        device="cpu" if get_attr_(opts, "sw_cpu_output", False) else None,
+    )
+
+
+class CascadeInferer(Inferer):
+    """Coarse-to-fine inference. The image is downsampled by `scale` and predicted by the
+    coarse network, then the full resolution image is predicted by `inferer` only inside
+    the bounding boxes of the coarse foreground, the rest is background.
+
+    Args:
+        inferer: inferer of the full resolution ROIs, eg. `ROISlidingWindowInferer`.
+        roi_size: window size of the sliding window inference on the downsampled image.
+        scale: downsampling factor of the coarse pass.
+        margin: the bounding boxes are expanded by `margin` voxels at full resolution.
+        coarse_network: network trained on downsampled images, defaults to the network of
+            fine inference.
+        background: logits of each output channel out of the ROIs, see `background_logits`.
+    """
+
+    def __init__(
+        self,
+        inferer: Callable,
+        roi_size: Sequence[int],
+        scale: float = 0.25,
+        margin: int = 16,
+        coarse_network: Optional[Callable] = None,
+        background: Optional[Sequence[float]] = None,
+    ) -> None:
+        Inferer.__init__(self)
+        if not 0 < scale <= 1:
+            raise ValueError(f"scale must be in (0, 1], but got {scale}")
+        self.inferer = inferer
+        self.coarse_inferer = ROISlidingWindowInferer(roi_size, sw_batch_size=0, overlap=0.25)
+        self.scale = scale
+        self.margin = margin
+        self.coarse_network = coarse_network
+        self.background = background
+        self.boxes: List[List[Tuple[slice, ...]]] = []  # of the last call
+
+    def coarse_mask(self, inputs: torch.Tensor, network: Callable, *args, **kwargs) -> torch.Tensor:
+        """Foreground mask of the coarse prediction, at full resolution."""
+        mode = ("linear", "bilinear", "trilinear")[inputs.ndim - 3]
+        size = [max(int(round(s * self.scale)), 1) for s in inputs.shape[2:]]
+        coarse = F.interpolate(inputs.float(), size=size, mode=mode, align_corners=False).to(inputs.dtype)
+        pred = self.coarse_inferer(coarse, self.coarse_network or network, *args, **kwargs)
+        mask = pred > 0 if pred.shape[1] == 1 else pred.argmax(dim=1, keepdim=True) > 0
+        return F.interpolate(mask.float(), size=inputs.shape[2:], mode="nearest") > 0
+
+    def __call__(self, inputs: torch.Tensor, network: Callable, *args, **kwargs) -> torch.Tensor:
+        with torch.no_grad():
+            mask = self.coarse_mask(inputs, network, *args, **kwargs).cpu().numpy()
+
+        output, self.boxes = None, []
+        for b in range(inputs.shape[0]):
+            boxes = foreground_boxes(mask[b, 0], self.margin) if mask[b].any() else []
+            self.boxes.append(boxes)
+            for box in boxes:
+                roi = (slice(b, b + 1), slice(None)) + box
+                pred = self.inferer(inputs[roi], network, *args, **kwargs)
+                if output is None:
+                    output = background_logits(pred.shape[1], self.background, pred.device)
+                    output = output.view(1, -1, *([1] * (inputs.ndim - 2))).repeat(
+                        inputs.shape[0], 1, *inputs.shape[2:]
+                    )
+                output[roi] = pred.to(output.dtype)
+
+        if output is None:  # no foreground at all
+            n_channels = self.coarse_inferer.n_channels
+            output = background_logits(n_channels, self.background, inputs.device)
+            output = output.view(1, -1, *([1] * (inputs.ndim - 2))).repeat(inputs.shape[0], 1, *inputs.shape[2:])
+        return output
+
+
+def get_cascade_inferer(opts, roi_size: Sequence[int], coarse_network: Optional[Callable] = None) -> CascadeInferer:
+    """Cascade inferer configured by the `cascade_*` options of `test-from-cfg`."""
+    return CascadeInferer(
+        get_sliding_window_inferer(opts, roi_size),
+        roi_size,
+        scale=get_attr_(opts, "cascade_scale", 0.25),
+        margin=get_attr_(opts, "cascade_margin", 16),
+        coarse_network=coarse_network,
+    )
+
+
+TTA_MODES = ("flip", "rot90", "flip+rot90")
+
+
+def tta_variants(n_dims: int, mode: str = "flip") -> List[Tuple[Tuple[int, ...], int]]:
+    """Spatial transforms of TTA, as (flipped spatial axes, num of rot90 in the plane of the last two axes).
+
+    `flip` flips over each non-empty subset of axes, `rot90` rotates by 90, 180 and 270 degrees,
+    `flip+rot90` combines them, without duplicates. Identity is always the first one.
+    """
+    if mode not in TTA_MODES:
+        raise ValueError(f"TTA mode must be in {TTA_MODES}, but got '{mode}'")
+    flips = [()]
+    if "flip" in mode:
+        flips = [tuple(a for a in range(n_dims) if i >> a & 1) for i in range(2 ** n_dims)]
+    rotations = [0, 1, 2, 3] if "rot90" in mode else [0]
+
+    variants, seen = [], set()
+    probe = torch.arange(4 ** n_dims).view((4,) * n_dims)
+    for k in rotations:
+        for axes in flips:
+            key = tuple(_transform(probe, axes, k, 0).flatten().tolist())
+            if key not in seen:
+                seen.add(key)
+                variants.append((axes, k))
+    return variants
+
+
+def _transform(data: torch.Tensor, axes: Sequence[int], k: int, offset: int = 2) -> torch.Tensor:
+    if axes:
+        data = torch.flip(data, [a + offset for a in axes])
+    return torch.rot90(data, k, dims=(data.ndim - 2, data.ndim - 1)) if k else data
+
+
+def _invert(data: torch.Tensor, axes: Sequence[int], k: int) -> torch.Tensor:
+    if k:
+        data = torch.rot90(data, -k, dims=(data.ndim - 2, data.ndim - 1))
+    return torch.flip(data, [a + 2 for a in axes]) if axes else data
+
+
+class TTAInferer(Inferer):
+    """Test-time augmentation with flips and rot90s, applied around the network so it
+    composes with any inferer (eg. each batch of sliding windows) and ensemble networks.
+
+    The variants of a batch are concatenated along the batch dim and predicted in one forward.
+    The predictions are transformed back on device and averaged as they are produced.
+    Outputs without spatial dims (eg. classification) are averaged directly.
+
+    Args:
+        inferer: inferer to wrap, eg. `SimpleInferer` or `ROISlidingWindowInferer`.
+        mode: 'flip', 'rot90' or 'flip+rot90', see `tta_variants`.
+        max_batch: max size of the concatenated batch, unlimited if 0.
+            It's halved on out of memory error.
+    """
+
+    def __init__(self, inferer: Callable, mode: str = "flip", max_batch: int = 0) -> None:
+        Inferer.__init__(self)
+        self.inferer = inferer
+        self.mode = mode
+        self.max_batch = max_batch
+        tta_variants(2, mode)  # check mode
+
+    def _predict(self, network: Callable, data: torch.Tensor, *args, **kwargs):
+        pred = network(data, *args, **kwargs)
+        return pred[0] if isinstance(pred, (list, tuple)) else pred
+
+    def _run(self, network: Callable, variants: List, inputs: torch.Tensor, *args, **kwargs) -> torch.Tensor:
+        """Sum of the inverted predictions of `variants`, all of the same shape."""
+        n = inputs.shape[0]
+        chunk = max(len(variants) if not self.max_batch else self.max_batch // n, 1)
+        total, pos = None, 0
+        while pos < len(variants):
+            group = variants[pos : pos + chunk]
+            try:
+                data = torch.cat([_transform(inputs, axes, k) for axes, k in group])
+                preds = self._predict(network, data, *args, **kwargs)
+            except RuntimeError as e:
+                if not (_is_oom(e) and chunk > 1):
+                    raise
+                chunk //= 2
+                torch.cuda.empty_cache()
+                logging.getLogger("strix").warning(f"Out of memory, reduce TTA variants per forward to {chunk}")
+                continue
+            for i, (axes, k) in enumerate(group):
+                pred = preds[i * n : (i + 1) * n].float()
+                pred = _invert(pred, axes, k) if pred.ndim == inputs.ndim else pred
+                total = pred if total is None else total + pred
+            pos += len(group)
+        return total
+
+    def _tta_forward(self, network: Callable, inputs: torch.Tensor, *args, **kwargs) -> torch.Tensor:
+        variants = tta_variants(inputs.ndim - 2, self.mode)
+        by_shape = {}  # rot90 of non-square planes changes the shape
+        for axes, k in variants:
+            by_shape.setdefault(k % 2 == 1 and inputs.shape[-1] != inputs.shape[-2], []).append((axes, k))
+        total = None
+        for group in by_shape.values():
+            pred = self._run(network, group, inputs, *args, **kwargs)
+            total = pred if total is None else total + pred
+        return total / len(variants)
+
+    def __call__(self, inputs: torch.Tensor, network: Callable, *args, **kwargs) -> torch.Tensor:
+        return self.inferer(inputs, lambda x, *a, **kw: self._tta_forward(network, x, *a, **kw), *args, **kwargs)
+
+
+def get_tta_inferer(opts, inferer: Callable) -> Callable:
+    """Wrap the inferer by TTA if `tta` option of `test-from-cfg` is set."""
+    mode = get_attr_(opts, "tta", None)
+    if not mode or mode == "none":
+        return inferer
+    return TTAInferer(inferer, mode, max_batch=get_attr_(opts, "tta_batch", 0))
+
+
+PRECISIONS = ("fp32", "fp16", "bf16")
+
+
+def get_precision(opts, device: Union[torch.device, str]) -> str:
+    """Precision of the engines on `device`, from `precision` option or `amp` flag (fp16).
+
+    fp16 is not supported by autocast on CPU, bf16 is used instead.
+    bf16 falls back to fp16 on GPUs without bf16 support.
+    """
+    precision = get_attr_(opts, "precision", None) or ("fp16" if get_attr_(opts, "amp", False) else "fp32")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Precision must be in {PRECISIONS}, but got '{precision}'")
+
+    device = torch.device(device)
+    if precision == "fp16" and device.type != "cuda":
+        logging.getLogger("strix").warning("fp16 autocast is not supported on CPU, use bf16 instead")
+        precision = "bf16"
+    elif precision == "bf16" and device.type == "cuda" and not torch.cuda.is_bf16_supported():
+        logging.getLogger("strix").warning("bf16 is not supported by this GPU, use fp16 instead")
+        precision = "fp16"
+    return precision
+
+
+def is_engine_amp(opts, device: Union[torch.device, str]) -> bool:
+    """fp16 on GPU runs by the AMP of engines, with autocast and `GradScaler`."""
+    return get_precision(opts, device) == "fp16"
+
+
+def _to_float(outputs):
+    if isinstance(outputs, torch.Tensor):
+        return outputs.float() if outputs.is_floating_point() else outputs
+    if isinstance(outputs, (list, tuple)):
+        return type(outputs)(_to_float(o) for o in outputs)
+    if isinstance(outputs, dict):
+        return {k: _to_float(v) for k, v in outputs.items()}
+    return outputs
+
+
+class AutocastInferer(Inferer):
+    """Run the wrapped inferer in autocast of `dtype`, outputs are cast back to float32
+    so the losses, metrics and post transforms run in full precision.
+    bfloat16 has the range of float32, so gradients don't need `GradScaler`.
+
+    Args:
+        inferer: inferer to wrap.
+        device_type: 'cuda' or 'cpu'.
+        dtype: dtype of autocast, eg. `torch.bfloat16`.
+    """
+
+    def __init__(self, inferer: Callable, device_type: str = "cpu", dtype: torch.dtype = torch.bfloat16) -> None:
+        Inferer.__init__(self)
+        self.inferer = inferer
+        self.device_type = device_type
+        self.dtype = dtype
+
+    def __call__(self, inputs: torch.Tensor, network: Callable, *args, **kwargs):
+        with torch.autocast(self.device_type, dtype=self.dtype):
+            outputs = self.inferer(inputs, network, *args, **kwargs)
+        return _to_float(outputs)
+
+
+def get_precision_inferer(opts, inferer: Callable, device: Union[torch.device, str]) -> Callable:
+    """Wrap the inferer by bf16 autocast if `precision` is bf16, fp16 is left to the engines."""
+    if get_precision(opts, device) != "bf16":
+        return inferer
+    return AutocastInferer(inferer, torch.device(device).type, torch.bfloat16)
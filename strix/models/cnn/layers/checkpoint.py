@@ -0,0 +1,118 @@
+"""
+Segment-wise activation checkpointing of the stages of networks.
+
+The stages (eg. the encoder or decoder blocks of a UNet) are divided into `segments` runs of
+consecutive stages. In training, only the outputs of the segments are kept for backward,
+the activations inside each segment are recomputed during backward. It trades one more
+forward of the stages for the memory of their intermediate activations (conv, norm and
+activation outputs), so larger 3D crops or batches fit on the same GPU.
+
+BatchNorm running stats are restored after the recomputation, so they are updated once per
+forward as without checkpointing.
+"""
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import torch
+from torch.nn.modules.batchnorm import _BatchNorm
+from torch.utils.checkpoint import checkpoint
+
+
+def segment_bounds(n_stages: int, segments: int) -> List[Tuple[int, int]]:
+    """Split `n_stages` into `segments` runs of (nearly) equal length, as `(start, end)`."""
+    segments = max(min(segments, n_stages), 1)
+    size, remainder = divmod(n_stages, segments)
+    bounds, start = [], 0
+    for i in range(segments):
+        end = start + size + (i < remainder)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def _copy(x: Any) -> Any:
+    # stages may modify list inputs in place (eg. HRNet modules), which breaks recomputation
+    return list(x) if isinstance(x, list) else x
+
+
+def _call(stage: Callable, x: Any, skip: Any = None) -> Any:
+    return stage(_copy(x)) if skip is None else stage(_copy(x), skip)
+
+
+@contextmanager
+def _keep_running_stats(stages: Sequence[Callable]):
+    # the recomputation runs the norm layers in training mode again, restore their running stats after it
+    norms = [
+        m
+        for stage in stages
+        if isinstance(stage, torch.nn.Module)
+        for m in stage.modules()
+        if isinstance(m, _BatchNorm) and m.training and m.track_running_stats
+    ]
+    stats = [(m.running_mean.clone(), m.running_var.clone(), m.num_batches_tracked.clone()) for m in norms]
+    try:
+        yield
+    finally:
+        with torch.no_grad():
+            for m, (mean, var, n_tracked) in zip(norms, stats):
+                m.running_mean.copy_(mean)
+                m.running_var.copy_(var)
+                m.num_batches_tracked.copy_(n_tracked)
+
+
+def _segment_fn(stages: Sequence[Callable], keep_outputs: bool) -> Callable:
+    n_calls = 0
+
+    def run(x, *skips):
+        nonlocal n_calls
+        n_calls += 1
+        outputs = []
+        with _keep_running_stats(stages) if n_calls > 1 else nullcontext():
+            for stage, skip in zip(stages, skips):
+                x = _call(stage, x, skip)
+                if keep_outputs:
+                    outputs.append(x)
+        return tuple(outputs) if keep_outputs else x
+
+    return run
+
+
+def is_checkpointing(module: torch.nn.Module, segments: int) -> bool:
+    return segments > 0 and module.training and torch.is_grad_enabled()
+
+
+def checkpoint_stages(
+    stages: Sequence[Callable],
+    x: Any,
+    segments: int = 0,
+    skips: Optional[Sequence[Any]] = None,
+    keep_outputs: bool = True,
+) -> Any:
+    """Run `stages` one after another, `stage(x)` or `stage(x, skip)` if its skip is not None.
+
+    Args:
+        stages: modules of the stages.
+        x: input of the first stage.
+        segments: num of checkpointed segments, run without checkpointing if 0.
+        skips: second input of each stage, eg. the encoder features of UNet decoder blocks.
+        keep_outputs: return the outputs of all stages (eg. encoder features for skip connections),
+            else only the output of the last stage.
+    """
+    skips = [None] * len(stages) if skips is None else list(skips)
+    if segments <= 0:
+        outputs = []
+        for stage, skip in zip(stages, skips):
+            x = _call(stage, x, skip)
+            outputs.append(x)
+        return outputs if keep_outputs else x
+
+    outputs = []
+    for start, end in segment_bounds(len(stages), segments):
+        run = _segment_fn(stages[start:end], keep_outputs)
+        out = checkpoint(run, x, *skips[start:end], use_reentrant=False)
+        if keep_outputs:
+            outputs.extend(out)
+            x = out[-1]
+        else:
+            x = out
+    return outputs if keep_outputs else x
@@ -0,0 +1,134 @@
+"""
+Ensemble of the networks trained in cross-validation, computed in a single forward.
+
+The K folds share the same architecture, so their parameters are stacked and the K networks
+run as one vectorized call (`functorch.vmap`). Predictions are reduced to the ensemble
+on the fly, group by group, so at most `group_size` predictions exist at the same time.
+With sliding window inference, only the windows of K predictions are held instead of
+K full resolution maps.
+"""
+import copy
+import logging
+from typing import Callable, Optional, Sequence
+
+import torch
+from torch import nn
+
+try:
+    from functorch import combine_state_for_ensemble, vmap
+except ImportError:  # torch<1.13
+    combine_state_for_ensemble = vmap = None
+
+ENSEMBLE_MODES = ("mean", "vote")
+
+
+def _map_outputs(fn: Callable, *outputs):
+    # apply on each output of multi-output networks
+    if isinstance(outputs[0], (list, tuple)):
+        return type(outputs[0])(_map_outputs(fn, *items) for items in zip(*outputs))
+    return fn(*outputs)
+
+
+def _votes(logits: torch.Tensor) -> torch.Tensor:
+    if logits.shape[1] == 1:  # binary, channel first
+        return (logits > 0).to(logits.dtype)
+    return nn.functional.one_hot(logits.argmax(1), logits.shape[1]).movedim(-1, 1).to(logits.dtype)
+
+
+class StackedEnsemble(nn.Module):
+    """K independent copies of `net`, which forward returns the ensemble of their predictions.
+
+    `mean` mode returns the weighted mean of the logits, as `MeanEnsembleD`.
+    `vote` mode returns the weighted fraction of votes of each class (minus 0.5 for binary
+    output), so the activations and discretization of the post transforms give the
+    majority vote, as `VoteEnsembleD`.
+
+    Args:
+        net: network of one fold, copied K times.
+        n_models: num of models K.
+        weights: weight of each model, eg. its validation metric. Defaults to equal weights.
+        mode: 'mean' or 'vote'.
+        group_size: num of models vectorized in one call, all models if 0.
+            Models run one by one if 1 or `functorch` is not available.
+    """
+
+    def __init__(
+        self,
+        net: nn.Module,
+        n_models: int,
+        weights: Optional[Sequence[float]] = None,
+        mode: str = "mean",
+        group_size: int = 0,
+    ) -> None:
+        super().__init__()
+        if mode not in ENSEMBLE_MODES:
+            raise ValueError(f"Ensemble mode must be in {ENSEMBLE_MODES}, but got '{mode}'")
+        if weights is not None and len(weights) != n_models:
+            raise ValueError(f"Got {len(weights)} weights for {n_models} models")
+
+        self.models = nn.ModuleList([copy.deepcopy(net) for _ in range(n_models)])
+        weights = torch.ones(n_models) if weights is None else torch.as_tensor(weights, dtype=torch.float)
+        self.register_buffer("weights", weights / weights.sum())
+        self.mode = mode
+        self.group_size = n_models if group_size <= 0 else min(group_size, n_models)
+        self.vectorize = vmap is not None and self.group_size > 1
+        self._stacked = None
+
+    def _groups(self):
+        indices = list(range(len(self.models)))
+        return [indices[i : i + self.group_size] for i in range(0, len(indices), self.group_size)]
+
+    def _state_key(self):
+        # changed by loading checkpoints (in-place copy) or moving to another device
+        return tuple((t._version, t.data_ptr()) for t in list(self.models.parameters()) + list(self.models.buffers()))
+
+    def _stacked_groups(self):
+        key = self._state_key()
+        if self._stacked is None or self._stacked[0] != key:
+            with torch.no_grad():
+                groups = [combine_state_for_ensemble([self.models[i] for i in group]) for group in self._groups()]
+            self._stacked = (key, groups)
+        return self._stacked[1]
+
+    def _add(self, total, output, weight):
+        def _add_pred(t, o):
+            pred = (o if self.mode == "mean" else _votes(o)) * weight.to(o.dtype)
+            return pred if t is None else t + pred
+
+        if total is None:
+            return _map_outputs(lambda o: _add_pred(None, o), output)
+        return _map_outputs(_add_pred, total, output)
+
+    def _forward_sequential(self, inputs):
+        total = None
+        for model, weight in zip(self.models, self.weights):
+            total = self._add(total, model(*inputs), weight)
+        return total
+
+    def _forward_vectorized(self, inputs):
+        total = None
+        for group, (fmodel, params, buffers) in zip(self._groups(), self._stacked_groups()):
+            outputs = vmap(fmodel, in_dims=(0, 0) + (None,) * len(inputs))(params, buffers, *inputs)
+            for k, i in enumerate(group):
+                total = self._add(total, _map_outputs(lambda o: o[k], outputs), self.weights[i])
+            del outputs
+        return total
+
+    def _finalize(self, output):
+        if self.mode == "vote" and output.shape[1] == 1:
+            return output - 0.5  # majority if > 0
+        return output
+
+    def forward(self, *inputs):
+        if self.training:
+            raise RuntimeError("StackedEnsemble is only for inference, call `eval()` first")
+        if self.vectorize:
+            try:
+                output = self._forward_vectorized(inputs)
+            except RuntimeError as e:  # ops without batching rule
+                logging.getLogger("strix").warning(f"Vectorized ensemble failed ({e}), run models one by one")
+                self.vectorize = False
+                output = self._forward_sequential(inputs)
+        else:
+            output = self._forward_sequential(inputs)
+        return _map_outputs(self._finalize, output)
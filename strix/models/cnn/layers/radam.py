@@ -1,10 +1,16 @@
+import collections
 import math
 import torch
 from torch.optim.optimizer import Optimizer, required
 
 class RAdam(Optimizer):
+    """RAdam, with a multi-tensor step by default (`foreach=True`): the rectification term is computed once
+    per step and the update is applied by `torch._foreach_*` ops on all the parameters of a device, instead
+    of a loop over the parameters. Both steps have the same state.
+    """
 
-    def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8, weight_decay=0, degenerated_to_sgd=True):
+    def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8, weight_decay=0, degenerated_to_sgd=True,
+                 foreach=True):
         if not 0.0 <= lr:
             raise ValueError("Invalid learning rate: {}".format(lr))
         if not 0.0 <= eps:
@@ -15,6 +21,7 @@ class RAdam(Optimizer):
             raise ValueError("Invalid beta parameter at index 1: {}".format(betas[1]))
         
         self.degenerated_to_sgd = degenerated_to_sgd
+        self.foreach = foreach
         if isinstance(params, (list, tuple)) and len(params) > 0 and isinstance(params[0], dict):
             for param in params:
                 if 'betas' in param and (param['betas'][0] != betas[0] or param['betas'][1] != betas[1]):
@@ -25,6 +32,88 @@ class RAdam(Optimizer):
     def __setstate__(self, state):
         super(RAdam, self).__setstate__(state)
 
+    def _rectification(self, group, step):
+        """N_sma and step size of the update at `step`, cached in the buffer of the group."""
+        beta1, beta2 = group['betas']
+        buffered = group['buffer'][int(step % 10)]
+        if step == buffered[0]:
+            return buffered[1], buffered[2]
+
+        buffered[0] = step
+        beta2_t = beta2 ** step
+        N_sma_max = 2 / (1 - beta2) - 1
+        N_sma = N_sma_max - 2 * step * beta2_t / (1 - beta2_t)
+        buffered[1] = N_sma
+
+        # more conservative since it's an approximated value
+        if N_sma >= 5:
+            step_size = math.sqrt((1 - beta2_t) * (N_sma - 4) / (N_sma_max - 4) * (N_sma - 2) / N_sma * N_sma_max / (N_sma_max - 2)) / (1 - beta1 ** step)
+        elif self.degenerated_to_sgd:
+            step_size = 1.0 / (1 - beta1 ** step)
+        else:
+            step_size = -1
+        buffered[2] = step_size
+        return N_sma, step_size
+
+    def _step_foreach(self, group):
+        beta1, beta2 = group['betas']
+        params, params_fp32, grads, states = [], [], [], []
+        for p in group['params']:
+            if p.grad is None:
+                continue
+            if p.grad.is_sparse:
+                raise RuntimeError('RAdam does not support sparse gradients')
+
+            state = self.state[p]
+            p_data_fp32 = p.data.float()
+            if len(state) == 0:
+                state['step'] = 0
+                state['exp_avg'] = torch.zeros_like(p_data_fp32)
+                state['exp_avg_sq'] = torch.zeros_like(p_data_fp32)
+            else:
+                state['exp_avg'] = state['exp_avg'].type_as(p_data_fp32)
+                state['exp_avg_sq'] = state['exp_avg_sq'].type_as(p_data_fp32)
+            state['step'] += 1
+
+            params.append(p)
+            params_fp32.append(p_data_fp32)
+            grads.append(p.grad.data.float())
+            states.append(state)
+
+        # the params of a bucket share the device and the step, ie. the rectification term
+        buckets = collections.defaultdict(list)
+        for i, (p, state) in enumerate(zip(params, states)):
+            buckets[(p.device, state['step'])].append(i)
+
+        for (_, step), indices in buckets.items():
+            p_fp32 = [params_fp32[i] for i in indices]
+            g = [grads[i] for i in indices]
+            exp_avg = [states[i]['exp_avg'] for i in indices]
+            exp_avg_sq = [states[i]['exp_avg_sq'] for i in indices]
+
+            torch._foreach_mul_(exp_avg_sq, beta2)
+            torch._foreach_addcmul_(exp_avg_sq, g, g, value=1 - beta2)
+            torch._foreach_mul_(exp_avg, beta1)
+            torch._foreach_add_(exp_avg, g, alpha=1 - beta1)
+
+            N_sma, step_size = self._rectification(group, step)
+            if N_sma < 5 and step_size <= 0:
+                continue
+
+            if group['weight_decay'] != 0:
+                torch._foreach_add_(p_fp32, p_fp32, alpha=-group['weight_decay'] * group['lr'])
+            if N_sma >= 5:
+                denom = torch._foreach_sqrt(exp_avg_sq)
+                torch._foreach_add_(denom, group['eps'])
+                torch._foreach_addcdiv_(p_fp32, exp_avg, denom, value=-step_size * group['lr'])
+            else:
+                torch._foreach_add_(p_fp32, exp_avg, alpha=-step_size * group['lr'])
+
+            # `float()` copies the params of other dtypes
+            for i in indices:
+                if params[i].dtype != torch.float32:
+                    params[i].data.copy_(params_fp32[i])
+
     def step(self, closure=None):
 
         loss = None
@@ -32,6 +121,9 @@ class RAdam(Optimizer):
             loss = closure()
 
         for group in self.param_groups:
+            if self.foreach:
+                self._step_foreach(group)
+                continue
 
             for p in group['params']:
                 if p.grad is None:
@@ -59,24 +151,7 @@ class RAdam(Optimizer):
                 exp_avg.mul_(beta1).add_(1 - beta1, grad)
 
                 state['step'] += 1
-                buffered = group['buffer'][int(state['step'] % 10)]
-                if state['step'] == buffered[0]:
-                    N_sma, step_size = buffered[1], buffered[2]
-                else:
-                    buffered[0] = state['step']
-                    beta2_t = beta2 ** state['step']
-                    N_sma_max = 2 / (1 - beta2) - 1
-                    N_sma = N_sma_max - 2 * state['step'] * beta2_t / (1 - beta2_t)
-                    buffered[1] = N_sma
-
-                    # more conservative since it's an approximated value
-                    if N_sma >= 5:
-                        step_size = math.sqrt((1 - beta2_t) * (N_sma - 4) / (N_sma_max - 4) * (N_sma - 2) / N_sma * N_sma_max / (N_sma_max - 2)) / (1 - beta1 ** state['step'])
-                    elif self.degenerated_to_sgd:
-                        step_size = 1.0 / (1 - beta1 ** state['step'])
-                    else:
-                        step_size = -1
-                    buffered[2] = step_size
+                N_sma, step_size = self._rectification(group, state['step'])
 
                 # more conservative since it's an approximated value
                 if N_sma >= 5:
@@ -108,6 +108,41 @@ def centralize_gradient(x, gc_conv_only=False):
     return x
 
 
+def _group_by_device_dtype(tensor_lists):
+    """Split the parallel lists of tensors into buckets of the same device and dtype (of the first list),
+    as `torch._foreach_*` ops need."""
+    buckets = collections.defaultdict(lambda: [[] for _ in tensor_lists])
+    for tensors in zip(*tensor_lists):
+        bucket = buckets[(tensors[0].device, tensors[0].dtype)]
+        for bucket_list, tensor in zip(bucket, tensors):
+            bucket_list.append(tensor)
+    return list(buckets.values())
+
+
+def _group_by_shape(tensor_lists, by_rows):
+    """Bucket the parallel lists of tensors by the shape of the first list, as 2d views (rows, elements
+    of the row) reduced together along the last dim. The rows are dim 0 of the tensors with more than one
+    dim if `by_rows`, else the whole tensors. The tensors that can't be viewed (empty or non-contiguous)
+    are returned apart, as tuples of the lists.
+    """
+    buckets, others = collections.defaultdict(lambda: [[] for _ in tensor_lists]), []
+    for tensors in zip(*tensor_lists):
+        if tensors[0].numel() == 0 or not all(t.is_contiguous() for t in tensors):
+            others.append(tensors)
+            continue
+        shape = tensors[0].shape
+        rows = shape[0] if by_rows and len(shape) > 1 else 1
+        for bucket_list, tensor in zip(buckets[shape], tensors):
+            bucket_list.append(tensor.view(rows, -1))
+    return list(buckets.values()), others
+
+
+def _copy_all_(tensors, values):
+    # no torch._foreach_copy_ before torch 2.1
+    torch._foreach_zero_(tensors)
+    torch._foreach_add_(tensors, values)
+
+
 class Ranger21(TO.Optimizer):
     def __init__(
         self,
@@ -147,6 +182,7 @@ class Ranger21(TO.Optimizer):
         warmup_type="linear",
         warmup_pct_default=0.22,
         logging_active=True,
+        foreach=None,
     ):
 
         # todo - checks on incoming params
@@ -294,6 +330,16 @@ class Ranger21(TO.Optimizer):
             self.tracking_variance_sum = []
             self.tracking_variance_normalized = []
 
+        # multi-tensor step, only for the AdamW core with pnm momentum.
+        # By default only on GPU, the loop is faster for large tensors on CPU
+        foreach_supported = not self.use_madgrad and self.momentum_pnm
+        if foreach and not foreach_supported:
+            raise ValueError("foreach step only supports the AdamW core with pnm momentum")
+        if foreach is None:
+            params_ = [p for group in self.param_groups for p in group["params"]]
+            foreach = foreach_supported and len(params_) > 0 and all(p.is_cuda for p in params_)
+        self.foreach = foreach
+
         # display
         engine = "AdamW" if not self.use_madgrad else "MadGrad"
 
@@ -564,6 +610,230 @@ class Ranger21(TO.Optimizer):
 
         return lr * cheb_value
 
+    def _init_state(self, p, state):
+        # print("init state")
+        state["step"] = 0
+        # Exponential moving average of gradient values
+        state["grad_ma"] = torch.zeros_like(
+            p, memory_format=torch.preserve_format
+        )
+        # Exponential moving average of squared gradient values
+        state["variance_ma"] = torch.zeros_like(
+            p, memory_format=torch.preserve_format
+        )
+
+        if self.lookahead_active:
+            state["lookahead_params"] = torch.zeros_like(p.data)
+            state["lookahead_params"].copy_(p.data)
+
+        if self.use_adabelief:
+            state["variance_ma_belief"] = torch.zeros_like(
+                p, memory_format=torch.preserve_format
+            )
+        if self.momentum_pnm:
+            state["neg_grad_ma"] = torch.zeros_like(
+                p, memory_format=torch.preserve_format
+            )
+
+            # Maintains max of all exp. moving avg. of sq. grad. values
+            state["max_variance_ma"] = torch.zeros_like(
+                p, memory_format=torch.preserve_format
+            )
+
+        # Cumulative products of beta1
+        # state["beta1_prod"] = torch.ones_like(
+        #    p.data, memory_format=torch.preserve_format
+        # )
+
+    # multi-tensor ops of the foreach step
+    def _centralize_gradients(self, grads):
+        """`centralize_gradient` of all gradients."""
+        min_dim = 4 if self.gc_conv_only else 2
+        buckets, others = _group_by_shape([[g for g in grads if g.dim() >= min_dim]], by_rows=True)
+        for grad, in others:
+            centralize_gradient(grad, gc_conv_only=self.gc_conv_only)
+        for views, in buckets:
+            stacked = torch.stack(views)
+            _copy_all_(views, stacked.sub_(stacked.mean(dim=-1, keepdim=True)).unbind(0))
+
+    def _normalize_gradients(self, grads, epsilon=1e-8):
+        """`normalize_gradient` of all gradients."""
+        buckets, others = _group_by_shape([[g for g in grads if g.numel() > 2]], by_rows=False)
+        for grad, in others:
+            normalize_gradient(grad, epsilon=epsilon)
+        for views, in buckets:
+            stacked = torch.stack(views)
+            # two-pass std, `std(dim)` is several times slower on CPU
+            centered = stacked - stacked.mean(dim=-1, keepdim=True)
+            std = (centered.pow_(2).sum(dim=-1, keepdim=True) / (stacked.shape[-1] - 1)).sqrt_()
+            _copy_all_(views, stacked.div_(std + epsilon).unbind(0))
+
+    def _agc_all(self, params, grads):
+        """`agc` of all parameters."""
+        # unit norms of 3d tensors are over dim 1 only, not the rows
+        pairs = [(p, g) for p, g in zip(params, grads) if p.dim() != 3]
+        buckets, others = _group_by_shape([[p for p, _ in pairs], [g for _, g in pairs]], by_rows=True)
+        for p in [p for p in params if p.dim() == 3] + [p for p, _ in others]:
+            self.agc(p)
+        for p_views, g_views in buckets:
+            p_norm = torch.stack(p_views).norm(dim=-1, keepdim=True).clamp_(self.agc_eps)
+            stacked = torch.stack(g_views)
+            g_norm = stacked.norm(dim=-1, keepdim=True)
+            max_norm = p_norm * self.agc_clip_val
+            clipped_grads = stacked * (max_norm / g_norm.clamp(min=1e-6))
+            _copy_all_(g_views, torch.where(g_norm > max_norm, clipped_grads, stacked).unbind(0))
+
+    def _step_foreach(self):
+        """Same step as the loop in `step` for the AdamW core with pnm momentum. The per-parameter
+        ops are batched by `torch._foreach_*` ops on the parameters of the same device and dtype,
+        and the per-tensor reductions (gc, gradient normalization, agc) of the tensors of the same
+        shape are stacked.
+        """
+        param_size = 0
+        variance_sums = []
+        # last param and state of the loops, used by the stable decay and norm loss as in `step`
+        p, state = None, None
+
+        # phase 1 - accumulate all of the variance_ma_sum to use in stable weight decay
+        for group in self.param_groups:
+            beta1, beta2 = group["betas"]
+            params = [q for q in group["params"] if q.grad is not None]
+            if group["params"]:
+                p = group["params"][-1]
+
+            for q in params:
+                if q.grad.is_sparse:
+                    raise RuntimeError("sparse matrix not supported atm")
+                param_size += q.numel()
+                state = self.state[q]
+                if len(state) == 0:
+                    self._init_state(q, state)
+
+            for params_, grads in _group_by_device_dtype([params, [q.grad for q in params]]):
+                states = [self.state[q] for q in params_]
+                if self.agc_active:
+                    self._agc_all(params_, grads)
+                if self.use_gc:
+                    self._centralize_gradients(grads)
+                if self.use_gcnorm:
+                    self._normalize_gradients(grads)
+
+                for st in states:
+                    st["step"] += 1
+
+                if self.use_adabelief:
+                    grad_mas = [st["grad_ma"] for st in states]
+                    torch._foreach_mul_(grad_mas, beta1)
+                    torch._foreach_add_(grad_mas, grads, alpha=1 - beta1)
+                variance_mas = [st["variance_ma"] for st in states]
+                torch._foreach_mul_(variance_mas, beta2)
+                torch._foreach_addcmul_(variance_mas, grads, grads, value=1 - beta2)
+
+                # variance_ma is non-negative, its sum is its l1 norm
+                bias_corrections2 = torch.tensor(
+                    [1 - beta2 ** st["step"] for st in states], dtype=grads[0].dtype, device=grads[0].device
+                )
+                variance_sums.append((torch.stack(torch._foreach_norm(variance_mas, 1)) / bias_corrections2).sum())
+
+        if not self.param_size:
+            self.param_size = param_size
+            print(f"params size saved")
+            print(f"total param groups = {len(self.param_groups)}")
+            print(f"total params in groups = {len(self.param_groups[-1]['params'])}")
+
+        if not self.param_size:
+            raise ValueError("failed to set param size")
+
+        variance_ma_sum = sum(v.to(variance_sums[0].device) for v in variance_sums)
+        variance_normalized = math.sqrt(variance_ma_sum / param_size)
+        if math.isnan(variance_normalized):
+            raise RuntimeError("hit nan for variance_normalized")
+
+        if self.logging:
+            self.tracking_variance_sum.append(variance_ma_sum.item())
+            self.tracking_variance_normalized.append(variance_normalized)
+
+        # phase 2 - apply weight decay and step
+        for group in self.param_groups:
+            step = state["step"]
+            decay = group["weight_decay"]
+            eps = group["eps"]
+            beta1, beta2 = group["betas"]
+            lr = self.get_group_lr(group["lr"], step)
+
+            # stable decay and / or norm loss
+            if decay:
+                p.data.mul_(1 - decay * lr / variance_normalized)
+            if self.normloss_active:
+                unorm = self.unit_norm(p.data)
+                correction = 2 * self.normloss_factor * (1 - torch.div(1, unorm + self.eps))
+                p.mul_(1 - lr * correction)
+
+            bias_correction1 = 1 - beta1 ** step
+            bias_correction2 = 1 - beta2 ** step
+            noise_norm = math.sqrt((1 + beta2) ** 2 + beta2 ** 2)
+            step_size = lr / bias_correction1
+
+            params = [q for q in group["params"] if q.grad is not None]
+            for params_, grads in _group_by_device_dtype([params, [q.grad for q in params]]):
+                states = [self.state[q] for q in params_]
+                odd = [st["step"] % 2 == 1 for st in states]
+                grad_mas = [st["grad_ma"] if o else st["neg_grad_ma"] for st, o in zip(states, odd)]
+                neg_grad_mas = [st["neg_grad_ma"] if o else st["grad_ma"] for st, o in zip(states, odd)]
+                variance_mas = [st["variance_ma"] for st in states]
+
+                # Maintains the maximum of all 2nd moment running avg. till now
+                torch._foreach_maximum_(variance_mas, [st["max_variance_ma"] for st in states])
+                denom = torch._foreach_sqrt(variance_mas)
+                torch._foreach_div_(denom, math.sqrt(bias_correction2))
+                torch._foreach_add_(denom, eps)
+
+                if self.use_gc:
+                    self._centralize_gradients(grads)
+                if self.use_gcnorm:
+                    self._normalize_gradients(grads)
+
+                if not self.use_adabelief:
+                    torch._foreach_mul_(grad_mas, beta1 ** 2)
+                    torch._foreach_add_(grad_mas, grads, alpha=1 - beta1 ** 2)
+
+                if self.softplus:
+                    denom = [F.softplus(d, beta=self.beta_softplus) for d in denom]
+
+                pnmomentum = torch._foreach_mul(grad_mas, 1 + self.momentum_pnm)
+                torch._foreach_add_(pnmomentum, neg_grad_mas, alpha=-self.momentum_pnm)
+                torch._foreach_mul_(pnmomentum, 1 / noise_norm)
+                torch._foreach_addcdiv_(params_, pnmomentum, denom, value=-step_size)
+
+            if group["params"]:
+                p = group["params"][-1]
+            if params:
+                state = self.state[params[-1]]
+
+        if self.lookahead_active:
+            self.lookahead_process_step()
+
+        self.track_epochs(step)
+
+    def get_group_lr(self, lr, step):
+        # warmup
+        # ======================
+        if self.use_warmup and not self.warmup_complete:
+            lr = self.warmup_dampening(lr, step)
+            # print(f"lr = {lr}")
+
+        # chebyshev
+        # ===================
+        if self.use_cheb and self.warmup_complete:
+            lr = self.get_cheb_lr(lr, step)
+
+        # warmdown
+        # ==========
+        if self.warmdown_active:
+            lr = self.get_warm_down(lr, step)
+            assert lr > 0, "lr went negative"
+        return lr
+
     def get_variance(self):
         return self.tracking_variance_sum
 
@@ -583,6 +853,10 @@ class Ranger21(TO.Optimizer):
             with torch.enable_grad():
                 loss = closure()
 
+        if self.foreach:
+            self._step_foreach()
+            return loss
+
         param_size = 0
         variance_ma_sum = 0.0
 
@@ -610,39 +884,7 @@ class Ranger21(TO.Optimizer):
 
                 # State initialization
                 if len(state) == 0:
-                    # print("init state")
-                    state["step"] = 0
-                    # Exponential moving average of gradient values
-                    state["grad_ma"] = torch.zeros_like(
-                        p, memory_format=torch.preserve_format
-                    )
-                    # Exponential moving average of squared gradient values
-                    state["variance_ma"] = torch.zeros_like(
-                        p, memory_format=torch.preserve_format
-                    )
-
-                    if self.lookahead_active:
-                        state["lookahead_params"] = torch.zeros_like(p.data)
-                        state["lookahead_params"].copy_(p.data)
-
-                    if self.use_adabelief:
-                        state["variance_ma_belief"] = torch.zeros_like(
-                            p, memory_format=torch.preserve_format
-                        )
-                    if self.momentum_pnm:
-                        state["neg_grad_ma"] = torch.zeros_like(
-                            p, memory_format=torch.preserve_format
-                        )
-
-                        # Maintains max of all exp. moving avg. of sq. grad. values
-                        state["max_variance_ma"] = torch.zeros_like(
-                            p, memory_format=torch.preserve_format
-                        )
-
-                    # Cumulative products of beta1
-                    # state["beta1_prod"] = torch.ones_like(
-                    #    p.data, memory_format=torch.preserve_format
-                    # )
+                    self._init_state(p, state)
 
                 # centralize gradients
                 if self.use_gc:
@@ -743,23 +985,7 @@ class Ranger21(TO.Optimizer):
 
             beta1, beta2 = group["betas"]
 
-            # warmup
-            # ======================
-            if self.use_warmup and not self.warmup_complete:
-                lr = self.warmup_dampening(lr, step)
-                # print(f"lr = {lr}")
-
-            # chebyshev
-            # ===================
-            if self.use_cheb and self.warmup_complete:
-                lr = self.get_cheb_lr(lr, step)
-
-            # warmdown
-            # ==========
-            if self.warmdown_active:
-                orig_lr = lr
-                lr = self.get_warm_down(lr, step)
-                assert lr > 0, "lr went negative"
+            lr = self.get_group_lr(lr, step)
 
             # madgrad outer
             if self.use_madgrad:
@@ -941,6 +1167,17 @@ class Ranger21(TO.Optimizer):
         if self.lookahead_step >= self.lookahead_mergetime:
             self.lookahead_step = 0
             # merge lookahead cached params and save current ones
+            if self.foreach:
+                for group in self.param_groups:
+                    params = [p for p in group["params"] if p.grad is not None]
+                    for params_, in _group_by_device_dtype([params]):
+                        la_params = [self.state[p]["lookahead_params"] for p in params_]
+                        params_ = [p.data for p in params_]
+                        torch._foreach_mul_(params_, self.lookahead_alpha)
+                        torch._foreach_add_(params_, la_params, alpha=1.0 - self.lookahead_alpha)
+                        _copy_all_(la_params, params_)
+                return
+
             for group in self.param_groups:
                 for p in group["params"]:
                     if p.grad is None:
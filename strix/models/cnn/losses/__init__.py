@@ -1,21 +1,38 @@
-import torch
-from strix.utilities.registry import Registry
-from monai_ex.losses import (
-    DiceLoss,
-    GeneralizedDiceLoss,
-    FocalLoss,
-    DiceFocalLoss,
-    DiceCELoss,
-    DiceTopKLoss
-)
-from .losses import (
-    ContrastiveLoss,
-    ContrastiveCELoss,
-    ContrastiveBCELoss,
-    CrossEntropyLossEx,
-    BCEWithLogitsLossEx,
-    CombinationLoss,
-)
+import importlib
+from strix.utilities.registry import Registry, lazy_import
+
+# losses are imported on first access, listing the names doesn't load torch losses
+_LOSS_MODULES = {
+    "DiceLoss": "monai_ex.losses",
+    "GeneralizedDiceLoss": "monai_ex.losses",
+    "FocalLoss": "monai_ex.losses",
+    "DiceFocalLoss": "monai_ex.losses",
+    "DiceCELoss": "monai_ex.losses",
+    "DiceTopKLoss": "monai_ex.losses",
+    "ContrastiveLoss": "strix.models.cnn.losses.losses",
+    "ContrastiveCELoss": "strix.models.cnn.losses.losses",
+    "ContrastiveBCELoss": "strix.models.cnn.losses.losses",
+    "InBatchContrastiveLoss": "strix.models.cnn.losses.losses",
+    "BatchHardContrastiveLoss": "strix.models.cnn.losses.losses",
+    "InBatchTripletLoss": "strix.models.cnn.losses.losses",
+    "BatchAllTripletLoss": "strix.models.cnn.losses.losses",
+    "CrossEntropyLossEx": "strix.models.cnn.losses.losses",
+    "BCEWithLogitsLossEx": "strix.models.cnn.losses.losses",
+    "CombinationLoss": "strix.models.cnn.losses.losses",
+    "HausdorffDTLoss": "strix.models.cnn.losses.hd_loss",
+    "HausdorffERLoss": "strix.models.cnn.losses.hd_loss",
+}
+
+
+def __getattr__(name):
+    if name in _LOSS_MODULES:
+        return getattr(importlib.import_module(_LOSS_MODULES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _lazy_loss(name):
+    return lazy_import(_LOSS_MODULES[name], name)
+
 
 CLASSIFICATION_LOSS = Registry()
 SEGMENTATION_LOSS = Registry()
@@ -31,22 +48,37 @@ LOSS_MAPPING = {
     "multitask": MULTITASK_LOSS,
 }
 
-CLASSIFICATION_LOSS.register('CE', CrossEntropyLossEx)
-CLASSIFICATION_LOSS.register('WCE', CrossEntropyLossEx)
-CLASSIFICATION_LOSS.register('BCE', BCEWithLogitsLossEx)
-CLASSIFICATION_LOSS.register('WBCE', BCEWithLogitsLossEx)
+CLASSIFICATION_LOSS.register('CE', _lazy_loss("CrossEntropyLossEx"))
+CLASSIFICATION_LOSS.register('WCE', _lazy_loss("CrossEntropyLossEx"))
+CLASSIFICATION_LOSS.register('BCE', _lazy_loss("BCEWithLogitsLossEx"))
+CLASSIFICATION_LOSS.register('WBCE', _lazy_loss("BCEWithLogitsLossEx"))
 # CLASSIFICATION_LOSS.register('FocalLoss', FocalLoss)
 
-SEGMENTATION_LOSS.register('DCE', DiceLoss)
-SEGMENTATION_LOSS.register('GDL', GeneralizedDiceLoss)
-SEGMENTATION_LOSS.register('CE-DCE', DiceCELoss)
-SEGMENTATION_LOSS.register('DiceFocalLoss', DiceFocalLoss)
-SEGMENTATION_LOSS.register('DiceTopKLoss', DiceTopKLoss)
+SEGMENTATION_LOSS.register('DCE', _lazy_loss("DiceLoss"))
+SEGMENTATION_LOSS.register('GDL', _lazy_loss("GeneralizedDiceLoss"))
+SEGMENTATION_LOSS.register('CE-DCE', _lazy_loss("DiceCELoss"))
+SEGMENTATION_LOSS.register('DiceFocalLoss', _lazy_loss("DiceFocalLoss"))
+SEGMENTATION_LOSS.register('DiceTopKLoss', _lazy_loss("DiceTopKLoss"))
+SEGMENTATION_LOSS.register('HausdorffDT', _lazy_loss("HausdorffDTLoss"))
+SEGMENTATION_LOSS.register('HausdorffER', _lazy_loss("HausdorffERLoss"))
+
+SIAMESE_LOSS.register('ContrastiveLoss', _lazy_loss("ContrastiveLoss"))
+SIAMESE_LOSS.register('ContrastiveCELoss', _lazy_loss("ContrastiveCELoss"))
+SIAMESE_LOSS.register('ContrastiveBCELoss', _lazy_loss("ContrastiveBCELoss"))
+# in-batch pairing, trained on plain batches
+SIAMESE_LOSS.register('InBatchContrastiveLoss', _lazy_loss("InBatchContrastiveLoss"))
+SIAMESE_LOSS.register('BatchHardContrastiveLoss', _lazy_loss("BatchHardContrastiveLoss"))
+SIAMESE_LOSS.register('BatchHardTripletLoss', _lazy_loss("InBatchTripletLoss"))
+SIAMESE_LOSS.register('BatchAllTripletLoss', _lazy_loss("BatchAllTripletLoss"))
+
+SELFLEARNING_LOSS.register('MSE', lazy_import("torch.nn", "MSELoss"))
 
-SIAMESE_LOSS.register('ContrastiveLoss', ContrastiveLoss)
-SIAMESE_LOSS.register('ContrastiveCELoss', ContrastiveCELoss)
-SIAMESE_LOSS.register('ContrastiveBCELoss', ContrastiveBCELoss)
+MULTITASK_LOSS.register("CombinationLoss", _lazy_loss("CombinationLoss"))
 
-SELFLEARNING_LOSS.register('MSE', torch.nn.MSELoss)
 
-MULTITASK_LOSS.register("CombinationLoss", CombinationLoss)
+def is_in_batch_loss(framework: str, loss_name: str) -> bool:
+    """Whether the loss pairs the samples within plain batches, eg. the in-batch siamese losses."""
+    registry = LOSS_MAPPING.get(framework)
+    if registry is None or loss_name not in registry:
+        return False
+    return getattr(registry[loss_name], "in_batch", False)
@@ -1,11 +1,15 @@
-import cv2 as cv
 import numpy as np
 
 import torch
 from torch import nn
+from torch.nn import functional as F
 
 from scipy.ndimage.morphology import distance_transform_edt as edt
-from scipy.ndimage import convolve
+from monai.networks import one_hot
+
+from strix.models.cnn.layers.distance_transform import distance_transform_edt
+
+DT_ENGINES = ("torch", "scipy")
 
 """
 Hausdorff loss implementation based on paper:
@@ -16,19 +20,71 @@ https://github.com/SilmarilBearer/HausdorffLoss
 """
 
 
-class HausdorffDTLoss(nn.Module):
-    """Binary Hausdorff loss based on distance transform"""
+def _check_options(sigmoid: bool, softmax: bool) -> None:
+    if sigmoid and softmax:
+        raise ValueError("Incompatible values: sigmoid=True and softmax=True.")
+
+
+def _prepare(pred, target, sigmoid, softmax, to_onehot_y, include_background):
+    """Activate `pred` and one-hot `target` like monai's DiceLoss, the loss is computed on each channel."""
+    n_pred_ch = pred.shape[1]
+    if n_pred_ch == 1 and (softmax or to_onehot_y or not include_background):
+        raise ValueError(
+            "Single channel prediction only supports sigmoid=True, to_onehot_y=False and include_background=True, "
+            f"but got softmax={softmax}, to_onehot_y={to_onehot_y}, include_background={include_background}"
+        )
+    if sigmoid:
+        pred = torch.sigmoid(pred)
+    elif softmax:
+        pred = torch.softmax(pred, dim=1)
+    if to_onehot_y:
+        target = one_hot(target, num_classes=n_pred_ch)
+    if not include_background:
+        pred, target = pred[:, 1:], target[:, 1:]
+    if target.shape != pred.shape:
+        raise ValueError(f"Ground truth has different shape ({target.shape}) from prediction ({pred.shape})")
+    return pred, target.to(pred.dtype)
 
-    def __init__(self, alpha=2.0, **kwargs):
+
+class HausdorffDTLoss(nn.Module):
+    """Hausdorff loss based on distance transform, of each channel
+
+    Args:
+        alpha: exponent of the distances.
+        dt_engine: ``"torch"`` computes the distance transform batched on the device of the inputs,
+            ``"scipy"`` computes it on CPU by `scipy.ndimage.distance_transform_edt`, as reference.
+        include_background: if False, channel 0 (background) is excluded from the loss.
+        to_onehot_y: convert the label map target into the one-hot format of the prediction channels.
+        sigmoid: apply sigmoid to the prediction.
+        softmax: apply softmax to the multi-channel prediction.
+    """
+
+    def __init__(
+        self,
+        alpha=2.0,
+        dt_engine: str = "torch",
+        include_background: bool = True,
+        to_onehot_y: bool = False,
+        sigmoid: bool = False,
+        softmax: bool = False,
+    ):
         super(HausdorffDTLoss, self).__init__()
+        if dt_engine not in DT_ENGINES:
+            raise ValueError(f"Distance transform engine must be in {DT_ENGINES}, but got '{dt_engine}'")
+        _check_options(sigmoid, softmax)
         self.alpha = alpha
+        self.dt_engine = dt_engine
+        self.include_background = include_background
+        self.to_onehot_y = to_onehot_y
+        self.sigmoid = sigmoid
+        self.softmax = softmax
 
     @torch.no_grad()
     def distance_field(self, img: np.ndarray) -> np.ndarray:
         field = np.zeros_like(img)
 
-        for batch in range(len(img)):
-            fg_mask = img[batch] > 0.5
+        for batch, channel in np.ndindex(*img.shape[:2]):
+            fg_mask = img[batch, channel] > 0.5
 
             if fg_mask.any():
                 bg_mask = ~fg_mask
@@ -36,27 +92,43 @@ class HausdorffDTLoss(nn.Module):
                 fg_dist = edt(fg_mask)
                 bg_dist = edt(bg_mask)
 
-                field[batch] = fg_dist + bg_dist
+                field[batch, channel] = fg_dist + bg_dist
 
         return field
 
+    @torch.no_grad()
+    def torch_distance_field(self, img: torch.Tensor) -> torch.Tensor:
+        """Same as `distance_field`, for a batch on the device of `img`.
+        Images without background voxel have zero field, instead of the distances to the border of SciPy.
+        """
+        spatial_dims = img.dim() - 2
+        fg_mask = img > 0.5
+
+        field = distance_transform_edt(fg_mask, spatial_dims) + distance_transform_edt(~fg_mask, spatial_dims)
+        has_fg = fg_mask.flatten(start_dim=2).any(dim=2).view(*img.shape[:2], *(1,) * spatial_dims)
+        return torch.where(has_fg & field.isfinite(), field, torch.zeros_like(field))
+
     def forward(
         self, pred: torch.Tensor, target: torch.Tensor, debug=False
     ) -> torch.Tensor:
         """
-        Uses one binary channel: 1 - fg, 0 - bg
-        pred: (b, 1, x, y, z) or (b, 1, x, y)
-        target: (b, 1, x, y, z) or (b, 1, x, y)
+        Each channel is binary: 1 - fg, 0 - bg
+        pred: (b, c, x, y, z) or (b, c, x, y)
+        target: (b, c, x, y, z) or (b, c, x, y), (b, 1, ...) label map if `to_onehot_y`
         """
         assert pred.dim() == 4 or pred.dim() == 5, "Only 2D and 3D supported"
         assert (
             pred.dim() == target.dim()
         ), "Prediction and target need to be of same dimension"
 
-        # pred = torch.sigmoid(pred)
+        pred, target = _prepare(pred, target, self.sigmoid, self.softmax, self.to_onehot_y, self.include_background)
 
-        pred_dt = torch.from_numpy(self.distance_field(pred.cpu().numpy())).float()
-        target_dt = torch.from_numpy(self.distance_field(target.cpu().numpy())).float()
+        if self.dt_engine == "torch":
+            pred_dt = self.torch_distance_field(pred.detach()).to(pred.dtype)
+            target_dt = self.torch_distance_field(target).to(pred.dtype)
+        else:
+            pred_dt = torch.from_numpy(self.distance_field(pred.detach().cpu().numpy())).to(pred)
+            target_dt = torch.from_numpy(self.distance_field(target.cpu().numpy())).to(pred)
 
         pred_error = (pred - target) ** 2
         distance = pred_dt ** self.alpha + target_dt ** self.alpha
@@ -66,10 +138,10 @@ class HausdorffDTLoss(nn.Module):
 
         if debug:
             return (
-                loss.cpu().numpy(),
+                loss.detach().cpu().numpy(),
                 (
-                    dt_field.cpu().numpy()[0, 0],
-                    pred_error.cpu().numpy()[0, 0],
+                    dt_field.detach().cpu().numpy()[0, 0],
+                    pred_error.detach().cpu().numpy()[0, 0],
                     distance.cpu().numpy()[0, 0],
                     pred_dt.cpu().numpy()[0, 0],
                     target_dt.cpu().numpy()[0, 0],
@@ -81,63 +153,84 @@ class HausdorffDTLoss(nn.Module):
 
 
 class HausdorffERLoss(nn.Module):
-    """Binary Hausdorff loss based on morphological erosion"""
-
-    def __init__(self, alpha=2.0, erosions=10, **kwargs):
+    """Hausdorff loss based on morphological erosion, of each channel
+
+    The erosions are convolutions with a cross kernel, batched on the device of the inputs.
+    Each erosion is normalized per sample and channel.
+
+    Args:
+        alpha: exponent of the erosion weights.
+        erosions: num of erosions.
+        include_background: if False, channel 0 (background) is excluded from the loss.
+        to_onehot_y: convert the label map target into the one-hot format of the prediction channels.
+        sigmoid: apply sigmoid to the prediction.
+        softmax: apply softmax to the multi-channel prediction.
+    """
+
+    def __init__(
+        self,
+        alpha=2.0,
+        erosions=10,
+        include_background: bool = True,
+        to_onehot_y: bool = False,
+        sigmoid: bool = False,
+        softmax: bool = False,
+    ):
         super(HausdorffERLoss, self).__init__()
+        _check_options(sigmoid, softmax)
         self.alpha = alpha
         self.erosions = erosions
+        self.include_background = include_background
+        self.to_onehot_y = to_onehot_y
+        self.sigmoid = sigmoid
+        self.softmax = softmax
         self.prepare_kernels()
 
     def prepare_kernels(self):
-        cross = np.array([cv.getStructuringElement(cv.MORPH_CROSS, (3, 3))])
-        bound = np.array([[[0, 0, 0], [0, 1, 0], [0, 0, 0]]])
+        # float64 as the SciPy kernels, cast to the dtype of the inputs
+        cross = torch.tensor([[0, 1, 0], [1, 1, 1], [0, 1, 0]], dtype=torch.float64)
+        bound = torch.tensor([[0, 0, 0], [0, 1, 0], [0, 0, 0]], dtype=torch.float64)
 
-        self.kernel2D = cross * 0.2
-        self.kernel3D = np.array([bound, cross, bound]) * (1 / 7)
+        self.register_buffer("kernel2D", (cross * 0.2)[None, None], persistent=False)
+        self.register_buffer("kernel3D", (torch.stack([bound, cross, bound]) * (1 / 7))[None, None], persistent=False)
 
-    @torch.no_grad()
-    def perform_erosion(
-        self, pred: np.ndarray, target: np.ndarray, debug
-    ) -> np.ndarray:
+    def perform_erosion(self, pred: torch.Tensor, target: torch.Tensor, debug):
         bound = (pred - target) ** 2
 
         if bound.ndim == 5:
-            kernel = self.kernel3D
+            conv, kernel = F.conv3d, self.kernel3D
         elif bound.ndim == 4:
-            kernel = self.kernel2D
+            conv, kernel = F.conv2d, self.kernel2D
         else:
             raise ValueError(f"Dimension {bound.ndim} is nor supported.")
 
-        eroted = np.zeros_like(bound)
-        erosions = []
-
-        for batch in range(len(bound)):
-
-            # debug
-            erosions.append(np.copy(bound[batch][0]))
+        n_batch, n_channel = bound.shape[:2]
+        kernel = kernel.to(bound)
+        stat_shape = (n_batch, n_channel) + (1,) * (bound.ndim - 2)
+        eroted = torch.zeros_like(bound)
+        erosions = [bound]
 
-            for k in range(self.erosions):
+        for k in range(self.erosions):
+            # compute convolution with kernel, channels as samples
+            dilation = conv(bound.reshape(n_batch * n_channel, 1, *bound.shape[2:]), kernel, padding=1)
+            dilation = dilation.reshape(bound.shape)
 
-                # compute convolution with kernel
-                dilation = convolve(bound[batch], kernel, mode="constant", cval=0.0)
+            # apply soft thresholding at 0.5 and normalize each channel of samples
+            erosion = F.relu(dilation - 0.5)
+            e_min = erosion.flatten(start_dim=2).amin(dim=2).view(stat_shape)
+            e_ptp = erosion.flatten(start_dim=2).amax(dim=2).view(stat_shape) - e_min
+            erosion = torch.where(e_ptp != 0, (erosion - e_min) / torch.where(e_ptp != 0, e_ptp, 1), erosion)
 
-                # apply soft thresholding at 0.5 and normalize
-                erosion = dilation - 0.5
-                erosion[erosion < 0] = 0
+            # save erosion and add to loss
+            bound = erosion
+            eroted = eroted + erosion * (k + 1) ** self.alpha
 
-                if erosion.ptp() != 0:
-                    erosion = (erosion - erosion.min()) / erosion.ptp()
+            if debug:
+                erosions.append(erosion)
 
-                # save erosion and add to loss
-                bound[batch] = erosion
-                eroted[batch] += erosion * (k + 1) ** self.alpha
-
-                if debug:
-                    erosions.append(np.copy(erosion[0]))
-
-        # image visualization in debug mode
+        # image visualization in debug mode, erosions of each sample in order
         if debug:
+            erosions = [e[batch, 0].detach().cpu().numpy() for batch in range(n_batch) for e in erosions]
             return eroted, erosions
         else:
             return eroted
@@ -146,28 +239,24 @@ class HausdorffERLoss(nn.Module):
         self, pred: torch.Tensor, target: torch.Tensor, debug=False
     ) -> torch.Tensor:
         """
-        Uses one binary channel: 1 - fg, 0 - bg
-        pred: (b, 1, x, y, z) or (b, 1, x, y)
-        target: (b, 1, x, y, z) or (b, 1, x, y)
+        Each channel is binary: 1 - fg, 0 - bg
+        pred: (b, c, x, y, z) or (b, c, x, y)
+        target: (b, c, x, y, z) or (b, c, x, y), (b, 1, ...) label map if `to_onehot_y`
         """
         assert pred.dim() == 4 or pred.dim() == 5, "Only 2D and 3D supported"
         assert (
             pred.dim() == target.dim()
         ), "Prediction and target need to be of same dimension"
 
-        # pred = torch.sigmoid(pred)
+        pred, target = _prepare(pred, target, self.sigmoid, self.softmax, self.to_onehot_y, self.include_background)
 
         if debug:
-            eroted, erosions = self.perform_erosion(
-                pred.cpu().numpy(), target.cpu().numpy(), debug
-            )
-            return eroted.mean(), erosions
+            eroted, erosions = self.perform_erosion(pred, target, debug)
+            return eroted.mean().detach().cpu().numpy(), erosions
 
         else:
-            eroted = torch.from_numpy(
-                self.perform_erosion(pred.cpu().numpy(), target.cpu().numpy(), debug)
-            ).float()
+            eroted = self.perform_erosion(pred, target, debug)
 
             loss = eroted.mean()
 
-            return loss
\ No newline at end of file
+            return loss
@@ -132,6 +132,119 @@ class ContrastiveBCELoss(Module):
         return bce_loss+con_loss if self.reduction == 'sum' else (bce_loss+con_loss)/2
 
 
+PAIR_MINING = ("all", "hard")
+
+
+def pairwise_distances(embeddings: Tensor) -> Tensor:
+    """Squared euclidean distances of all pairs of embeddings (B*dim), as a B*B matrix."""
+    sq_norm = embeddings.pow(2).sum(1)
+    distances = sq_norm[:, None] + sq_norm[None, :] - 2 * embeddings @ embeddings.t()
+    return distances.clamp(min=0)
+
+
+def _pair_masks(target: Tensor):
+    # same-label and different-label masks of all pairs, self pairs excluded
+    labels = target.reshape(len(target), -1)
+    same = (labels[:, None, :] == labels[None, :, :]).all(-1)
+    not_self = ~torch.eye(len(labels), dtype=torch.bool, device=labels.device)
+    return same & not_self, ~same
+
+
+class InBatchContrastiveLoss(Module):
+    """
+    Contrastive loss of the pairs within a batch of embeddings and their labels,
+    so a plain batch of B samples gives O(B^2) pairs without loading the second samples.
+
+    Args:
+        margin: margin of the distances of the pairs from different classes.
+        mining: 'all' uses all pairs, 'hard' uses the farthest positive and the closest
+            negative of each anchor.
+        reduction: 'mean' or 'sum' of the losses of the pairs.
+    """
+
+    in_batch = True
+
+    def __init__(self, margin=10, mining: str = "all", reduction: str = "mean"):
+        super(InBatchContrastiveLoss, self).__init__()
+        assert mining in PAIR_MINING, f"mining must be in {PAIR_MINING}, but got {mining}"
+        assert reduction in ['sum', 'mean'], f"reduction must be 'sum' or 'mean', but got {reduction}"
+        self.margin = margin
+        self.mining = mining
+        self.reduction = reduction
+        self.eps = 1e-9
+
+    def forward(self, output, target):
+        distances = pairwise_distances(output)  # squared distances
+        pos_mask, neg_mask = _pair_masks(target)
+
+        if self.mining == "all":
+            upper = torch.ones_like(pos_mask).triu(diagonal=1)
+            pos_distances = distances[pos_mask & upper]
+            neg_distances = distances[neg_mask & upper]
+        else:
+            has_pos, has_neg = pos_mask.any(1), neg_mask.any(1)
+            pos_distances = distances.masked_fill(~pos_mask, float("-inf")).amax(1)[has_pos]
+            neg_distances = distances.masked_fill(~neg_mask, float("inf")).amin(1)[has_neg]
+
+        losses = 0.5 * torch.cat(
+            [pos_distances, F.relu(self.margin - (neg_distances + self.eps).sqrt()).pow(2)]
+        )
+        if len(losses) == 0:  # single sample batch
+            return output.sum() * 0
+        return losses.mean() if self.reduction == 'mean' else losses.sum()
+
+
+class BatchHardContrastiveLoss(InBatchContrastiveLoss):
+    def __init__(self, margin=10, reduction: str = "mean"):
+        super(BatchHardContrastiveLoss, self).__init__(margin, "hard", reduction)
+
+
+class InBatchTripletLoss(Module):
+    """
+    Triplet loss of the anchors, positives and negatives within a batch of embeddings and their labels.
+
+    Args:
+        margin: margin between the distances of the negatives and the positives.
+        mining: 'hard' uses the farthest positive and the closest negative of each anchor
+            (batch hard), 'all' uses all valid triplets (batch all).
+        reduction: 'mean' or 'sum' of the losses of the triplets.
+    """
+
+    in_batch = True
+
+    def __init__(self, margin=1.0, mining: str = "hard", reduction: str = "mean"):
+        super(InBatchTripletLoss, self).__init__()
+        assert mining in PAIR_MINING, f"mining must be in {PAIR_MINING}, but got {mining}"
+        assert reduction in ['sum', 'mean'], f"reduction must be 'sum' or 'mean', but got {reduction}"
+        self.margin = margin
+        self.mining = mining
+        self.reduction = reduction
+        self.eps = 1e-9
+
+    def forward(self, output, target):
+        distances = (pairwise_distances(output) + self.eps).sqrt()
+        pos_mask, neg_mask = _pair_masks(target)
+
+        if self.mining == "hard":
+            valid = pos_mask.any(1) & neg_mask.any(1)
+            hardest_pos = distances.masked_fill(~pos_mask, float("-inf")).amax(1)
+            hardest_neg = distances.masked_fill(~neg_mask, float("inf")).amin(1)
+            losses = F.relu(hardest_pos - hardest_neg + self.margin)[valid]
+        else:
+            # (anchor, positive, negative)
+            triplets = distances[:, :, None] - distances[:, None, :] + self.margin
+            losses = F.relu(triplets[pos_mask[:, :, None] & neg_mask[:, None, :]])
+
+        if len(losses) == 0:  # no valid pair in batch
+            return output.sum() * 0
+        return losses.mean() if self.reduction == 'mean' else losses.sum()
+
+
+class BatchAllTripletLoss(InBatchTripletLoss):
+    def __init__(self, margin=1.0, reduction: str = "mean"):
+        super(BatchAllTripletLoss, self).__init__(margin, "all", reduction)
+
+
 class DeepSupervisionLoss(Module):
     def __init__(self, base_loss):
         super(DeepSupervisionLoss, self).__init__()
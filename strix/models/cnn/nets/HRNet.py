@@ -15,6 +15,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+from strix.models.cnn.layers.checkpoint import checkpoint_stages, is_checkpointing
 
 BatchNorm2d = nn.BatchNorm2d
 BN_MOMENTUM = 0.01
@@ -252,10 +253,12 @@ class HighResolutionModule(nn.Module):
 
 class HighResolutionNet(nn.Module):
 
-    def __init__(self, in_channels=1, out_channels=2, extra, **kwargs):
+    def __init__(self, extra, in_channels=1, out_channels=2, **kwargs):
         super(HighResolutionNet, self).__init__()
 
         final_conv_kernel = kwargs.get('final_conv_kernel', 3)
+        # num of checkpointed segments of each stage in training, 0 for no checkpointing
+        self.grad_checkpoint = kwargs.get('grad_checkpoint', 0)
 
         # stem net
         self.conv1 = nn.Conv2d(in_channels, 64, kernel_size=3, stride=2, padding=1, bias=False)
@@ -392,6 +395,10 @@ class HighResolutionNet(nn.Module):
 
         return nn.Sequential(*modules), num_inchannels
 
+    def _run_stage(self, stage, x):
+        segments = self.grad_checkpoint if is_checkpointing(self, self.grad_checkpoint) else 0
+        return checkpoint_stages(list(stage), x, segments, keep_outputs=False)
+
     def forward(self, x):
         x = self.conv1(x)
         x = self.bn1(x)
@@ -399,7 +406,7 @@ class HighResolutionNet(nn.Module):
         x = self.conv2(x)
         x = self.bn2(x)
         x = self.relu(x)
-        x = self.layer1(x)
+        x = self._run_stage(self.layer1, x)
 
         x_list = []
         for i in range(self.stage2_cfg['NUM_BRANCHES']):
@@ -407,7 +414,7 @@ class HighResolutionNet(nn.Module):
                 x_list.append(self.transition1[i](x))
             else:
                 x_list.append(x)
-        y_list = self.stage2(x_list)
+        y_list = self._run_stage(self.stage2, x_list)
 
         x_list = []
         for i in range(self.stage3_cfg['NUM_BRANCHES']):
@@ -418,7 +425,7 @@ class HighResolutionNet(nn.Module):
                     x_list.append(self.transition2[i](y_list[-1]))
             else:
                 x_list.append(y_list[i])
-        y_list = self.stage3(x_list)
+        y_list = self._run_stage(self.stage3, x_list)
 
         x_list = []
         for i in range(self.stage4_cfg['NUM_BRANCHES']):
@@ -429,7 +436,7 @@ class HighResolutionNet(nn.Module):
                     x_list.append(self.transition3[i](y_list[-1]))
             else:
                 x_list.append(y_list[i])
-        x = self.stage4(x_list)
+        x = self._run_stage(self.stage4, x_list)
 
         # Head Part
         height, width = x[0].size(2), x[0].size(3)
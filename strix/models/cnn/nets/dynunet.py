@@ -15,6 +15,7 @@ from typing import List, Optional, Sequence, Union
 import torch.nn as nn
 
 from strix.models.cnn.blocks.dynunet_block import *
+from strix.models.cnn.layers.checkpoint import checkpoint_stages, is_checkpointing
 
 
 class DynUNet(nn.Module):
@@ -54,6 +55,8 @@ class DynUNet(nn.Module):
             value should be less than the number of up sample layers. Defaults to 1.
         res_block: whether to use residual connection based convolution blocks during the network.
             Defaults to ``True``.
+        grad_checkpoint: num of checkpointed segments of the encoder and the decoder in training,
+            see `strix.models.cnn.layers.checkpoint`. Defaults to 0, no checkpointing.
     """
 
     def __init__(
@@ -72,6 +75,7 @@ class DynUNet(nn.Module):
         is_prunable: bool = False,
         filters: Optional[Sequence[int]] = None,
         output_bottleneck: bool = False,
+        grad_checkpoint: int = 0,
     ):
         super(DynUNet, self).__init__()
         self.spatial_dims = spatial_dims
@@ -96,6 +100,7 @@ class DynUNet(nn.Module):
         self.deep_supervision_heads = self.get_deep_supervision_heads() if deep_supervision else None
         self.deep_supr_num = deep_supr_num
         self.output_bottleneck = output_bottleneck
+        self.grad_checkpoint = grad_checkpoint
         self.apply(self.initialize_weights)
         self.check_kernel_stride()
         self.check_deep_supr_num()
@@ -120,18 +125,12 @@ class DynUNet(nn.Module):
         assert 1 <= deep_supr_num < num_up_layers, error_msg
 
     def forward(self, x):
-        out = self.input_block(x)
-        outputs = [out]
-        for downsample in self.downsamples:
-            out = downsample(out)
-            outputs.append(out)
-        code = self.bottleneck(out)
+        segments = self.grad_checkpoint if is_checkpointing(self, self.grad_checkpoint) else 0
+        outputs = checkpoint_stages([self.input_block, *self.downsamples, self.bottleneck], x, segments)
+        code = outputs.pop()
         out = code.clone()
-        upsample_outs = []
-        for upsample, skip in zip(self.upsamples, reversed(outputs)):
-            out = upsample(out, skip)
-            upsample_outs.append(out)
-        out = self.output_block(out)
+        upsample_outs = checkpoint_stages(self.upsamples, out, segments, skips=outputs[::-1])
+        out = self.output_block(upsample_outs[-1])
         if self.training and self.deep_supervision:
             start_output_idx = len(upsample_outs) - 1 - self.deep_supr_num
             upsample_outs = upsample_outs[start_output_idx:-1][::-1]
@@ -10,6 +10,7 @@ import numpy as np
 
 from monai.networks.blocks import Convolution, UpSample
 from strix.models.cnn.nets.dynunet import DynUNet
+from strix.models.cnn.layers.checkpoint import checkpoint_stages, is_checkpointing
 from monai_ex.networks.layers import Act, Norm, Conv, Pool
 from monai_ex.networks.blocks import ResidualUnitEx as ResidualUnit
 from torch.nn.modules.activation import ReLU
@@ -166,25 +167,11 @@ class MultiChannelLinear(nn.Module):
             nn.init.uniform_(self.bias, -bound, bound)  # bias init
 
     def forward(self, x):
-        def apply_along_axis(x1, func1, func2, axis):
-            if self.bias is not None:
-                return torch.stack(
-                    [
-                        func2(func1(x_i, self.weights[i : i + 1].t()), self.bias[i])
-                        for i, x_i in enumerate(torch.unbind(x1, dim=axis))
-                    ],
-                    dim=axis,
-                )
-            else:
-                return torch.stack(
-                    [
-                        func1(x_i, self.weights[i : i + 1].t())
-                        for i, x_i in enumerate(torch.unbind(x1, dim=axis))
-                    ],
-                    dim=axis,
-                )
-
-        return apply_along_axis(x, torch.mm, torch.add, 1)
+        # B*C*feat -> B*C*1, a linear layer per channel in one batched matmul
+        z = torch.einsum("bcf,cf->bc", x, self.weights)
+        if self.bias is not None:
+            z = z + self.bias
+        return z[:, :, None]
 
 
 class MultiChannelLinear2(nn.Module):
@@ -219,6 +206,7 @@ class HESAM(nn.Module):
         dropout=0.0,
         upsample: str = "deconv",
         groups: int = 1,
+        grad_checkpoint: int = 0,
     ) -> None:
         """
         Args:
@@ -234,9 +222,12 @@ class HESAM(nn.Module):
             dropout: dropout ratio. Defaults to no dropout.
             upsample: upsampling mode, available options are
                 ``"deconv"``, ``"pixelshuffle"``, ``"nontrainable"``.
+            grad_checkpoint: num of checkpointed segments of the encoder and the decoder in training.
+                Defaults to 0, no checkpointing.
         """
         super().__init__()
         print(f"HESAM features: {features}.")
+        self.grad_checkpoint = grad_checkpoint
         globalmaxpool: Callable = Pool[Pool.ADAPTIVEMAX, dimensions]
         globalavgpool: Callable = Pool[Pool.ADAPTIVEAVG, dimensions]
 
@@ -337,15 +328,11 @@ class HESAM(nn.Module):
             nn.init.zeros_(module.bias)
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
-        x0 = self.conv_0(x)
-
-        x1 = self.down_1(x0)
-        x2 = self.down_2(x1)
-        x3 = self.down_3(x2)
-
-        u3 = self.upcat_3(x3, x2)
-        u2 = self.upcat_2(u3, x1)
-        u1 = self.upcat_1(u2, x0)
+        segments = self.grad_checkpoint if is_checkpointing(self, self.grad_checkpoint) else 0
+        x0, x1, x2, x3 = checkpoint_stages([self.conv_0, self.down_1, self.down_2, self.down_3], x, segments)
+        u1 = checkpoint_stages(
+            [self.upcat_3, self.upcat_2, self.upcat_1], x3, segments, skips=[x2, x1, x0], keep_outputs=False
+        )
 
         out = self.final_conv(u1)
         out = self.residuals(out)
@@ -373,6 +360,7 @@ class HESAM2(nn.Module):
         norm="instance",
         dropout=0.0,
         upsample: str = "deconv",
+        grad_checkpoint: int = 0,
     ) -> None:
         """
         Args:
@@ -385,6 +373,7 @@ class HESAM2(nn.Module):
             dropout: dropout ratio. Defaults to no dropout.
             upsample: upsampling mode, available options are
                 ``"deconv"``, ``"pixelshuffle"``, ``"nontrainable"``.
+            grad_checkpoint: num of checkpointed segments of the backbone in training.
         """
         super().__init__()
         globalmaxpool: Callable = Pool[Pool.ADAPTIVEMAX, dimensions]
@@ -402,6 +391,7 @@ class HESAM2(nn.Module):
             deep_supr_num=1,
             res_block=False,
             output_bottleneck=True,
+            grad_checkpoint=grad_checkpoint,
         )
         # self.latent_code = None
         # self.backbone.bottleneck.register_forward_hook(
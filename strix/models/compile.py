@@ -0,0 +1,186 @@
+"""
+Compilation and export of the registered networks.
+
+`compile_network` runs a network with `torch.compile` (torch>=2.0) or TorchScript scripting,
+and falls back to eager mode if it fails. Scripted networks are cached in the `Models` dir of
+the experiment, keyed by the architecture, the source code of its modules and their options, so
+they are scripted only once. `torch.compile` compiles the forward of the network in place, instead
+of wrapping it in an `OptimizedModule` which prefixes the parameter names by `_orig_mod.`. So the
+parameters keep their names in both modes, checkpoints are shared with eager networks.
+
+`export_network` writes a TorchScript or ONNX file of a trained network, with a json file of
+the metadata needed by the preprocessing, for deployment without Strix.
+"""
+import hashlib
+import inspect
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Union
+
+import torch
+from torch import nn
+
+COMPILE_MODES = ("none", "script", "compile")
+EXPORT_FORMATS = ("torchscript", "onnx")
+METADATA_KEYS = (
+    "framework",
+    "tensor_dim",
+    "model_name",
+    "input_nc",
+    "output_nc",
+    "data_list",
+    "crop_size",
+    "image_size",
+    "downsample",
+)
+
+logger = logging.getLogger("strix")
+
+
+def _module_options(module: nn.Module) -> Dict[str, Any]:
+    # plain attributes set by the constructors, eg. flags like `deep_supervision` not shown by repr
+    return {
+        k: v
+        for k, v in sorted(vars(module).items())
+        if not k.startswith("_") and isinstance(v, (bool, int, float, str, tuple, list, type(None)))
+    }
+
+
+def _cache_key(net: nn.Module, mode: str) -> str:
+    """Key of the cached graph, which changes with the architecture, the source code of the modules
+    (eg. edited `forward`) and their options. Raise OSError or TypeError if a source is not available.
+    """
+    classes = {type(m) for m in net.modules()}
+    sources = [inspect.getsource(c) for c in sorted(classes, key=lambda c: f"{c.__module__}.{c.__qualname__}")]
+    options = [repr(_module_options(m)) for m in net.modules()]
+    archi = "\n".join([torch.__version__, mode, repr(net), *sources, *options]).encode()
+    return f"{net.__class__.__name__}.{mode}-{hashlib.md5(archi).hexdigest()[:12]}.jit"
+
+
+def _script(net: nn.Module, cache_dir: Optional[Union[str, Path]] = None) -> nn.Module:
+    if cache_dir is None:
+        return torch.jit.script(net)
+
+    try:
+        cache_key = _cache_key(net, "script")
+    except (OSError, TypeError):  # eg. modules defined interactively
+        logger.warning(f"Source code of {net.__class__.__name__} is not available, scripted network is not cached")
+        return torch.jit.script(net)
+
+    device = next(net.parameters()).device
+    cache_file = Path(cache_dir) / cache_key
+    if cache_file.is_file():
+        scripted = torch.jit.load(str(cache_file), map_location=device)
+        scripted.load_state_dict(net.state_dict())  # cached graph, current weights
+        scripted.train(net.training)
+        logger.info(f"Load scripted network from {cache_file}")
+        return scripted
+
+    scripted = torch.jit.script(net)
+    torch.jit.save(scripted, str(cache_file))
+    return scripted
+
+
+def compile_network(net: nn.Module, mode: str = "none", cache_dir: Optional[Union[str, Path]] = None) -> nn.Module:
+    """Compile the network to cut the per-iteration python overhead.
+
+    Args:
+        net: network to compile, on its target device.
+        mode: 'none' for eager, 'script' for TorchScript, 'compile' for `torch.compile`,
+            which falls back to TorchScript if not available (torch<2.0).
+        cache_dir: dir of cached scripted networks, not cached if None.
+
+    Returns:
+        nn.Module: compiled network, which is `net` itself compiled in place by `torch.compile`,
+            or the eager network if compilation failed. Its state dict has the same keys as `net`.
+    """
+    if mode not in COMPILE_MODES:
+        raise ValueError(f"Compile mode must be in {COMPILE_MODES}, but got '{mode}'")
+    if mode == "none":
+        return net
+
+    if mode == "compile" and hasattr(torch, "compile"):
+        try:
+            # in place, `torch.compile(net)` would prefix the parameter names by `_orig_mod.`
+            if hasattr(net, "compile"):  # torch>=2.2
+                net.compile()
+            else:
+                net.forward = torch.compile(net.forward)
+            return net
+        except Exception as e:
+            logger.warning(f"torch.compile of {net.__class__.__name__} failed ({e}), try TorchScript")
+    elif mode == "compile":
+        logger.warning(f"torch.compile needs torch>=2.0 (got {torch.__version__}), try TorchScript")
+
+    try:
+        return _script(net, cache_dir)
+    except Exception as e:
+        logger.warning(f"TorchScript of {net.__class__.__name__} failed, run in eager mode.\n{e}")
+        return net
+
+
+def get_export_metadata(opts: Dict, input_shape: Sequence[int], fmt: str) -> Dict[str, Any]:
+    """Metadata of exported network, ie. the options of the network and its inputs."""
+    from strix.configures import config as cfg
+
+    metadata = {key: opts[key] for key in METADATA_KEYS if opts.get(key) is not None}
+    output_nc = opts.get("output_nc", 1)
+    metadata.update(
+        {
+            "format": fmt,
+            "input_shape": list(input_shape),
+            "image_key": cfg.get_key("image"),
+            "activation": "sigmoid" if output_nc == 1 else "softmax",
+            "torch_version": torch.__version__,
+        }
+    )
+    return metadata
+
+
+def export_network(
+    net: nn.Module,
+    output_path: Union[str, Path],
+    example_inputs: torch.Tensor,
+    fmt: str = "torchscript",
+    metadata: Optional[Dict] = None,
+    opset_version: int = 13,
+) -> Path:
+    """Export the network in eval mode, with its metadata in a json file of the same name.
+
+    TorchScript export scripts the network, or traces it with `example_inputs` if scripting fails.
+    ONNX export has a dynamic batch dim.
+
+    Returns:
+        Path: path of the exported network.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Export format must be in {EXPORT_FORMATS}, but got '{fmt}'")
+
+    output_path = Path(output_path)
+    net = net.eval()
+    with torch.no_grad():
+        if fmt == "torchscript":
+            output_path = output_path.with_suffix(".pt")
+            try:
+                exported = torch.jit.script(net)
+            except Exception as e:
+                logger.warning(f"TorchScript of {net.__class__.__name__} failed, trace it instead.\n{e}")
+                exported = torch.jit.trace(net, example_inputs)
+            torch.jit.save(exported, str(output_path))
+        else:
+            output_path = output_path.with_suffix(".onnx")
+            torch.onnx.export(
+                net,
+                example_inputs,
+                str(output_path),
+                opset_version=opset_version,
+                input_names=["input"],
+                output_names=["output"],
+                dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+            )
+
+    if metadata is not None:
+        with output_path.with_suffix(".json").open("w") as f:
+            json.dump(metadata, f, indent=2, default=str)
+    return output_path
@@ -0,0 +1,81 @@
+import gzip
+from types import SimpleNamespace
+
+import nibabel as nib
+import numpy as np
+import pytest
+import torch
+from ignite.engine import Engine, Events
+from monai.transforms import SaveImage
+
+from strix.utilities.async_writer import AsyncWriter, attach_async_writer, get_output_ext, set_compress_level
+
+
+class _SaverHandler:
+    # as `SegmentationSaver`, which saves the outputs by its `_saver`
+    def __init__(self, saver):
+        self._saver = saver
+
+    def __call__(self, engine):
+        for img, meta in engine.state.output:
+            self._saver(img, meta)
+
+
+def _run(handler, n_iter=6):
+    torch.manual_seed(0)
+    images = [torch.rand(1, 8, 8, 8) for _ in range(n_iter)]
+
+    def _step(engine, i):
+        return [(images[i], {"filename_or_obj": f"case{i}.nii", "affine": np.eye(4)})]
+
+    engine = Engine(_step)
+    engine.add_event_handler(Events.ITERATION_COMPLETED, handler)
+    return engine, images
+
+
+def _saver(tmp_path, ext=".nii.gz"):
+    return SaveImage(output_dir=str(tmp_path), output_postfix="prob", output_ext=ext, resample=False)
+
+
+@pytest.mark.parametrize("compress_level", [0, 1, 9])
+def test_async_writes_all_files(tmp_path, compress_level):
+    opts = SimpleNamespace(save_compress_level=compress_level)
+    ext = get_output_ext(opts)
+    assert ext == (".nii" if compress_level == 0 else ".nii.gz")
+
+    handler = _SaverHandler(_saver(tmp_path, ext))
+    engine, images = _run(handler)
+    writer = attach_async_writer(engine, [handler], num_workers=2, compress_level=compress_level, max_pending=2)
+    assert writer is not None
+    engine.run(list(range(len(images))), max_epochs=1)
+
+    for i, img in enumerate(images):
+        fpath = tmp_path / f"case{i}" / f"case{i}_prob{ext}"
+        assert fpath.is_file()  # flushed at completion
+        np.testing.assert_allclose(nib.load(str(fpath)).get_fdata(), img[0].numpy(), rtol=1e-6)
+        if compress_level:
+            with gzip.open(fpath) as f:
+                f.read()
+    assert writer._pool is None and not writer._pending
+    set_compress_level(1)
+
+
+def test_sync_writer(tmp_path):
+    handler = _SaverHandler(_saver(tmp_path))
+    assert attach_async_writer(Engine(lambda e, b: None), [handler], num_workers=0) is None
+    assert isinstance(handler._saver, SaveImage)
+    assert attach_async_writer(Engine(lambda e, b: None), [object()], num_workers=2) is None
+
+
+def _fail(img, meta_data):
+    raise OSError("disk full")
+
+
+def test_writer_errors():
+    writer = AsyncWriter(1)
+    writer.submit(_fail, np.zeros(3), {})
+    with pytest.raises(OSError, match="disk full"):
+        writer.flush()
+    writer.shutdown()
+    with pytest.raises(ValueError):
+        AsyncWriter(0)
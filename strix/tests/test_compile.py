@@ -0,0 +1,85 @@
+import json
+
+import pytest
+import torch
+from torch import nn
+
+from strix.models.compile import _cache_key, compile_network, export_network, get_export_metadata
+
+
+class _Net(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Conv3d(1, 4, 3, padding=1)
+        self.norm = nn.BatchNorm3d(4)
+        self.out = nn.Conv3d(4, 2, 1)
+
+    def forward(self, x):
+        return self.out(torch.relu(self.norm(self.conv(x))))
+
+
+class _Unscriptable(_Net):
+    def forward(self, x, *args):  # varargs are not supported by TorchScript
+        return super().forward(x)
+
+
+def _inputs():
+    torch.manual_seed(0)
+    return torch.rand(2, 1, 8, 8, 8)
+
+
+@pytest.mark.parametrize("mode", ["script", "compile"])
+def test_compile_network(tmp_path, mode):
+    net, x = _Net().eval(), _inputs()
+    expected = net(x)
+    compiled = compile_network(net, mode, cache_dir=tmp_path)
+    if mode == "script" or not hasattr(torch, "compile"):
+        assert compiled is not net
+    with torch.no_grad():
+        torch.testing.assert_close(compiled(x), expected)
+
+    # checkpoints are shared with eager networks
+    assert compiled.state_dict().keys() == _Net().state_dict().keys()
+    _Net().load_state_dict(compiled.state_dict())
+    compiled.load_state_dict(_Net().state_dict())
+
+    # cached graph is reused with the weights of the new network
+    new_net = _Net().eval()
+    if mode == "script":
+        assert len(list(tmp_path.glob("*.jit"))) == 1
+        cached = compile_network(new_net, mode, cache_dir=tmp_path)
+        with torch.no_grad():
+            torch.testing.assert_close(cached(x), new_net(x))
+
+
+def test_cache_key():
+    net = _Net()
+    assert _cache_key(net, "script") == _cache_key(_Net(), "script")
+    assert _cache_key(net, "script") != _cache_key(_Unscriptable(), "script")
+
+    # options not shown by repr
+    net.deep_supervision = True
+    assert _cache_key(net, "script") != _cache_key(_Net(), "script")
+
+
+def test_compile_fallback():
+    net = _Unscriptable()
+    assert compile_network(net, "script") is net
+    assert compile_network(net, "none") is net
+    with pytest.raises(ValueError):
+        compile_network(net, "jit")
+
+
+@pytest.mark.parametrize("fmt", ["torchscript", "onnx"])
+def test_export_network(tmp_path, fmt):
+    net, x = _Unscriptable(), _inputs()  # traced if scripting fails
+    opts = {"model_name": "net", "tensor_dim": "3D", "input_nc": 1, "output_nc": 2, "crop_size": [8, 8, 8]}
+    metadata = get_export_metadata(opts, x.shape, fmt)
+    output_path = export_network(net, tmp_path / "model", x, fmt, metadata)
+
+    assert output_path.suffix == (".pt" if fmt == "torchscript" else ".onnx")
+    saved = json.loads(output_path.with_suffix(".json").read_text())
+    assert saved["activation"] == "softmax" and saved["input_shape"] == [2, 1, 8, 8, 8]
+    if fmt == "torchscript":
+        with torch.no_grad():
+            torch.testing.assert_close(torch.jit.load(str(output_path))(x), net(x))
@@ -0,0 +1,39 @@
+import pytest
+import torch
+from monai_ex.data import Dataset
+from strix.data_io.dataloader import AutoWorkersDataLoader, build_dataloader, check_dataloader_setting
+
+
+def _dataset(n=24):
+    return Dataset([{"image": torch.full((1, 4, 4), i, dtype=torch.float32)} for i in range(n)])
+
+
+def test_check_setting():
+    assert check_dataloader_setting({"num_workers": "auto", "seed": 1}, "train")
+    with pytest.raises(ValueError):
+        check_dataloader_setting({"n_workers": 2}, "train")
+    with pytest.raises(ValueError):
+        check_dataloader_setting({"num_workers": -1}, "valid")
+
+
+def test_seeded_loader():
+    setting = {"num_workers": 1, "seed": 42, "persistent_workers": True, "prefetch_factor": 4}
+    orders = []
+    for _ in range(2):
+        loader = build_dataloader(_dataset(), setting, batch_size=4, shuffle=True)
+        orders.append([batch["image"][:, 0, 0, 0].tolist() for batch in loader])
+    assert orders[0] == orders[1]
+
+
+def test_auto_workers():
+    loader = build_dataloader(
+        _dataset(),
+        {"num_workers": "auto", "auto_candidates": [0, 1], "auto_probe_batches": 2},
+        batch_size=2,
+        shuffle=False,
+    )
+    assert isinstance(loader, AutoWorkersDataLoader)
+    for _ in range(2):
+        values = [v for batch in loader for v in batch["image"][:, 0, 0, 0].tolist()]
+        assert values == list(range(24))
+        assert loader.tuned and loader.num_workers in (0, 1)
@@ -0,0 +1,94 @@
+import pytest
+import torch
+from strix.data_io.device_augmentation import (
+    DEVICE_AUGMENTOR,
+    BatchAugmentor,
+    BatchRandAffine,
+    BatchRandElastic,
+    BatchRandFlip,
+    BatchRandGaussianNoise,
+    BatchRandShiftIntensity,
+    _gaussian_smooth,
+)
+
+
+@pytest.mark.parametrize("spatial_shape", [(16, 20), (8, 12, 10)])
+def test_identity_affine(spatial_shape):
+    image = torch.rand(2, 1, *spatial_shape)
+    label = torch.randint(0, 3, (2, 1, *spatial_shape))
+    augmentor = BatchAugmentor([BatchRandAffine(keys=["image", "label"], prob=1.0)])
+    out_image, out_label = augmentor(image, label)
+
+    assert torch.allclose(out_image, image, atol=1e-5)
+    assert torch.equal(out_label, label)
+    assert out_label.dtype == label.dtype
+
+
+def test_flip():
+    image = torch.rand(3, 2, 6, 7, 8)
+    label = torch.randint(0, 2, (3, 1, 6, 7, 8)).float()
+    augmentor = BatchAugmentor([BatchRandFlip(keys=["image", "label"], prob=1.0, spatial_axis=1)])
+    out_image, out_label = augmentor(image, label)
+
+    assert torch.allclose(out_image, image.flip(3), atol=1e-5)
+    assert torch.equal(out_label, label.flip(3))
+
+
+def test_spatial_merged():
+    image = torch.rand(4, 1, 10, 12, 14)
+    label = (image > 0.5).float()
+    augmentor = BatchAugmentor(
+        [
+            BatchRandAffine(keys=["image", "label"], prob=1.0, rotate_range=0.3, scale_range=0.1),
+            BatchRandElastic(keys=["image", "label"], prob=1.0, sigma_range=(2, 3), magnitude_range=(1, 2)),
+            BatchRandGaussianNoise(keys="image", prob=1.0, std=0.1),
+        ]
+    )
+    out_image, out_label = augmentor(image, label)
+
+    assert out_image.shape == image.shape
+    assert out_label.shape == label.shape
+    assert set(out_label.unique().tolist()) <= {0.0, 1.0}
+
+
+def test_classification_targets():
+    image = torch.rand(2, 1, 16, 16)
+    target = torch.tensor([0, 1])
+    augmentor = BatchAugmentor([BatchRandAffine(keys=["image", "label"], prob=1.0, rotate_range=0.5)])
+    _, out_target = augmentor(image, target)
+    assert torch.equal(out_target, target)
+
+
+def test_intensity_keys():
+    image, label = torch.rand(2, 1, 8, 8), torch.rand(2, 1, 8, 8)
+    augmentor = BatchAugmentor([BatchRandShiftIntensity(keys="label", offsets=1.0, prob=1.0)])
+    out_image, out_label = augmentor(image, label)
+    assert torch.equal(out_image, image)
+    assert not torch.equal(out_label, label)
+
+    augmentor = BatchAugmentor([BatchRandShiftIntensity(keys="t2", offsets=1.0, prob=1.0)])
+    (out_t1, out_t2), _ = augmentor((image, image), None, input_keys=("t1", "t2"))
+    assert torch.equal(out_t1, image)
+    assert not torch.equal(out_t2, image)
+
+
+def test_elastic_sigma_per_sample():
+    data = torch.rand(3, 2, 24, 24)
+    sigma = torch.tensor([1.0, 2.0, 3.0])
+    smoothed = _gaussian_smooth(data, sigma)
+    for i in range(len(sigma)):
+        expected = _gaussian_smooth(data[i : i + 1], sigma[i : i + 1])
+        torch.testing.assert_close(smoothed[i : i + 1], expected, atol=1e-3, rtol=0)
+    assert not torch.allclose(smoothed[0], _gaussian_smooth(data[:1], sigma[2:])[0], atol=1e-3)
+
+
+def test_unknown_args():
+    with pytest.raises(TypeError):
+        BatchRandAffine(keys="image", prob=1.0, mode="bilinear")
+    with pytest.raises(TypeError):
+        BatchRandElastic(keys="image", spatial_size=(8, 8))
+
+
+def test_elastic_registry():
+    assert DEVICE_AUGMENTOR["Rand3DElasticD"] is BatchRandElastic
+    assert "Rand2DElasticD" not in DEVICE_AUGMENTOR
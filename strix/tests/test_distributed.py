@@ -0,0 +1,178 @@
+import json
+import socket
+from types import SimpleNamespace
+
+import pytest
+import torch
+from ignite.metrics import Accuracy
+
+from strix.utilities.distributed import (
+    AllGatherMetric,
+    get_dist_info,
+    get_rank,
+    get_world_size,
+    is_distributed,
+    is_main_process,
+    launch,
+    sync_metric,
+)
+from strix.utilities.enum import Phases
+
+NPROC = 2
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _dump(tmp_path, result):
+    with (tmp_path / f"rank{get_rank()}.json").open("w") as f:
+        json.dump(result, f)
+
+
+def _load(tmp_path):
+    return [json.loads((tmp_path / f"rank{i}.json").read_text()) for i in range(NPROC)]
+
+
+def _ddp_step(tmp_path):
+    torch.manual_seed(0)  # same init weights on all ranks
+    net = torch.nn.parallel.DistributedDataParallel(torch.nn.Linear(4, 1))
+    optim = torch.optim.SGD(net.parameters(), lr=0.1)
+
+    torch.manual_seed(get_rank() + 1)  # different data on each rank
+    net(torch.rand(8, 4)).sum().backward()
+    optim.step()
+    _dump(
+        tmp_path,
+        {
+            "rank": get_rank(),
+            "world_size": get_world_size(),
+            "main": is_main_process(),
+            "weight": net.module.weight.detach().view(-1).tolist(),
+        },
+    )
+
+
+def _gather_metric(tmp_path, y_pred, y):
+    metric = sync_metric(Accuracy())
+    shard = slice(get_rank(), None, get_world_size())
+    for pred, label in zip(y_pred[shard].split(1), y[shard].split(1)):  # uneven num of iterations on ranks
+        metric.update((pred, label))
+    _dump(tmp_path, {"wrapped": isinstance(metric, AllGatherMetric), "accuracy": metric.compute()})
+
+
+def _train_engine(tmp_path, framework, data_list, model_name, criterion):
+    from torch.utils.tensorboard import SummaryWriter
+    from strix.data_io.dataio import get_dataloader
+    from strix.models import get_engine
+
+    torch.manual_seed(get_rank())  # different init weights on each rank, DDP broadcasts those of rank 0
+    experiment_path = tmp_path / f"rank{get_rank()}"
+    opts = SimpleNamespace(
+        framework=framework,
+        data_list=data_list,
+        model_name=model_name,
+        criterion=criterion,
+        tensor_dim="2D",
+        input_nc=1,
+        output_nc=1,
+        gpus="-1",
+        gpu_ids=[],
+        experiment_path=experiment_path,
+        phase=Phases.TRAIN,
+        n_batch=2,
+        n_batch_valid=1,
+        n_worker=0,
+        n_epoch=1,
+        n_epoch_len=1.0,
+        valid_interval=1,
+        optim="sgd",
+        lr=0.1,
+        lr_policy="const",
+        loss_params={},
+        deep_supervision=False,
+        save_epoch_freq=1,
+        save_n_best=1,
+        early_stop=0,
+        nni=False,
+        visualize=False,
+        amp=False,
+    )
+    files = [{"image": f"{i}.nii", "label": f"{i}.1.nii"} for i in range(9)]
+    train_loader = get_dataloader(opts, files[:4], Phases.TRAIN)
+    valid_loader = get_dataloader(opts, files[4:], Phases.VALID)  # 5 samples, uneven shards
+    writer = SummaryWriter(log_dir=experiment_path / "tensorboard") if is_main_process() else None
+
+    trainer, net = get_engine(opts, train_loader, valid_loader, writer=writer)
+    trainer.run()
+
+    torch.save([p.detach() for p in net.module.parameters()], tmp_path / f"rank{get_rank()}.pt")
+    _dump(
+        tmp_path,
+        {
+            "n_train": len(train_loader.sampler),
+            "n_valid": len(valid_loader.sampler),
+            "files": [str(f.relative_to(experiment_path)) for f in experiment_path.rglob("*") if f.is_file()],
+        },
+    )
+
+
+def test_single_process():
+    assert not is_distributed()
+    assert (get_rank(), get_world_size(), is_main_process()) == (0, 1, True)
+    assert get_dist_info() == (1, 0)
+    assert not isinstance(sync_metric(Accuracy()), AllGatherMetric)
+    with pytest.raises(ValueError):
+        get_dist_info(2, 2)
+
+
+def test_ddp_gradient_sync(tmp_path):
+    launch(_ddp_step, NPROC, args=(tmp_path,), backend="gloo", port=_free_port())
+    results = _load(tmp_path)
+    assert [r["rank"] for r in results] == list(range(NPROC))
+    assert all(r["world_size"] == NPROC for r in results)
+    assert [r["main"] for r in results] == [True, False]
+    assert results[0]["weight"] == pytest.approx(results[1]["weight"])
+
+
+def test_all_gather_metric(tmp_path):
+    torch.manual_seed(0)
+    y_pred, y = torch.rand(9, 3), torch.randint(0, 3, (9,))
+    expected = Accuracy()
+    expected.update((y_pred, y))
+
+    launch(_gather_metric, NPROC, args=(tmp_path, y_pred, y), backend="gloo", port=_free_port())
+    for result in _load(tmp_path):
+        assert result["wrapped"]
+        assert result["accuracy"] == pytest.approx(expected.compute())
+
+
+@pytest.mark.parametrize(
+    "framework,data_list,model_name,criterion",
+    [
+        ("segmentation", "SyntheticData", "unet", "DCE"),
+        ("classification", "RandomData", "resnet18", "BCE"),
+    ],
+)
+def test_ddp_train_engine(tmp_path, framework, data_list, model_name, criterion):
+    launch(
+        _train_engine,
+        NPROC,
+        args=(tmp_path, framework, data_list, model_name, criterion),
+        backend="gloo",
+        port=_free_port(),
+    )
+    results = _load(tmp_path)
+    assert [r["n_train"] for r in results] == [2, 2]
+    assert [r["n_valid"] for r in results] == [3, 2]
+
+    params = [torch.load(tmp_path / f"rank{i}.pt") for i in range(NPROC)]
+    for p0, p1 in zip(*params):
+        assert torch.allclose(p0, p1)
+
+    # checkpoints and tensorboard are only written by rank 0
+    assert any(f.startswith("Models/Checkpoint") for f in results[0]["files"])
+    assert any(f.startswith("tensorboard") for f in results[0]["files"])
+    assert results[1]["files"] == []
@@ -0,0 +1,42 @@
+import os
+import pytest
+from monai_ex.transforms import NormalizeIntensityD, SpacingD, SpatialPadD
+from strix.data_io.fingerprint import hash_data_item, hash_transform, hash_transform_chain
+
+
+def test_transform_fingerprint():
+    assert hash_transform(SpacingD(keys="image", pixdim=(1, 1, 1))) == hash_transform(
+        SpacingD(keys="image", pixdim=(1, 1, 1))
+    )
+    assert hash_transform(SpacingD(keys="image", pixdim=(1, 1, 1))) != hash_transform(
+        SpacingD(keys="image", pixdim=(2, 2, 2))
+    )
+
+
+def test_data_fingerprint(tmp_path):
+    fpath = tmp_path / "image.nii"
+    fpath.write_bytes(b"0")
+    item = {"image": str(fpath), "label": 1}
+    key = hash_data_item(item)
+    assert key == hash_data_item({"label": 1, "image": str(fpath)})
+
+    fpath.write_bytes(b"01")
+    assert hash_data_item(item) != key
+
+
+def test_chain_fingerprint():
+    item = {"image": "image.nii"}
+    spacer = SpacingD(keys="image", pixdim=(1, 1, 1))
+    rescaler = NormalizeIntensityD(keys="image")
+    cropper1 = SpatialPadD(keys="image", spatial_size=(32, 32, 32))
+    cropper2 = SpatialPadD(keys="image", spatial_size=(64, 64, 64))
+
+    hashes1 = hash_transform_chain(item, [spacer, rescaler, cropper1])
+    hashes2 = hash_transform_chain(item, [spacer, rescaler, cropper2])
+    assert len(hashes1) == 4
+    assert hashes1[:3] == hashes2[:3]
+    assert hashes1[3] != hashes2[3]
+
+    hashes3 = hash_transform_chain(item, [SpacingD(keys="image", pixdim=(2, 2, 2)), rescaler, cropper1])
+    assert hashes1[0] == hashes3[0]
+    assert all(h1 != h3 for h1, h3 in zip(hashes1[1:], hashes3[1:]))
@@ -0,0 +1,87 @@
+import pytest
+import torch
+from torch import nn
+
+from strix.models.cnn.layers.checkpoint import checkpoint_stages, segment_bounds
+from strix.models.cnn.nets.dynunet import DynUNet
+
+
+class _Up(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Conv3d(8, 4, 3, padding=1)
+
+    def forward(self, x, skip):
+        return torch.relu(self.conv(torch.cat([x, skip], dim=1)))
+
+
+def _stages(n=4):
+    torch.manual_seed(0)
+    return nn.ModuleList([nn.Sequential(nn.Conv3d(4, 4, 3, padding=1), nn.ReLU()) for _ in range(n)])
+
+
+def _grads(module):
+    return [p.grad.clone() for p in module.parameters()]
+
+
+def test_segment_bounds():
+    assert segment_bounds(5, 2) == [(0, 3), (3, 5)]
+    assert segment_bounds(3, 8) == [(0, 1), (1, 2), (2, 3)]
+    assert segment_bounds(4, 1) == [(0, 4)]
+
+
+@pytest.mark.parametrize("segments", [1, 2, 3])
+def test_checkpoint_stages(segments):
+    x = torch.rand(2, 4, 8, 8, 8, requires_grad=True)
+    stages, ups = _stages(), nn.ModuleList([_Up() for _ in range(3)])
+
+    results = []
+    for seg in [0, segments]:
+        x.grad = None
+        stages.zero_grad(), ups.zero_grad()
+        feats = checkpoint_stages(list(stages), x, seg)
+        out = checkpoint_stages(list(ups), feats[-1], seg, skips=feats[-2::-1], keep_outputs=False)
+        out.sum().backward()
+        results.append((feats, out, x.grad.clone(), _grads(stages) + _grads(ups)))
+
+    (feats, out, x_grad, grads), (cp_feats, cp_out, cp_x_grad, cp_grads) = results
+    assert len(cp_feats) == len(feats) == 4
+    torch.testing.assert_close(cp_out, out)
+    torch.testing.assert_close(cp_x_grad, x_grad)
+    for cp_grad, grad in zip(cp_grads, grads):
+        torch.testing.assert_close(cp_grad, grad)
+
+
+def test_checkpoint_running_stats():
+    torch.manual_seed(0)
+    stages = nn.ModuleList([nn.Sequential(nn.Conv3d(4, 4, 3, padding=1), nn.BatchNorm3d(4)) for _ in range(4)])
+    cp_stages = nn.ModuleList([nn.Sequential(nn.Conv3d(4, 4, 3, padding=1), nn.BatchNorm3d(4)) for _ in range(4)])
+    cp_stages.load_state_dict(stages.state_dict())
+    x = torch.rand(2, 4, 8, 8, 8)
+
+    checkpoint_stages(list(stages), x, 0, keep_outputs=False).sum().backward()
+    checkpoint_stages(list(cp_stages), x, 2, keep_outputs=False).sum().backward()
+    for name, buffer in stages.state_dict().items():
+        torch.testing.assert_close(cp_stages.state_dict()[name], buffer)
+    assert cp_stages[0][1].num_batches_tracked == 1
+
+
+@pytest.mark.parametrize("dim,deep_supervision", [(2, True), (3, False)])
+def test_dynunet_grad_checkpoint(dim, deep_supervision):
+    torch.manual_seed(0)
+    args = (dim, 1, 2, (3,) * 4, (1,) + (2,) * 3, (1,) + (2,) * 3)
+    kwargs = {"norm_name": "instance", "deep_supervision": deep_supervision}
+    net, cp_net = DynUNet(*args, **kwargs), DynUNet(*args, **kwargs, grad_checkpoint=2)
+    cp_net.load_state_dict(net.state_dict())
+    x = torch.rand((2, 1) + (16,) * dim)
+
+    outputs = [n(x) for n in (net, cp_net)]
+    for out in outputs:
+        (out[0] if deep_supervision else out).mean().backward()
+    for out, cp_out in zip(*outputs):
+        torch.testing.assert_close(cp_out, out)
+    for p, cp_p in zip(net.parameters(), cp_net.parameters()):
+        torch.testing.assert_close(cp_p.grad, p.grad)
+
+    with torch.no_grad():
+        torch.testing.assert_close(cp_net.eval()(x), net.eval()(x))
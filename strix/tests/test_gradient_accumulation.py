@@ -0,0 +1,107 @@
+import pytest
+import torch
+from monai_ex.engines import SupervisedTrainerEx
+
+from strix.models.cnn.engines.utils import GradientAccumulation, PrepareBatch, get_accumulation_steps
+
+N_BATCH = 4
+
+
+class _Net(torch.nn.Module):
+    def __init__(self, max_batch: int = 0):
+        super().__init__()
+        self.max_batch = max_batch
+        self.fc = torch.nn.Linear(3, 1)
+
+    def forward(self, x):
+        if self.max_batch and len(x) > self.max_batch:
+            raise RuntimeError("CUDA out of memory. Tried to allocate 2.00 GiB")
+        return self.fc(x)
+
+
+def _data(n_batches, batch_size=N_BATCH, label_shape=(1,)):
+    torch.manual_seed(0)
+    return [
+        {"image": torch.rand(batch_size, 3), "label": torch.rand(batch_size, *label_shape)} for _ in range(n_batches)
+    ]
+
+
+def _train(data, epoch_length=None, max_batch=0, **kwargs):
+    torch.manual_seed(1)
+    net = _Net(max_batch)
+    trainer = SupervisedTrainerEx(
+        device=torch.device("cpu"),
+        max_epochs=1,
+        train_data_loader=data,
+        epoch_length=epoch_length or len(data),
+        network=net,
+        optimizer=torch.optim.SGD(net.parameters(), lr=0.5),
+        loss_function=torch.nn.MSELoss(),
+        prepare_batch=PrepareBatch("image", "label"),
+        decollate=False,
+        ensure_dims=True,
+    )
+    if kwargs:
+        trainer._process_function = GradientAccumulation(trainer, **kwargs)
+    trainer.run()
+    return net.fc.weight.detach().clone(), trainer.state.output
+
+
+def _merge(data, n):
+    return [{k: torch.cat([d[k] for d in data[i : i + n]]) for k in data[0]} for i in range(0, len(data), n)]
+
+
+@pytest.mark.parametrize("micro_batch", [0, 1, 3])
+def test_accumulation_equals_large_batch(micro_batch):
+    data = _data(4)
+    expected, _ = _train(_merge(data, 2))
+    weight, output = _train(data, accumulation_steps=2, micro_batch=micro_batch)
+    torch.testing.assert_close(weight, expected)
+    assert output["pred"].shape == (N_BATCH, 1)
+    assert output["loss"].ndim == 0
+
+
+def test_accumulation_ensure_dims():
+    # labels of (N,) are matched to preds of (N, 1) by the ensure_dims of trainer
+    data = _data(4, label_shape=())
+    expected, _ = _train(_merge(data, 2))
+    weight, output = _train(data, accumulation_steps=2, micro_batch=3)
+    torch.testing.assert_close(weight, expected)
+    assert output["loss"].ndim == 0
+
+
+def test_accumulation_at_epoch_end():
+    # 3 batches per epoch with 2 steps, the last batch is stepped alone
+    data = _data(3)
+    expected, _ = _train(_merge(data[:2], 2) + data[2:])
+    weight, _ = _train(data, accumulation_steps=2)
+    torch.testing.assert_close(weight, expected)
+
+    weight, _ = _train(_data(4), epoch_length=3, accumulation_steps=2)
+    torch.testing.assert_close(weight, expected)
+
+
+def test_split_on_oom():
+    data = _data(4)
+    expected, _ = _train(_merge(data, 2))
+    with pytest.raises(RuntimeError, match="out of memory"):
+        _train(data, max_batch=1, accumulation_steps=2)
+
+    trainer_kwargs = {"max_batch": 1, "accumulation_steps": 2, "split_on_oom": True}
+    weight, output = _train(data, **trainer_kwargs)
+    torch.testing.assert_close(weight, expected)
+    assert output["pred"].shape == (N_BATCH, 1)
+
+
+def test_accumulation_steps_option():
+    class Opts:
+        n_batch = 2
+
+    opts = Opts()
+    assert get_accumulation_steps(opts) == 1
+    opts.accumulation_steps = 3
+    assert get_accumulation_steps(opts) == 3
+    opts.effective_batch = 7
+    assert get_accumulation_steps(opts) == 4
+    with pytest.raises(ValueError):
+        GradientAccumulation(None, accumulation_steps=0)
@@ -0,0 +1,160 @@
+import numpy as np
+import pytest
+import torch
+from scipy.ndimage import convolve
+from scipy.ndimage import distance_transform_edt as scipy_edt
+
+from strix.models.cnn.layers.distance_transform import distance_transform_edt
+from strix.models.cnn.losses import SEGMENTATION_LOSS
+from strix.models.cnn.losses.hd_loss import HausdorffDTLoss, HausdorffERLoss
+
+
+def _masks(shape, seed=0):
+    torch.manual_seed(seed)
+    return torch.rand(shape) > 0.7
+
+
+@pytest.mark.parametrize("shape", [(2, 1, 31, 24), (2, 1, 17, 12, 9), (3, 2, 8, 20)])
+def test_distance_transform_edt(shape):
+    mask = _masks(shape)
+    spatial_dims = len(shape) - 2
+    expected = np.stack([[scipy_edt(img) for img in imgs] for imgs in mask.numpy()])
+
+    np.testing.assert_allclose(distance_transform_edt(mask, spatial_dims).numpy(), expected, atol=1e-5)
+    # small chunks of lines
+    dist = distance_transform_edt(mask, spatial_dims, chunk_elements=1000)
+    np.testing.assert_allclose(dist.numpy(), expected, atol=1e-5)
+    assert distance_transform_edt(mask.double(), spatial_dims).dtype == torch.float64
+
+
+def test_distance_transform_without_zeros():
+    dist = distance_transform_edt(torch.ones(1, 1, 4, 4, dtype=torch.bool), 2)
+    assert torch.isinf(dist).all()
+
+
+@pytest.mark.parametrize("shape", [(2, 1, 32, 24), (2, 1, 16, 12, 10), (2, 3, 20, 16)])
+def test_hausdorff_dt_engines(shape):
+    torch.manual_seed(0)
+    pred = torch.rand(shape, requires_grad=True)
+    target = _masks(shape, seed=1).float()
+    target[1] = 0  # no foreground, zero field
+
+    ref_loss = HausdorffDTLoss(dt_engine="scipy")
+    loss = HausdorffDTLoss(dt_engine="torch")
+    for img in (pred.detach(), target):
+        expected = torch.from_numpy(ref_loss.distance_field(img.numpy()))
+        torch.testing.assert_close(loss.torch_distance_field(img), expected)
+
+    value, ref_value = loss(pred, target), ref_loss(pred, target)
+    torch.testing.assert_close(value, ref_value)
+    grad, = torch.autograd.grad(value, pred)
+    ref_grad, = torch.autograd.grad(ref_value, pred)
+    torch.testing.assert_close(grad, ref_grad)
+
+
+def test_hausdorff_dt_activation():
+    torch.manual_seed(0)
+    logits = torch.randn(2, 1, 16, 16)
+    target = _masks((2, 1, 16, 16)).float()
+
+    expected = HausdorffDTLoss()(torch.sigmoid(logits), target)
+    torch.testing.assert_close(HausdorffDTLoss(sigmoid=True)(logits, target), expected)
+    two_channels = torch.cat([torch.zeros_like(logits), logits], dim=1)
+    loss_fn = HausdorffDTLoss(softmax=True, to_onehot_y=True, include_background=False)
+    torch.testing.assert_close(loss_fn(two_channels, target), expected)
+    with pytest.raises(ValueError):
+        HausdorffDTLoss(dt_engine="cv2")
+
+
+def test_hausdorff_dt_options():
+    from strix.models import get_loss_fn
+
+    torch.manual_seed(0)
+    logits = torch.randn(2, 3, 16, 16)
+    labels = torch.randint(0, 3, (2, 1, 16, 16)).float()
+    probs = torch.softmax(logits, dim=1)
+
+    # per-channel loss of the foreground classes, as configured for output_nc > 1
+    expected = torch.stack([HausdorffDTLoss()(probs[:, c : c + 1], (labels == c).float()) for c in (1, 2)]).mean()
+    torch.testing.assert_close(get_loss_fn("segmentation", "HausdorffDT", {}, 3)(logits, labels), expected)
+    assert get_loss_fn("segmentation", "HausdorffER", {}, 3)(logits, labels).isfinite()
+
+    with pytest.raises(ValueError, match="sigmoid"):
+        HausdorffDTLoss(sigmoid=True, softmax=True)
+    with pytest.raises(ValueError, match="Single channel"):
+        HausdorffDTLoss(softmax=True)(logits[:, :1], labels)
+    with pytest.raises(ValueError, match="different shape"):
+        HausdorffDTLoss(softmax=True)(logits, labels)
+    with pytest.raises(TypeError):
+        HausdorffDTLoss(reduction="sum")
+
+
+def _reference_erosion(bound, erosions, alpha):
+    # per-sample SciPy erosion before batching
+    cross = np.array([[0, 1, 0], [1, 1, 1], [0, 1, 0]])
+    center = np.array([[0, 0, 0], [0, 1, 0], [0, 0, 0]])
+    kernel = cross * 0.2 if bound.ndim == 4 else np.array([center, cross, center]) / 7
+    eroted = np.zeros_like(bound)
+    for batch, channel in np.ndindex(*bound.shape[:2]):
+        for k in range(erosions):
+            erosion = convolve(bound[batch, channel], kernel, mode="constant", cval=0.0) - 0.5
+            erosion[erosion < 0] = 0
+            if erosion.ptp() != 0:
+                erosion = (erosion - erosion.min()) / erosion.ptp()
+            bound[batch, channel] = erosion
+            eroted[batch, channel] += erosion * (k + 1) ** alpha
+    return eroted
+
+
+@pytest.mark.parametrize("shape", [(3, 1, 32, 24), (2, 2, 20, 16), (2, 1, 16, 12, 10)])
+def test_hausdorff_er(shape):
+    torch.manual_seed(0)
+    pred = torch.rand(shape, dtype=torch.float64, requires_grad=True)
+    target = _masks(shape, seed=1).double()
+    target[0] = pred[0].detach()  # no boundary, zero ptp
+
+    loss_fn = HausdorffERLoss(erosions=5)
+    expected = _reference_erosion(((pred - target) ** 2).detach().numpy(), 5, loss_fn.alpha)
+    eroted = loss_fn.perform_erosion(pred, target, debug=False)
+    np.testing.assert_allclose(eroted.detach().numpy(), expected, atol=1e-10)
+
+    loss = loss_fn(pred, target)
+    torch.testing.assert_close(loss.detach(), torch.tensor(expected.mean(), dtype=torch.float64))
+    loss.backward()
+    assert pred.grad is not None and torch.isfinite(pred.grad).all()
+
+    debug_loss, erosions = loss_fn(pred, target, debug=True)
+    np.testing.assert_allclose(debug_loss, expected.mean())
+    assert len(erosions) == shape[0] * 6 and erosions[0].shape == shape[2:]
+
+
+def test_hausdorff_er_channels():
+    torch.manual_seed(0)
+    pred = torch.rand(2, 3, 20, 16, dtype=torch.float64)
+    target = _masks((2, 3, 20, 16), seed=1).double()
+    pred[:, 2] = 1 - target[:, 2]  # larger error of one class doesn't scale the others
+
+    loss_fn = HausdorffERLoss(erosions=5)
+    eroted = loss_fn.perform_erosion(pred, target, debug=False)
+    for c in range(3):
+        expected = loss_fn.perform_erosion(pred[:, c : c + 1], target[:, c : c + 1], debug=False)
+        torch.testing.assert_close(eroted[:, c : c + 1], expected)
+    expected = torch.stack([loss_fn(pred[:, c : c + 1], target[:, c : c + 1]) for c in range(3)]).mean()
+    torch.testing.assert_close(loss_fn(pred, target), expected)
+
+
+def test_hausdorff_er_activation():
+    torch.manual_seed(0)
+    logits = torch.randn(2, 1, 16, 16)
+    target = _masks((2, 1, 16, 16)).float()
+
+    expected = HausdorffERLoss()(torch.sigmoid(logits), target)
+    torch.testing.assert_close(HausdorffERLoss(sigmoid=True)(logits, target), expected)
+    two_channels = torch.cat([torch.zeros_like(logits), logits], dim=1)
+    loss_fn = HausdorffERLoss(softmax=True, to_onehot_y=True, include_background=False)
+    torch.testing.assert_close(loss_fn(two_channels, target), expected)
+
+
+def test_hausdorff_registered():
+    assert SEGMENTATION_LOSS["HausdorffDT"] is HausdorffDTLoss
+    assert SEGMENTATION_LOSS["HausdorffER"] is HausdorffERLoss
@@ -0,0 +1,89 @@
+import itertools
+
+import pytest
+import torch
+
+from strix.models.cnn.losses import SIAMESE_LOSS
+from strix.models.cnn.losses.losses import (
+    BatchAllTripletLoss,
+    BatchHardContrastiveLoss,
+    ContrastiveLoss,
+    InBatchContrastiveLoss,
+    InBatchTripletLoss,
+    pairwise_distances,
+)
+
+
+def _batch(n=8, dim=16):
+    torch.manual_seed(0)
+    return torch.randn(n, dim, requires_grad=True), torch.tensor([0, 1, 2, 1, 0, 1, 3, 0][:n])
+
+
+def test_pairwise_distances():
+    output, _ = _batch()
+    torch.testing.assert_close(pairwise_distances(output), torch.cdist(output, output) ** 2, atol=1e-4, rtol=1e-4)
+
+
+def test_all_pairs_contrastive():
+    output, target = _batch()
+    pairs = list(itertools.combinations(range(len(output)), 2))
+    idx1, idx2 = torch.tensor(pairs).t()
+    # same as the loss of the pairs of a siamese dataset
+    expected = ContrastiveLoss(margin=5)(output[idx1], output[idx2], target[idx1], target[idx2])
+    torch.testing.assert_close(InBatchContrastiveLoss(margin=5)(output, target), expected)
+
+
+def test_batch_hard_contrastive():
+    output, target = _batch()
+    dist = torch.cdist(output, output) ** 2
+    losses = []
+    for i in range(len(output)):
+        pos = [dist[i, j] for j in range(len(output)) if j != i and target[j] == target[i]]
+        neg = [dist[i, j] for j in range(len(output)) if target[j] != target[i]]
+        if pos:
+            losses.append(0.5 * max(pos))
+        losses.append(0.5 * torch.relu(5 - min(neg).sqrt()) ** 2)
+    expected = torch.stack(losses).mean()
+    torch.testing.assert_close(BatchHardContrastiveLoss(margin=5)(output, target), expected, atol=1e-4, rtol=1e-4)
+
+
+@pytest.mark.parametrize("mining", ["hard", "all"])
+def test_triplet(mining):
+    output, target = _batch()
+    dist = torch.cdist(output, output)
+    losses = []
+    for a in range(len(output)):
+        pos = [p for p in range(len(output)) if p != a and target[p] == target[a]]
+        neg = [n for n in range(len(output)) if target[n] != target[a]]
+        if not pos:
+            continue
+        if mining == "hard":
+            losses.append(torch.relu(max(dist[a, pos]) - min(dist[a, neg]) + 1.0))
+        else:
+            losses += [torch.relu(dist[a, p] - dist[a, n] + 1.0) for p in pos for n in neg]
+    expected = torch.stack(losses).mean()
+
+    loss = InBatchTripletLoss(margin=1.0, mining=mining)(output, target)
+    torch.testing.assert_close(loss, expected, atol=1e-4, rtol=1e-4)
+    if mining == "all":
+        torch.testing.assert_close(BatchAllTripletLoss(margin=1.0)(output, target), loss)
+
+
+@pytest.mark.parametrize("loss_fn", [InBatchContrastiveLoss(), BatchHardContrastiveLoss(), InBatchTripletLoss()])
+def test_degenerated_batch(loss_fn):
+    output, _ = _batch(n=4)
+    # duplicated embeddings of different classes, one-hot labels
+    output = torch.cat([output, output[:1]]).detach().requires_grad_(True)
+    target = torch.tensor([[1, 0], [0, 1], [0, 1], [1, 0], [0, 1]])
+    loss = loss_fn(output, target)
+    loss.backward()
+    assert torch.isfinite(loss) and torch.isfinite(output.grad).all()
+
+    single = loss_fn(output[:1], torch.zeros(1))
+    assert single.item() == 0
+
+
+def test_registered():
+    assert SIAMESE_LOSS["InBatchContrastiveLoss"] is InBatchContrastiveLoss
+    assert SIAMESE_LOSS["BatchHardTripletLoss"] is InBatchTripletLoss
+    assert all(SIAMESE_LOSS[name].in_batch for name in ["BatchHardContrastiveLoss", "BatchAllTripletLoss"])
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+from strix.configures import config as cfg
+from strix.data_io.base_dataset import utils
+from strix.data_io.base_dataset.utils import get_input_data, validate_datalist
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"image_{i}.nii.gz"
+        path.touch()
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cfg, "get_strix_cfg", lambda keyword: str(tmp_path / "cache"))
+    return tmp_path / "cache" / ".file_check"
+
+
+def test_input_data(files):
+    input_data = get_input_data([{"image": f, "label": 0} for f in files], True, False)
+    assert [d["image"] for d in input_data] == files
+    assert get_input_data([files[:2]], True, False) == [{"image": files[0], "label": files[1]}]
+    assert get_input_data(files, False, False)[0] == {"image": files[0]}
+
+
+def test_input_data_missing_file(files, tmp_path):
+    missing = str(tmp_path / "missing.nii.gz")
+    with pytest.raises(AssertionError, match="not exists"):
+        get_input_data([{"image": missing, "label": 0}], True, False)
+    with pytest.raises(AssertionError, match="not exists"):
+        get_input_data([[files[0], missing]], True, False)
+    with pytest.raises(AssertionError, match="not exists"):
+        get_input_data([missing], False, False)
+
+
+def test_input_data_missing_key(files):
+    with pytest.raises(AssertionError, match="image keyword"):
+        get_input_data([{"img": files[0], "label": 0}], True, False)
+    with pytest.raises(AssertionError, match="label keyword"):
+        get_input_data([{"image": files[0]}], True, False)
+
+
+@pytest.mark.parametrize("value", [None, 1, ["a.nii.gz"]])
+def test_input_data_non_str(files, value):
+    with pytest.raises(AssertionError, match="must be str"):
+        get_input_data([{"image": value, "label": 0}], True, False)
+    with pytest.raises(AssertionError, match="must be str"):
+        get_input_data([[files[0], value]], True, False)
+    with pytest.raises(ValueError):
+        get_input_data([value], False, False)
+
+
+def test_validate_datalist(files, tmp_path, cache_dir):
+    datalist = tmp_path / "datalist.json"
+    datalist.write_text(json.dumps(files))
+
+    validate_datalist(datalist, files + [str(tmp_path / "missing.nii.gz"), None])
+    assert not cache_dir.exists()  # not memoized with missing files
+
+    validate_datalist(datalist, files)
+    cache_files = list(cache_dir.glob("*.json"))
+    assert len(cache_files) == 1
+    assert json.loads(cache_files[0].read_text())["existing"] == sorted(files)
+
+    # later runs with the unchanged datalist take the existing files from the cache, without stat calls
+    utils._existing_files.clear()
+    (tmp_path / "image_0.nii.gz").unlink()
+    validate_datalist(datalist, files)
+    assert set(files) <= utils._existing_files
@@ -0,0 +1,35 @@
+import pytest
+import numpy as np
+import torch
+from monai_ex.transforms import ComposeEx, LambdaD, RandFlipD
+from strix.data_io.memmap_dataset import MemmapDataset
+
+
+def _load(x):
+    return np.full((1, 8, 8, 4), float(x), dtype=np.float32)
+
+
+@pytest.mark.parametrize("shard_size", [64, 2 * 1024 ** 3])
+def test_memmap_dataset(tmp_path, shard_size):
+    files_list = [{"image": i, "label": i % 2} for i in range(5)]
+    transforms = ComposeEx([
+        LambdaD(keys="image", func=_load),
+        LambdaD(keys="image", func=torch.as_tensor),
+        RandFlipD(keys="image", prob=0.0),
+    ])
+
+    dataset = MemmapDataset(files_list, transforms, cache_dir=tmp_path, shard_size=shard_size)
+    assert (tmp_path / "index.pkl").is_file()
+    assert len(list(tmp_path.glob("shard_*.raw"))) == (5 if shard_size == 64 else 1)
+
+    for i in range(len(dataset)):
+        item = dataset[i]
+        assert isinstance(item["image"], torch.Tensor)
+        assert item["image"].shape == (1, 8, 8, 4)
+        assert torch.all(item["image"] == i)
+        assert item["label"] == i % 2
+
+    # reuse the existing shards and only append new items
+    dataset = MemmapDataset(files_list + [{"image": 5, "label": 1}], transforms, cache_dir=tmp_path)
+    assert len(dataset._index["items"]) == 6
+    assert torch.all(dataset[5]["image"] == 5)
@@ -0,0 +1,37 @@
+import pytest
+import torch
+
+from strix.models.cnn.nets.hesam import MultiChannelLinear
+
+
+def _reference_forward(layer, x):
+    # per-channel implementation before vectorization
+    outputs = []
+    for i, x_i in enumerate(torch.unbind(x, dim=1)):
+        out = torch.mm(x_i, layer.weights[i : i + 1].t())
+        outputs.append(out if layer.bias is None else torch.add(out, layer.bias[i]))
+    return torch.stack(outputs, dim=1)
+
+
+@pytest.mark.parametrize("bias", [True, False])
+@pytest.mark.parametrize("in_features,n_channels", [(36, 64), (216, 256), (1, 3)])
+def test_multichannel_linear(bias, in_features, n_channels):
+    torch.manual_seed(0)
+    layer = MultiChannelLinear(in_features, n_channels, bias=bias)
+    x = torch.rand(4, n_channels, in_features, requires_grad=True)
+
+    out = layer(x)
+    expected = _reference_forward(layer, x)
+    assert out.shape == (4, n_channels, 1)
+    torch.testing.assert_close(out, expected)
+
+    grads = torch.autograd.grad(out.sum(), [x, *layer.parameters()])
+    expected_grads = torch.autograd.grad(expected.sum(), [x, *layer.parameters()])
+    for grad, expected_grad in zip(grads, expected_grads):
+        torch.testing.assert_close(grad, expected_grad)
+
+
+def test_multichannel_linear_state_dict():
+    layer = MultiChannelLinear(36, 8)
+    assert {k: v.shape for k, v in layer.state_dict().items()} == {"weights": (8, 36), "bias": (8,)}
+    assert list(MultiChannelLinear(36, 8, bias=False).state_dict()) == ["weights"]
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import pytest
+import torch
+from monai.inferers import SimpleInferer
+
+from strix.models.cnn.inferers import AutocastInferer, get_precision, get_precision_inferer, is_engine_amp
+
+
+@pytest.mark.parametrize(
+    "opts, expected",
+    [
+        ({}, "fp32"),
+        ({"amp": True}, "bf16"),  # fp16 autocast is not supported on CPU
+        ({"amp": True, "precision": "fp32"}, "fp32"),
+        ({"precision": "bf16"}, "bf16"),
+    ],
+)
+def test_cpu_precision(opts, expected):
+    opts = SimpleNamespace(**opts)
+    assert get_precision(opts, "cpu") == expected
+    assert not is_engine_amp(opts, "cpu")
+    inferer = get_precision_inferer(opts, SimpleInferer(), "cpu")
+    assert isinstance(inferer, AutocastInferer) == (expected == "bf16")
+
+
+def test_invalid_precision():
+    with pytest.raises(ValueError):
+        get_precision(SimpleNamespace(precision="int8"), "cpu")
+
+
+def test_autocast_inferer():
+    torch.manual_seed(0)
+    net = torch.nn.Sequential(torch.nn.Conv3d(1, 4, 3, padding=1), torch.nn.ReLU(), torch.nn.Conv3d(4, 2, 1))
+    x = torch.rand(2, 1, 8, 8, 8)
+    with torch.no_grad():
+        expected = net(x)
+        pred = AutocastInferer(SimpleInferer(), "cpu", torch.bfloat16)(x, net)
+        preds = AutocastInferer(SimpleInferer(), "cpu", torch.bfloat16)(x, lambda x: [net(x), net(x)])
+    assert pred.dtype == torch.float32  # cast back for losses & metrics
+    torch.testing.assert_close(pred, expected, atol=5e-2, rtol=5e-2)
+    assert isinstance(preds, list) and all(p.dtype == torch.float32 for p in preds)
+
+    # gradients flow through autocast, without GradScaler
+    net.zero_grad()
+    AutocastInferer(SimpleInferer(), "cpu", torch.bfloat16)(x, net).mean().backward()
+    assert all(p.grad is not None and p.grad.dtype == torch.float32 for p in net.parameters())
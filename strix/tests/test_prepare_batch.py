@@ -0,0 +1,67 @@
+import pytest
+import torch
+
+from strix.models.cnn.engines.utils import BatchPrefetcher, PrepareBatch
+
+
+def _batches(n=4):
+    return [
+        {"image": torch.rand(2, 1, 4, 4), "image2": torch.rand(2, 1, 4, 4), "label": torch.tensor([0.0, 1.0]), "id": i}
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("device", ["cpu", "cuda:0"])
+def test_prepare_batch(device):
+    if "cuda" in device and not torch.cuda.is_available():
+        pytest.skip("CUDA is not available")
+
+    batch = _batches(1)[0]
+    inputs, targets = PrepareBatch("image", "label", torch.long)(batch, torch.device(device), True)
+    assert inputs.device == targets.device == torch.device(device)
+    assert targets.dtype == torch.long and inputs.dtype == torch.float32
+
+    prepare_batch = PrepareBatch(["image", "image2"], ("label",), torch.float32)
+    inputs, targets = prepare_batch(batch, torch.device(device))
+    assert len(inputs) == 2 and isinstance(targets, tuple)
+    assert prepare_batch.keys == ("image", "image2", "label")
+
+    inputs, targets = PrepareBatch("image")(batch, torch.device(device))
+    assert targets is None and torch.equal(inputs.cpu(), batch["image"])
+
+
+@pytest.mark.parametrize("device", ["cpu", "cuda:0"])
+def test_batch_prefetcher(device):
+    if "cuda" in device and not torch.cuda.is_available():
+        pytest.skip("CUDA is not available")
+
+    batches = _batches()
+    prefetcher = BatchPrefetcher(batches, device, keys=("image", "label"), num_prefetch=2)
+    assert len(prefetcher) == len(batches)
+    for _ in range(2):  # re-iterable for each epoch
+        outputs = list(prefetcher)
+        assert [b["id"] for b in outputs] == list(range(len(batches)))
+        assert all(b["image"].device == torch.device(device) for b in outputs)
+
+
+def test_batch_prefetcher_error():
+    def _loader():
+        yield _batches(1)[0]
+        raise RuntimeError("broken batch")
+
+    class Loader:
+        def __iter__(self):
+            return _loader()
+
+    with pytest.raises(RuntimeError, match="broken batch"):
+        list(BatchPrefetcher(Loader(), "cpu", keys=("image",)))
+
+
+@pytest.mark.parametrize("memory_format", [torch.channels_last, torch.channels_last_3d])
+def test_prepare_batch_memory_format(memory_format):
+    batch = {"image": torch.rand(2, 3, 4, 4, 4), "image2": torch.rand(2, 3, 4, 4), "label": torch.rand(2, 3, 4, 4, 4)}
+    inputs, targets = PrepareBatch(("image", "image2"), "label", memory_format=memory_format)(batch, "cpu")
+    assert inputs[0].is_contiguous(memory_format=torch.channels_last_3d) == (memory_format == torch.channels_last_3d)
+    assert inputs[1].is_contiguous(memory_format=torch.channels_last) == (memory_format == torch.channels_last)
+    assert targets.is_contiguous()  # only inputs are converted
+    assert torch.equal(inputs[0], batch["image"])
@@ -0,0 +1,59 @@
+import pytest
+import torch
+from torch import nn
+
+from strix.models.cnn.layers.radam import RAdam
+
+
+def _net():
+    torch.manual_seed(0)
+    net = nn.Sequential(nn.Conv2d(2, 4, 3), nn.Flatten(), nn.Linear(4 * 16, 3), nn.Linear(3, 2))
+    net[3].double()
+    return net
+
+
+def _train(optim, net, n_steps, first_step=0):
+    torch.manual_seed(first_step)
+    for i in range(first_step, first_step + n_steps):
+        optim.zero_grad()
+        out = net[3](net[:3](torch.rand(4, 2, 6, 6)).double())
+        out.pow(2).mean().backward()
+        if i % 3 == 0:  # params with fewer steps
+            net[0].bias.grad = None
+        optim.step()
+
+
+@pytest.mark.parametrize("weight_decay,degenerated_to_sgd", [(0, True), (1e-2, True), (1e-2, False)])
+def test_radam_foreach(weight_decay, degenerated_to_sgd):
+    nets = [_net(), _net()]
+    optims = [
+        RAdam(net.parameters(), 1e-2, weight_decay=weight_decay, degenerated_to_sgd=degenerated_to_sgd, foreach=foreach)
+        for net, foreach in zip(nets, [False, True])
+    ]
+    for net, optim in zip(nets, optims):
+        _train(optim, net, 10)
+
+    for p, foreach_p in zip(*[net.parameters() for net in nets]):
+        assert foreach_p.dtype == p.dtype
+        torch.testing.assert_close(foreach_p, p)
+
+    state_dict, foreach_state_dict = [optim.state_dict() for optim in optims]
+    assert state_dict["param_groups"] == foreach_state_dict["param_groups"]
+    for idx, state in state_dict["state"].items():
+        assert state.keys() == foreach_state_dict["state"][idx].keys()
+        assert state["step"] == foreach_state_dict["state"][idx]["step"]
+        torch.testing.assert_close(foreach_state_dict["state"][idx]["exp_avg_sq"], state["exp_avg_sq"])
+
+
+def test_radam_load_state_dict():
+    nets = [_net(), _net()]
+    optim = RAdam(nets[0].parameters(), 1e-2, foreach=False)
+    _train(optim, nets[0], 4)
+    nets[1].load_state_dict(nets[0].state_dict())
+    foreach_optim = RAdam(nets[1].parameters(), 1e-2, foreach=True)
+    foreach_optim.load_state_dict(optim.state_dict())
+
+    _train(optim, nets[0], 6, first_step=4)
+    _train(foreach_optim, nets[1], 6, first_step=4)
+    for p, foreach_p in zip(*[net.parameters() for net in nets]):
+        torch.testing.assert_close(foreach_p, p)
@@ -0,0 +1,61 @@
+import pytest
+import torch
+from torch import nn
+
+from strix.models.cnn.layers.ranger21 import Ranger21
+
+
+def _net():
+    torch.manual_seed(0)
+    # no bias before the batch norm, its ~0 gradients would be normalized to rounding noise
+    return nn.Sequential(
+        nn.Conv2d(2, 8, 3, bias=False),
+        nn.BatchNorm2d(8),
+        nn.Flatten(start_dim=2),
+        nn.Conv1d(8, 4, 3),
+        nn.Flatten(),
+        nn.Linear(4 * 14, 3),
+    )
+
+
+def _train(foreach, n_steps=12, **kwargs):
+    net = _net()
+    optim = Ranger21(
+        net.parameters(), 1e-2, num_batches_per_epoch=4, num_epochs=3, lookahead_mergetime=3,
+        foreach=foreach, **kwargs
+    )
+    torch.manual_seed(1)
+    for _ in range(n_steps):
+        optim.zero_grad()
+        net(torch.rand(4, 2, 6, 6)).pow(2).mean().backward()
+        optim.step()
+    return net, optim
+
+
+@pytest.mark.parametrize(
+    "kwargs", [{}, {"use_adabelief": True}, {"gc_conv_only": True, "softplus": False, "normloss_active": False}]
+)
+def test_ranger21_foreach(kwargs):
+    net, optim = _train(False, **kwargs)
+    foreach_net, foreach_optim = _train(True, **kwargs)
+
+    for p, foreach_p in zip(net.parameters(), foreach_net.parameters()):
+        torch.testing.assert_close(foreach_p, p, rtol=1e-4, atol=1e-6)
+
+    state, foreach_state = optim.state_dict()["state"], foreach_optim.state_dict()["state"]
+    assert state.keys() == foreach_state.keys()
+    for idx in state:
+        assert state[idx].keys() == foreach_state[idx].keys()
+        assert state[idx]["step"] == foreach_state[idx]["step"]
+        torch.testing.assert_close(foreach_state[idx]["variance_ma"], state[idx]["variance_ma"], rtol=1e-4, atol=1e-8)
+
+
+def test_ranger21_foreach_default():
+    net = _net()
+    # the loop by default on CPU, foreach by default for CUDA params
+    assert not Ranger21(net.parameters(), 1e-2, num_batches_per_epoch=4, num_epochs=3).foreach
+    if torch.cuda.is_available():
+        assert Ranger21(net.cuda().parameters(), 1e-2, num_batches_per_epoch=4, num_epochs=3).foreach
+    assert not Ranger21(net.parameters(), 1e-2, num_batches_per_epoch=4, num_epochs=3, use_madgrad=True).foreach
+    with pytest.raises(ValueError):
+        Ranger21(net.parameters(), 1e-2, num_batches_per_epoch=4, num_epochs=3, use_madgrad=True, foreach=True)
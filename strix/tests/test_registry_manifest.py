@@ -0,0 +1,80 @@
+import os
+
+import strix.utilities.manifest as manifest
+from strix.utilities.manifest import load_manifest, register_lazy_sources, scan_registrations
+from strix.utilities.registry import DatasetRegistry, LazyRecord
+
+DATASET_SOURCE = """
+from strix.data_io import CLASSIFICATION_DATASETS
+
+@CLASSIFICATION_DATASETS.project("Lung")
+@CLASSIFICATION_DATASETS.multi_out("label1", "label2")
+@CLASSIFICATION_DATASETS.snapshot
+@CLASSIFICATION_DATASETS.register("3D", "lung-nodule", "/data/lung.json")
+def lung_dataset(files_list, phase, opts):
+    return files_list
+"""
+
+
+def _write_dataset(fpath):
+    fpath.write_text(DATASET_SOURCE)
+    return fpath
+
+
+def test_scan_metadata(tmp_path):
+    source = _write_dataset(tmp_path / "lung.py")
+    result = scan_registrations(source, ["CLASSIFICATION_DATASETS"])
+    assert not result["eager"]
+    registry, dim, name, meta = result["registrations"][0]
+    assert (registry, dim, name) == ("CLASSIFICATION_DATASETS", "3D", "lung-nodule")
+    assert meta["PATH"] == "/data/lung.json" and meta["TEST_PATH"] is None
+    assert meta["M_OUT"] == ["label1", "label2"] and meta["PROJECT"] == "Lung"
+    assert meta["SOURCE"] == os.path.abspath(source)
+    assert "M_IN" in meta["known"] and "M_IN" not in meta
+
+
+def test_scan_dataset_config(tmp_path):
+    config = tmp_path / "cfg.yaml"
+    config.write_text("ATTRIBUTE:\n  NAME: my-data\n  FRAMEWORK: segmentation\n  DIM: 2\n  FILES_LIST: /data/seg.json\n")
+    result = scan_registrations(config, ["DATASET_MAPPING[segmentation]"])
+    assert result["registrations"][0][:3] == ["DATASET_MAPPING[segmentation]", "2", "my-data"]
+    assert result["registrations"][0][3]["PATH"] == "/data/seg.json"
+
+
+def test_lazy_record(tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, "_manifest_path", lambda cache_name: tmp_path / f"{cache_name}.json")
+    source = _write_dataset(tmp_path / "lung.py")
+    registry, loaded = DatasetRegistry(), []
+
+    def loader(fpath, module_name):
+        loaded.append(fpath)
+        registry.register("3D", "lung-nodule", "/data/lung.json", module=len)
+        registry.multi_out("label1", "label2")(len)
+
+    register_lazy_sources({"CLASSIFICATION_DATASETS": registry}, [source], cache_name="test", loader=loader)
+    record = registry["3D"]["lung-nodule"]
+    assert isinstance(record, LazyRecord)
+    assert record.get("PROJECT") == "Lung" and record["M_OUT"] == ("label1", "label2")
+    assert record.get("M_IN") is None and not loaded
+
+    assert record["FN"] is len and len(loaded) == 1
+    assert registry["3D"]["lung-nodule"]["FN"] is len
+
+
+def test_incremental_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, "_manifest_path", lambda cache_name: tmp_path / f"{cache_name}.json")
+    sources = [_write_dataset(tmp_path / f"data{i}.py") for i in range(3)]
+    scanned = []
+    scan = manifest.scan_registrations
+    monkeypatch.setattr(manifest, "scan_registrations", lambda f, r: scanned.append(f) or scan(f, r))
+
+    load_manifest(sources, ["CLASSIFICATION_DATASETS"], "test")
+    assert len(scanned) == 3
+
+    scanned.clear()
+    sources[1].write_text(DATASET_SOURCE.replace("lung-nodule", "lung-mass"))
+    os.utime(sources[1], ns=(0, 0))
+    entries = load_manifest(sources[:2], ["CLASSIFICATION_DATASETS"], "test")
+    assert scanned == [sources[1]]
+    assert entries[str(sources[1])]["registrations"][0][2] == "lung-mass"
+    assert str(sources[2]) not in entries
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from strix.data_io.samplers import (
+    ClassBalancedBatchSampler,
+    DistributedWeightedRandomSampler,
+    compute_sample_weights,
+)
+
+
+def test_sample_weights():
+    weights = compute_sample_weights([0, 0, 0, 1])
+    assert np.allclose(weights, [1 / 6, 1 / 6, 1 / 6, 1 / 2])
+    assert compute_sample_weights([0, 0, 0, 1]) is weights  # cached
+
+    multitask = [[0, 1], [0, 1], [1, 1], [1, 0]]
+    assert np.allclose(compute_sample_weights(multitask, "joint"), [1 / 6, 1 / 6, 1 / 3, 1 / 3])
+    assert np.allclose(compute_sample_weights(multitask, "per_task"), [5 / 24, 5 / 24, 5 / 24, 9 / 24])
+
+    with pytest.raises(ValueError):
+        compute_sample_weights([[0, 1], [1]])
+
+
+def test_distributed_weighted_sampler():
+    weights = compute_sample_weights([0] * 90 + [1] * 10)
+    samplers = [DistributedWeightedRandomSampler(weights, seed=1, num_replicas=2, rank=r) for r in range(2)]
+    indices = [list(s) for s in samplers]
+    assert len(indices[0]) == len(indices[1]) == 50
+    assert 20 < np.sum(np.array(indices[0] + indices[1]) >= 90) < 80
+    assert list(samplers[0]) != indices[0]  # next epoch
+
+
+@pytest.mark.parametrize("batch_size", [2, 5])
+def test_class_balanced_batch_sampler(batch_size):
+    labels = [0] * 50 + [1] * 5 + [2] * 3
+    batches = [
+        list(ClassBalancedBatchSampler(labels, batch_size, seed=3, num_replicas=2, rank=r)) for r in range(2)
+    ]
+    assert len(batches[0]) == len(batches[1]) == int(np.ceil(58 / batch_size / 2))
+    for batch in batches[0] + batches[1]:
+        classes = [labels[i] for i in batch]
+        assert len(batch) == batch_size
+        assert len(set(classes)) == min(batch_size, 3)
+    assert not set(map(tuple, batches[0])) & set(map(tuple, batches[1]))
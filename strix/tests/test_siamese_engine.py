@@ -0,0 +1,72 @@
+from types import SimpleNamespace as sn
+
+import torch
+from torch import nn
+from torch.optim import SGD, lr_scheduler
+from torch.utils.tensorboard import SummaryWriter
+
+from monai_ex.data import DataLoader
+from strix.data_io.base_dataset.siamese_dataset import SiameseDatasetWrapper
+from strix.data_io.dataio import set_siamese_pairing
+from strix.models import get_network
+from strix.models.cnn.engines.siamese_engines import build_siamese_engine
+from strix.models.cnn.losses import LOSS_MAPPING
+
+
+def _dataset(n=8):
+    torch.manual_seed(0)
+    return [{"image": torch.rand(1, 16, 16), "label": torch.tensor(i % 2)} for i in range(n)]
+
+
+def _opts(**kwargs):
+    opts = {
+        "framework": "siamese", "criterion": "BatchHardTripletLoss", "tensor_dim": "2D", "model_name": "vgg9",
+        "input_nc": 1, "output_nc": 1, "n_epoch": 1, "n_epoch_len": 1, "amp": False, "save_epoch_freq": 1,
+    }
+    opts.update(kwargs)
+    return sn(**opts)
+
+
+def test_siamese_in_batch_get_network():
+    net = get_network(_opts(bottleneck_size=2))
+    embeddings = net(torch.rand(4, 1, 16, 16))
+    assert embeddings.shape == (4, 512 * 2 * 2)
+
+    _, logits = get_network(_opts(criterion="ContrastiveCELoss", bottleneck_size=2))(torch.rand(4, 1, 16, 16))
+    assert logits.shape == (4, 1)
+
+
+def test_siamese_in_batch_pairing():
+    dataset = SiameseDatasetWrapper(_dataset())
+    set_siamese_pairing(DataLoader(dataset, batch_size=4), _opts())
+    assert dataset.pairing == "in_batch"
+    set_siamese_pairing(dataset, _opts(criterion="ContrastiveLoss"))
+    assert dataset.pairing == "random"
+
+
+def test_siamese_in_batch_engine(tmp_path):
+    opts = _opts()
+    dataset = SiameseDatasetWrapper(_dataset())
+    set_siamese_pairing(dataset, opts)
+    net = nn.Sequential(nn.Flatten(), nn.Linear(16 * 16, 8))
+    optim = SGD(net.parameters(), 0.01)
+
+    trainer = build_siamese_engine(
+        opts=opts,
+        train_loader=DataLoader(dataset, batch_size=4),
+        test_loader=DataLoader(dataset, batch_size=4),
+        net=net,
+        loss=LOSS_MAPPING["siamese"][opts.criterion](),
+        optim=optim,
+        lr_scheduler=lr_scheduler.LambdaLR(optim, lr_lambda=lambda x: 1),
+        writer=SummaryWriter(log_dir=tmp_path / "tensorboard"),
+        valid_interval=1,
+        device=torch.device("cpu"),
+        model_dir=tmp_path,
+    )
+    trainer.run()
+
+    assert trainer.state.epoch == 1
+    assert torch.isfinite(torch.as_tensor(trainer.state.output["loss"]))
+    # best models are scored by the val_loss metric of the evaluator
+    assert list((tmp_path / "Best_Models").glob("*val_loss*.pt"))
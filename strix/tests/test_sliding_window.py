@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+import torch
+from monai.inferers import SimpleInferer, sliding_window_inference
+
+from strix.models.cnn.inferers import (
+    CascadeInferer,
+    ROISlidingWindowInferer,
+    TTAInferer,
+    expand_window,
+    foreground_boxes,
+    tta_variants,
+)
+
+
+def _network(x):
+    return torch.cat([1 - x, x * 2], dim=1)
+
+
+def _image(dim):
+    image = torch.zeros((2, 1) + (40,) * dim)
+    image[(slice(None), slice(None)) + (slice(5, 12),) * dim] = torch.rand((2, 1) + (7,) * dim) + 0.5
+    return image
+
+
+@pytest.mark.parametrize("dim", [2, 3])
+@pytest.mark.parametrize("mode", ["constant", "gaussian"])
+@pytest.mark.parametrize("sw_batch_size", [0, 3])
+def test_same_as_monai(dim, mode, sw_batch_size):
+    image = _image(dim)
+    expected = sliding_window_inference(image, (16,) * dim, 4, _network, overlap=0.5, mode=mode)
+    inferer = ROISlidingWindowInferer((16,) * dim, sw_batch_size, overlap=0.5, mode=mode)
+    assert torch.allclose(inferer(image, _network), expected, atol=1e-5)
+    assert inferer.n_skipped == 0
+
+
+@pytest.mark.parametrize("dim", [2, 3])
+def test_skip_background(dim):
+    image = _image(dim)
+    expected = sliding_window_inference(image, (16,) * dim, 4, _network, overlap=0.5, mode="gaussian")
+
+    inferer = ROISlidingWindowInferer((16,) * dim, 4, overlap=0.5, fg_threshold=0.1, fg_margin=2, device="cpu")
+    output = inferer(image, _network)
+    assert 0 < inferer.n_skipped < inferer.n_windows
+
+    # windows covering the foreground are kept, far background is filled
+    foreground = (slice(None), slice(None)) + (slice(5, 12),) * dim
+    assert torch.allclose(output[foreground], expected[foreground], atol=1e-5)
+    corner = (slice(None), slice(None)) + (slice(-2, None),) * dim
+    assert torch.all(output[corner].argmax(1) == 0)
+
+
+def test_coarse_and_empty():
+    image = torch.zeros(1, 1, 40, 40)
+    inferer = ROISlidingWindowInferer((16, 16), 2, overlap=0.25, coarse=True)
+    output = inferer(image, _network)
+    assert inferer.n_skipped == inferer.n_windows
+    assert output.shape == (1, 2, 40, 40) and torch.all(output.argmax(1) == 0)
+
+
+def test_small_image():
+    image = torch.rand(1, 1, 10, 30)
+    expected = sliding_window_inference(image, (16, 16), 2, _network)
+    assert torch.allclose(ROISlidingWindowInferer((16, 16), 2, mode="constant")(image, _network), expected)
+
+
+def test_expand_window():
+    assert expand_window((slice(0, 16), slice(8, 24)), 4) == (slice(0, 20), slice(4, 28))
+
+
+def test_foreground_boxes():
+    mask = np.zeros((20, 20, 20), dtype=bool)
+    mask[2:4, 2:4, 2:4] = mask[15:18, 15:18, 15:18] = mask[5:6, 5:6, 5:6] = True
+    boxes = foreground_boxes(mask, margin=1)
+    assert sorted(boxes) == [(slice(1, 7),) * 3, (slice(14, 19),) * 3]
+
+
+@pytest.mark.parametrize("dim", [2, 3])
+def test_cascade(dim):
+    image = torch.zeros((1, 1) + (64,) * dim)
+    image[(slice(None), slice(None)) + (slice(8, 20),) * dim] = 1.0
+    image[(slice(None), slice(None)) + (slice(40, 52),) * dim] = 1.0
+    expected = sliding_window_inference(image, (16,) * dim, 4, _network, overlap=0.5)
+
+    inferer = CascadeInferer(ROISlidingWindowInferer((16,) * dim, 4, overlap=0.5), (16,) * dim, scale=0.5, margin=4)
+    output = inferer(image, lambda x: _network(x) - torch.tensor([0.5, 0.0]).view(1, 2, *([1] * dim)))
+    assert len(inferer.boxes[0]) == 2
+    for box in inferer.boxes[0]:
+        roi = (slice(None), slice(None)) + box
+        assert torch.allclose(output[roi].argmax(1), expected[roi].argmax(1))
+    assert torch.all(output[(slice(None), slice(None)) + (slice(28, 32),) * dim].argmax(1) == 0)
+
+    empty = inferer(torch.zeros_like(image), _network)
+    assert inferer.boxes == [[]] and torch.all(empty.argmax(1) == 0)
+
+
+@pytest.mark.parametrize("dim, mode, n_variants", [(2, "flip", 4), (3, "flip", 8), (2, "rot90", 4), (2, "flip+rot90", 8)])
+def test_tta_variants(dim, mode, n_variants):
+    variants = tta_variants(dim, mode)
+    assert len(variants) == n_variants and variants[0] == ((), 0)
+
+
+@pytest.mark.parametrize("mode", ["flip", "rot90", "flip+rot90"])
+@pytest.mark.parametrize("max_batch", [0, 2])
+def test_tta_inferer(mode, max_batch):
+    conv = torch.nn.Conv2d(1, 2, 3, padding=1)
+    image = torch.rand(2, 1, 12, 16)
+    variants = tta_variants(2, mode)
+
+    expected = 0
+    with torch.no_grad():
+        for axes, k in variants:
+            data = torch.rot90(torch.flip(image, [a + 2 for a in axes]), k, dims=(2, 3))
+            pred = torch.rot90(conv(data), -k, dims=(2, 3))
+            expected = expected + torch.flip(pred, [a + 2 for a in axes])
+        output = TTAInferer(SimpleInferer(), mode, max_batch)(image, conv)
+    assert torch.allclose(output, expected / len(variants), atol=1e-5)
+
+
+def test_tta_compose():
+    image = _image(2)
+    sw = ROISlidingWindowInferer((16, 16), 4, overlap=0.5)
+    # pointwise network is invariant to flips
+    assert torch.allclose(TTAInferer(sw, "flip+rot90")(image, _network), sw(image, _network), atol=1e-5)
+
+    linear = torch.nn.Sequential(torch.nn.Flatten(), torch.nn.Linear(12 * 12, 3))
+    image = torch.rand(4, 1, 12, 12)
+    with torch.no_grad():
+        expected = sum(linear(torch.flip(image, [a + 2 for a in axes])) for axes, _ in tta_variants(2, "flip")) / 4
+        assert torch.allclose(TTAInferer(SimpleInferer(), "flip")(image, linear), expected, atol=1e-5)
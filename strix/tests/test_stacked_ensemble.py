@@ -0,0 +1,78 @@
+import pytest
+import torch
+
+from strix.models.cnn.layers.ensemble import StackedEnsemble
+from strix.models.cnn.nets.dynunet import DynUNet
+
+
+def _nets(n_models, dim=2):
+    nets = []
+    for i in range(n_models):
+        torch.manual_seed(i)
+        nets.append(DynUNet(dim, 1, 3, (3,) * 3, (1,) + (2,) * 2, (1,) + (2,) * 2).eval())
+    return nets
+
+
+def _ensemble(nets, **kwargs):
+    ensemble = StackedEnsemble(nets[0], len(nets), **kwargs).eval()
+    for model, net in zip(ensemble.models, nets):
+        model.load_state_dict(net.state_dict())
+    return ensemble
+
+
+def test_independent_weights():
+    nets = _nets(3)
+    ensemble = _ensemble(nets)
+    params = [next(m.parameters()) for m in ensemble.models]
+    assert params[0] is not params[1]
+    assert not torch.equal(params[0], params[1])
+
+
+@pytest.mark.parametrize("group_size", [0, 1, 2])
+def test_mean_ensemble(group_size):
+    nets, weights = _nets(3), [0.5, 0.8, 0.7]
+    image = torch.rand(2, 1, 16, 16)
+    ensemble = _ensemble(nets, weights=weights, group_size=group_size)
+    with torch.no_grad():
+        expected = sum(w * net(image) for w, net in zip(weights, nets)) / sum(weights)
+        assert torch.allclose(ensemble(image), expected, atol=1e-5)
+        # weights loaded after the first forward are used
+        ensemble.models[0].load_state_dict(nets[1].state_dict())
+        expected = (0.5 * nets[1](image) + 0.8 * nets[1](image) + 0.7 * nets[2](image)) / 2.0
+        assert torch.allclose(ensemble(image), expected, atol=1e-5)
+
+
+def test_vote_ensemble():
+    nets = _nets(3)
+    image = torch.rand(2, 1, 16, 16)
+    with torch.no_grad():
+        votes = torch.stack([net(image).argmax(1) for net in nets])
+        scores = _ensemble(nets, mode="vote")(image)
+    counts = torch.stack([(votes == c).sum(0) for c in range(3)], dim=1).float()
+    assert torch.allclose(scores, counts / 3)
+
+
+def test_binary_vote_and_multi_output():
+    class TwoHeads(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.fc = torch.nn.Linear(4, 1)
+
+        def forward(self, x):
+            return self.fc(x), -self.fc(x)
+
+    nets = [TwoHeads() for _ in range(3)]
+    x = torch.rand(5, 4)
+    with torch.no_grad():
+        out1, out2 = _ensemble(nets, mode="vote")(x)
+        majority = torch.stack([net(x)[0] > 0 for net in nets]).sum(0) > 1
+    assert torch.equal(out1 > 0, majority) and torch.equal(out2 > 0, ~majority)
+
+
+def test_invalid_args():
+    with pytest.raises(ValueError):
+        StackedEnsemble(torch.nn.Linear(2, 1), 2, mode="max")
+    with pytest.raises(ValueError):
+        StackedEnsemble(torch.nn.Linear(2, 1), 2, weights=[1.0])
+    with pytest.raises(RuntimeError):
+        StackedEnsemble(torch.nn.Linear(2, 1), 2)(torch.rand(1, 2))
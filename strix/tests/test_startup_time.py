@@ -0,0 +1,73 @@
+import sys
+import json
+import subprocess
+
+import strix.utilities.manifest as manifest
+from strix.utilities.manifest import register_lazy_sources, scan_registrations
+from strix.utilities.registry import DimRegistry
+
+# modules deferred until a command runs, they must not be imported by the CLI entries
+HEAVY_MODULES = [
+    "sklearn",
+    "matplotlib.pyplot",
+    "torch.utils.tensorboard",
+    "strix.models.cnn.cnn_nets",
+    "strix.models.cnn.engines",
+    "strix.data_io.base_dataset",
+]
+
+_PROBE = """
+import sys, json
+import strix.main_entry, strix.data_checker
+from strix.models import ARCHI_MAPPING
+names = list(ARCHI_MAPPING["segmentation"]["3D"].keys())
+print(json.dumps({"modules": list(sys.modules), "names": names}))
+"""
+
+
+def _run_probe():
+    output = subprocess.run([sys.executable, "-c", _PROBE], capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def test_startup_imports():
+    # both when the registry manifest is built and when it is read from the cache
+    for result in (_run_probe(), _run_probe()):
+        assert "unet" in result["names"]
+        loaded = [m for m in HEAVY_MODULES if m in result["modules"]]
+        assert not loaded, f"Heavy modules imported at startup: {loaded}"
+
+
+def test_lazy_registration(tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, "_manifest_path", lambda cache_name: tmp_path / f"{cache_name}.json")
+    source = tmp_path / "my_nets.py"
+    source.write_text(
+        "from strix.models import SEGMENTATION_ARCHI\n"
+        "@SEGMENTATION_ARCHI.register('2D', 'my-net')\n"
+        "@SEGMENTATION_ARCHI.register('3D', 'my-net')\n"
+        "def my_net(*args, **kwargs):\n"
+        "    return 'net'\n"
+    )
+    assert scan_registrations(source, ["SEGMENTATION_ARCHI"]) == {
+        "eager": False,
+        "registrations": [["SEGMENTATION_ARCHI", "2D", "my-net", None], ["SEGMENTATION_ARCHI", "3D", "my-net", None]],
+    }
+
+    registry, loaded = DimRegistry(), []
+
+    def loader(fpath, module_name):
+        loaded.append(fpath)
+        registry.register("2D", "my-net", lambda *args, **kwargs: "net")
+        registry.register("3D", "my-net", lambda *args, **kwargs: "net")
+
+    register_lazy_sources({"SEGMENTATION_ARCHI": registry}, [source], cache_name="test", loader=loader)
+    assert list(registry["2D"].keys()) == ["my-net"] and not loaded
+    assert registry["2D"]["my-net"]() == "net"
+    assert registry["3D"]["my-net"]() == "net"
+    assert len(loaded) == 1
+
+
+def test_eager_registration(tmp_path):
+    source = tmp_path / "dynamic_nets.py"
+    source.write_text("for name in ['a', 'b']:\n    SEGMENTATION_ARCHI.register('2D', name, None)\n")
+    assert scan_registrations(source, ["SEGMENTATION_ARCHI"])["eager"]
@@ -10,7 +10,15 @@ from strix.utilities.click_callbacks import NumericChoice as Choice, framework_s
 from strix.utilities.click_callbacks import (
     data_select, loss_select, lr_schedule_params, model_select, parse_input_str, multi_ouputnc
 )
-from strix.utilities.enum import ACTIVATIONS, FRAMEWORKS, LR_SCHEDULES, NORMS, OPTIMIZERS
+from strix.utilities.enum import (
+    ACTIVATIONS,
+    FRAMEWORKS,
+    LR_SCHEDULES,
+    NORMS,
+    OPTIMIZERS,
+    IMBALANCE_SAMPLERS,
+    SAMPLE_WEIGHTINGS,
+)
 from utils_cw import prompt_when
 
 import click
@@ -72,6 +80,14 @@ def common_params(func):
     @option("--n-batch-valid", prompt=True, show_default=True, type=int, default=5, help="Valid batch size")
     @option("--n-worker", type=int, default=10, help="Num of workers for training dataloader")
     @option("-IS", "--imbalance-sample", is_flag=True, help="Use imbalanced dataset sampling")
+    @option(
+        "--imbalance-sampler", type=Choice(IMBALANCE_SAMPLERS), default="weighted",
+        help="Weighted random sampling or class-balanced batches for imbalanced dataset sampling",
+    )
+    @option(
+        "--imbalance-weighting", type=Choice(SAMPLE_WEIGHTINGS), default="joint",
+        help="Weight multi-label/multitask labels by their combinations or per task",
+    )
     @option("--downsample", type=int, default=-1, help="Downsample rate. disable:-1")
     @option("--input-nc", type=int, default=1, prompt=True, help="Input data channels")
     @option("--output-nc", type=UNPROCESSED, default=1, prompt=True, callback=multi_ouputnc, help="Output channels")
@@ -132,6 +148,7 @@ def network_params(func):
     @option("--n-depth", type=int, default=-1, help="Network depth. -1: use default depth")
     @option("--feature-scale", type=int, default=4, help="not used")
     @option("--snip", is_flag=True)
+    @option("--grad-checkpoint", type=int, default=0, help="Num of activation checkpointing segments, 0 to disable")
     # @optionex('--layer-order', prompt=True, type=Choice(LAYER_ORDERS), default=1, help='conv layer order')
     # @optionex('--bottleneck', type=bool, default=False, help='Use bottlenect achitecture')
     # @optionex('--sep-conv', type=bool, default=False, help='Use Depthwise Separable Convolution')
@@ -161,6 +178,28 @@ def hidden_auxilary_params(func):
     @option("--do-test", type=bool, default=False, hidden=True, help="Automatically do test after training")
     @option("--subtask1", type=str, default=None, hidden=True, help="Subtask 1 in multitask framework")
     @option("--subtask2", type=str, default=None, hidden=True, help="Subtask 2 in multitask framework")
+    @option("--ddp-nproc", type=int, default=0, hidden=True, help="Num of processes of distributed training")
+    @option("--ddp-backend", type=str, default=None, hidden=True, help="Backend of distributed training")
+    @option("--ddp-port", type=int, default=29500, hidden=True, help="Port of the master process")
+    @option("--prefetch-batch", type=int, default=0, hidden=True, help="Num of batches prefetched to device")
+    @option(
+        "--compile", type=Choice(["none", "script", "compile"]), default="none", hidden=True, help="Compile the network"
+    )
+    @option(
+        "--precision", type=Choice(["fp32", "fp16", "bf16"]), default=None, hidden=True,
+        help="Precision of train & test, defaults to fp16 if amp else fp32. fp16 is replaced by bf16 on CPU",
+    )
+    @option(
+        "--memory-format", type=Choice(["contiguous", "channels_last"]), default="contiguous", hidden=True,
+        help="Memory format of network & inputs, channels_last_3d for 3D",
+    )
+    @option("--accumulation-steps", type=int, default=1, hidden=True, help="Num of batches per optimizer step")
+    @option(
+        "--effective-batch", type=int, default=0, hidden=True,
+        help="Batch size per optimizer step over all processes, overrides accumulation-steps if > 0",
+    )
+    @option("--micro-batch", type=int, default=0, hidden=True, help="Num of samples per forward, 0 for whole batch")
+    @option("--split-on-oom", type=bool, default=False, hidden=True, help="Halve micro-batch on out of memory")
     @wraps(func)
     def wrapper(*args, **kwargs):
         return func(*args, **kwargs)
@@ -0,0 +1,169 @@
+"""
+Asynchronous writing of the results of test engines.
+
+Savers (eg. `SegmentationSaver`, `ImageBatchSaver`) resample, compress and write NIfTI files
+on the engine thread, which leaves the GPU idle. `AsyncWriter` runs their savers in a pool of
+processes instead. Outputs are moved to CPU before submitted, the num of pending writes is
+bounded, so the engine waits only if the writers fall behind (backpressure). All pending
+writes are flushed when the engine completes.
+"""
+import logging
+import multiprocessing as mp
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, List, Optional, Sequence
+
+import numpy as np
+import torch
+from ignite.engine import Engine, Events
+
+SAVER_ATTRS = ("_saver", "saver")
+DEFAULT_COMPRESS_LEVEL = 1
+
+
+def set_compress_level(level: int) -> None:
+    """Set the gzip level of `.nii.gz` files written by nibabel, 1 (fastest) to 9 (smallest)."""
+    from nibabel.openers import Opener
+
+    Opener.default_compresslevel = level
+
+
+def get_output_ext(opts: Any) -> str:
+    """Uncompressed `.nii` if `save_compress_level` is 0, else `.nii.gz`."""
+    return ".nii" if getattr(opts, "save_compress_level", DEFAULT_COMPRESS_LEVEL) == 0 else ".nii.gz"
+
+
+def _to_cpu(data: Any) -> Any:
+    if isinstance(data, torch.Tensor):
+        return data.detach().cpu().numpy()
+    if isinstance(data, dict):
+        return {k: _to_cpu(v) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return type(data)(_to_cpu(v) for v in data)
+    return data
+
+
+def _save(saver: Callable, img: np.ndarray, meta_data: Optional[dict]) -> None:
+    saver(img, meta_data)
+
+
+class AsyncWriter:
+    """Pool of processes which run the savers, see module docstring.
+
+    Args:
+        num_workers: num of writer processes.
+        max_pending: max num of pending writes, the submission blocks if reached.
+            Defaults to `4 * num_workers`.
+        compress_level: gzip level of `.nii.gz` files in the writers.
+    """
+
+    def __init__(
+        self, num_workers: int, max_pending: Optional[int] = None, compress_level: int = DEFAULT_COMPRESS_LEVEL
+    ) -> None:
+        if num_workers < 1:
+            raise ValueError(f"num_workers must be positive, but got {num_workers}")
+        self.num_workers = num_workers
+        self.max_pending = max_pending or 4 * num_workers
+        self.compress_level = compress_level
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: List[Future] = []
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:  # spawned on first write, CUDA is not fork-safe
+            self._pool = ProcessPoolExecutor(
+                self.num_workers,
+                mp_context=mp.get_context("spawn"),
+                initializer=set_compress_level,
+                initargs=(self.compress_level,),
+            )
+        return self._pool
+
+    def _collect(self, futures: Sequence[Future]) -> None:
+        for future in futures:
+            self._pending.remove(future)
+            future.result()  # raise errors of the writers
+
+    def submit(self, saver: Callable, img: Any, meta_data: Optional[dict] = None) -> None:
+        self._collect([f for f in self._pending if f.done()])
+        if len(self._pending) >= self.max_pending:
+            done, _ = wait(self._pending, return_when=FIRST_COMPLETED)
+            self._collect(list(done))
+        self._pending.append(self.pool.submit(_save, saver, _to_cpu(img), _to_cpu(meta_data)))
+
+    def flush(self) -> None:
+        """Wait for all pending writes."""
+        wait(self._pending)
+        self._collect(list(self._pending))
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            for future in self._pending:
+                future.cancel()
+            self._pool.shutdown(wait=True)
+            self._pool, self._pending = None, []
+
+    def _completed(self, engine: Engine) -> None:
+        try:
+            self.flush()
+        finally:
+            self.shutdown()
+
+    def _exception_raised(self, engine: Engine, e: Exception) -> None:
+        self.shutdown()
+        raise e
+
+    def attach(self, engine: Engine) -> None:
+        engine.add_event_handler(Events.COMPLETED, self._completed)
+        engine.add_event_handler(Events.EXCEPTION_RAISED, self._exception_raised)
+
+
+class _AsyncSaver:
+    """Proxy of a saver, which submits the writes to `AsyncWriter`."""
+
+    def __init__(self, saver: Callable, writer: AsyncWriter) -> None:
+        self.saver = saver
+        self.writer = writer
+
+    def __call__(self, img: Any, meta_data: Optional[dict] = None) -> Any:
+        if meta_data is None:  # filenames are indexed by the saver itself, keep it in order
+            return self.saver(img, meta_data)
+        self.writer.submit(self.saver, img, meta_data)
+        return img
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.saver, name)
+
+
+def attach_async_writer(
+    engine: Engine,
+    handlers: Sequence,
+    num_workers: int = 0,
+    compress_level: int = DEFAULT_COMPRESS_LEVEL,
+    max_pending: Optional[int] = None,
+) -> Optional[AsyncWriter]:
+    """Run the savers of `handlers` asynchronously in `num_workers` processes.
+    Savers are written synchronously if `num_workers` is 0, with the given `compress_level`.
+
+    Returns:
+        AsyncWriter attached to the engine, None if synchronous.
+    """
+    if compress_level > 0:
+        set_compress_level(compress_level)
+    if num_workers <= 0:
+        return None
+
+    writer = AsyncWriter(num_workers, max_pending, compress_level)
+    n_async = 0
+    for handler in handlers:
+        for attr in SAVER_ATTRS:
+            saver = getattr(handler, attr, None)
+            if callable(saver) and not isinstance(saver, _AsyncSaver):
+                setattr(handler, attr, _AsyncSaver(saver, writer))
+                n_async += 1
+                break
+    if n_async == 0:
+        return None
+
+    writer.attach(engine)
+    logging.getLogger("strix").info(f"Write results of {n_async} savers in {num_workers} processes")
+    return writer
@@ -0,0 +1,164 @@
+"""
+Utilities of distributed data parallel (DDP) training.
+
+Processes are either spawned by `launch` (eg. `strix-train-dist`), one per GPU, or started
+by `torchrun`, whose env vars (`RANK`, `LOCAL_RANK`, `WORLD_SIZE`, `MASTER_ADDR`, ...)
+are read by `init_distributed`. Without GPUs, the `gloo` backend runs on CPU.
+"""
+import os
+from typing import Any, Callable, Optional, Sequence, Tuple
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from ignite.metrics import Metric
+from monai.metrics import CumulativeIterationMetric
+from monai.utils import evenly_divisible_all_gather
+
+_LOCAL_RANK = 0
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank() -> int:
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_local_rank() -> int:
+    return _LOCAL_RANK if is_distributed() else 0
+
+
+def get_world_size() -> int:
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process() -> bool:
+    return get_rank() == 0
+
+
+def get_dist_info(num_replicas: Optional[int] = None, rank: Optional[int] = None) -> Tuple[int, int]:
+    """World size & rank of current process, (1, 0) if distributed is not initialized."""
+    if num_replicas is None:
+        num_replicas = get_world_size()
+    if rank is None:
+        rank = get_rank()
+    if not 0 <= rank < num_replicas:
+        raise ValueError(f"Invalid rank {rank}, rank should be in the interval [0, {num_replicas - 1}]")
+    return num_replicas, rank
+
+
+def init_distributed(
+    rank: Optional[int] = None,
+    world_size: Optional[int] = None,
+    local_rank: Optional[int] = None,
+    backend: Optional[str] = None,
+    port: int = 29500,
+) -> torch.device:
+    """Init the default process group, args not given are read from the env vars of `torchrun`.
+
+    Args:
+        rank: global rank of current process.
+        world_size: num of processes.
+        local_rank: rank of current process on this node, also the index of its GPU.
+        backend: 'nccl' or 'gloo', defaults to 'nccl' if GPUs are available.
+        port: port of the master process, used if `MASTER_PORT` is not set.
+
+    Returns:
+        torch.device: device of current process.
+    """
+    global _LOCAL_RANK
+
+    rank = int(os.environ.get("RANK", 0)) if rank is None else rank
+    world_size = int(os.environ.get("WORLD_SIZE", 1)) if world_size is None else world_size
+    _LOCAL_RANK = int(os.environ.get("LOCAL_RANK", rank)) if local_rank is None else local_rank
+    backend = backend or ("nccl" if torch.cuda.is_available() else "gloo")
+    os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+    os.environ.setdefault("MASTER_PORT", str(port))
+
+    if not is_distributed():
+        dist.init_process_group(backend, rank=rank, world_size=world_size)
+    if backend == "nccl":
+        torch.cuda.set_device(_LOCAL_RANK)
+        return torch.device(f"cuda:{_LOCAL_RANK}")
+    return torch.device("cpu")
+
+
+def cleanup_distributed() -> None:
+    if is_distributed():
+        dist.destroy_process_group()
+
+
+def _launch_worker(local_rank: int, fn: Callable, world_size: int, args: Sequence, backend: str, port: int):
+    init_distributed(local_rank, world_size, local_rank, backend, port)
+    try:
+        fn(*args)
+    finally:
+        cleanup_distributed()
+
+
+def launch(fn: Callable, nproc: int, args: Sequence = (), backend: Optional[str] = None, port: int = 29500) -> None:
+    """Run `fn(*args)` in `nproc` processes on this node, each with an initialized process group.
+    `fn` and `args` must be picklable.
+    """
+    mp.spawn(_launch_worker, args=(fn, nproc, tuple(args), backend, port), nprocs=nproc, join=True)
+
+
+def barrier() -> None:
+    if is_distributed():
+        dist.barrier()
+
+
+class AllGatherMetric(Metric):
+    """Compute the wrapped metric over the outputs of all processes.
+
+    `(y_pred, y)` of each iteration are buffered locally and gathered only once in `compute`,
+    so the processes may run different numbers of iterations (eg. uneven validation shards).
+
+    Args:
+        metric: ignite metric which only sees the outputs of current process.
+    """
+
+    def __init__(self, metric: Metric) -> None:
+        self.metric = metric
+        super().__init__(output_transform=metric._output_transform, device=metric._device)
+
+    def reset(self) -> None:
+        self.metric.reset()
+        self._y_pred, self._y = [], []
+        self._decollated = False
+
+    @staticmethod
+    def _collate(data: Any) -> torch.Tensor:
+        if isinstance(data, (list, tuple)):  # decollated batch
+            return torch.stack(list(data))
+        return data
+
+    def update(self, output: Sequence[torch.Tensor]) -> None:
+        y_pred, y = output
+        self._decollated = isinstance(y_pred, (list, tuple))
+        self._y_pred.append(self._collate(y_pred).detach())
+        self._y.append(self._collate(y).detach())
+
+    def compute(self) -> Any:
+        y_pred = evenly_divisible_all_gather(torch.cat(self._y_pred), concat=True)
+        y = evenly_divisible_all_gather(torch.cat(self._y), concat=True)
+        if self._decollated:
+            y_pred, y = list(y_pred), list(y)
+
+        self.metric.reset()
+        self.metric.update((y_pred, y))
+        self.metric._is_reduced = True  # data are gathered already, skip the all-reduce of ignite metrics
+        return self.metric.compute()
+
+
+def sync_metric(metric: Metric) -> Metric:
+    """Make the metric computed over the data of all processes in distributed training.
+
+    MONAI's cumulative metrics (eg. `MeanDice`, `ROCAUC`) gather their buffers across processes
+    before aggregation by themselves, other metrics are wrapped by `AllGatherMetric`.
+    """
+    if not is_distributed() or isinstance(getattr(metric, "metric_fn", None), CumulativeIterationMetric):
+        return metric
+    return AllGatherMetric(metric)
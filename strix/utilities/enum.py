@@ -26,6 +26,22 @@ class Phases(Enum):
 PHASES = get_enums(Phases)
 
 
+class ImbalanceSamplers(Enum):
+    WEIGHTED = "weighted"
+    BALANCED_BATCH = "balanced-batch"
+
+
+IMBALANCE_SAMPLERS = get_enums(ImbalanceSamplers)
+
+
+class SampleWeightings(Enum):
+    JOINT = "joint"
+    PER_TASK = "per_task"
+
+
+SAMPLE_WEIGHTINGS = get_enums(SampleWeightings)
+
+
 class Norms(Enum):
     BATCH = "batch"
     INSTANCE = "instance"
@@ -0,0 +1,262 @@
+"""
+Manifest of the modules registered by source files, built by static scanning.
+
+Importing every network/dataset file just to list the registered names (eg. for the click
+prompts) is slow, since each one pulls in torch, MONAI transforms etc. Instead, the `register`
+calls of each file are found by parsing its AST, and lazy placeholders are registered.
+The file is imported only when one of its names is accessed.
+
+Besides the names, the attributes of datasets set by literal arguments of the decorators
+(`register` paths, `multi_in`, `multi_out`, `snapshot` and `project`) are recorded,
+so they can be read without importing the file. Dataset configs (yaml) are recorded
+by their `ATTRIBUTE` section.
+
+The manifest is cached in `CACHE_DIR` and updated incrementally, only the files which are
+added or modified (by mtime & size) since the last run are scanned again.
+
+Files which cannot be scanned reliably (eg. registering to an aliased registry, or with
+non-literal names) are imported eagerly as before.
+"""
+import ast
+import json
+import os
+import importlib
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Set, Tuple, Union
+
+import strix.utilities.oyaml as yaml
+from strix.configures import config as cfg
+from strix.utilities.imports import import_file
+
+MANIFEST_VERSION = 2
+CONFIG_SUFFIXES = (".yaml",)
+# dataset attributes which can be recorded by the manifest
+DATASET_META_KEYS = ("PATH", "TEST_PATH", "M_IN", "M_OUT", "SOURCE", "PROJECT")
+_META_DECORATORS = {"multi_in": "M_IN", "multi_out": "M_OUT", "project": "PROJECT"}
+_LOADED_FILES = {}
+
+
+def _registry_name(node: ast.AST) -> Optional[str]:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    if isinstance(node, ast.Subscript):  # eg. DATASET_MAPPING["segmentation"]
+        value = _registry_name(node.value)
+        index = node.slice
+        if hasattr(ast, "Index") and isinstance(index, ast.Index):  # py<3.9
+            index = index.value
+        try:
+            index = ast.literal_eval(index)
+        except ValueError:
+            return None
+        return f"{value}[{index}]" if value is not None else None
+    return None
+
+
+def _literal(node: Optional[ast.AST]):
+    """Value of a literal node, raise ValueError if it's not literal."""
+    if node is None:
+        return None
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError):
+        raise ValueError(f"Non-literal node {ast.dump(node)}")
+
+
+def _is_dataset_register(node: ast.AST) -> bool:
+    # DatasetRegistry.register(dim, module_name, train_filepath, ...), networks have no paths
+    return (
+        isinstance(node, ast.Call)
+        and getattr(node.func, "attr", None) == "register"
+        and (len(node.args) > 2 or any(k.arg == "train_filepath" for k in node.keywords))
+    )
+
+
+def _register_meta(call: ast.Call) -> Dict:
+    # DatasetRegistry.register(dim, module_name, train_filepath, test_filepath=None, module=None)
+    kwargs = {k.arg: k.value for k in call.keywords}
+    args = call.args + [None] * 4
+    meta = {}
+    for key, node in (
+        ("PATH", args[2] or kwargs.get("train_filepath")),
+        ("TEST_PATH", args[3] or kwargs.get("test_filepath")),
+    ):
+        try:
+            meta[key] = _literal(node)
+        except ValueError:
+            pass
+    return meta
+
+
+def _function_meta(node: Union[ast.FunctionDef, ast.ClassDef], register_index: int, fpath: Path) -> Tuple[Dict, Set]:
+    """Attributes set by the decorators applied after the `register_index`-th decorator
+    (decorators are applied from bottom to top), and the keys known without loading.
+    """
+    meta, known = {}, {"M_IN", "M_OUT", "SOURCE", "PROJECT"}
+    for decorator in node.decorator_list[:register_index]:
+        if isinstance(decorator, ast.Attribute) and decorator.attr == "snapshot":
+            meta["SOURCE"] = os.path.abspath(fpath)
+        elif isinstance(decorator, ast.Call) and getattr(decorator.func, "attr", None) in _META_DECORATORS:
+            key = _META_DECORATORS[decorator.func.attr]
+            try:
+                args = [_literal(arg) for arg in decorator.args]
+                meta[key] = args[0] if key == "PROJECT" else args
+            except (ValueError, IndexError):
+                known.discard(key)  # non-literal, read it after loading
+    return meta, known
+
+
+def scan_registrations(fpath: Union[str, Path], registry_names: Sequence[str]) -> Dict:
+    """Find `REGISTRY.register(dim, name, ...)` calls in the file, and the attributes
+    set by the decorators of the registered datasets.
+
+    Returns:
+        Dict: {"eager": bool, "registrations": [[registry_name, dim, name, metadata], ...]},
+            `eager` is True if the file must be imported to get its registrations.
+            `metadata` is None if it's not a dataset registered by decorator.
+    """
+    fpath = Path(fpath)
+    if fpath.suffix in CONFIG_SUFFIXES:
+        return scan_dataset_config(fpath, registry_names)
+
+    try:
+        tree = ast.parse(fpath.read_text(), filename=str(fpath))
+    except (SyntaxError, UnicodeDecodeError, OSError):
+        return {"eager": True, "registrations": []}
+
+    decorated = {}  # register decorator -> metadata
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            for i, decorator in enumerate(node.decorator_list):
+                if _is_dataset_register(decorator):
+                    meta, known = _function_meta(node, i, fpath)
+                    register_meta = _register_meta(decorator)
+                    meta.update(register_meta)
+                    meta["known"] = sorted(known | set(register_meta))
+                    decorated[id(decorator)] = meta
+
+    eager, registrations = False, []
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "register"):
+            continue
+        registry = _registry_name(node.func.value)
+        try:
+            dim, name = [ast.literal_eval(arg) for arg in node.args[:2]]
+        except (ValueError, TypeError, SyntaxError):
+            dim = name = None
+        if registry in registry_names and isinstance(name, str):
+            registrations.append([registry, str(dim), name, decorated.get(id(node))])
+        else:
+            eager = True
+    return {"eager": eager, "registrations": registrations}
+
+
+def scan_dataset_config(fpath: Union[str, Path], registry_names: Sequence[str]) -> Dict:
+    """Registration of the dataset config, see `strix.data_io.generate_dataset`."""
+    try:
+        with Path(fpath).open() as f:
+            attribute = yaml.full_load(f)["ATTRIBUTE"]
+        registry = f"DATASET_MAPPING[{attribute['FRAMEWORK']}]"
+        dim, name, path = str(attribute["DIM"]), attribute["NAME"], attribute["FILES_LIST"]
+    except Exception:
+        return {"eager": True, "registrations": []}
+
+    if registry not in registry_names:
+        return {"eager": True, "registrations": []}
+    meta = {"PATH": path, "TEST_PATH": None, "known": list(DATASET_META_KEYS)}
+    return {"eager": False, "registrations": [[registry, dim, name, meta]]}
+
+
+def _file_stat(fpath: Path) -> List[int]:
+    stat = fpath.stat()
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _manifest_path(cache_name: str) -> Path:
+    return Path(cfg.get_strix_cfg("CACHE_DIR")) / ".registry_manifest" / f"{cache_name}.json"
+
+
+def _read_manifest(path: Path) -> Dict:
+    try:
+        with path.open() as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if manifest.get("version") == MANIFEST_VERSION else {}
+
+
+def _write_manifest(path: Path, manifest: Dict) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_fname = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_fname, path)
+    except OSError:
+        pass  # read-only cache dir, scan again next time
+
+
+def load_manifest(files: Sequence[Path], registry_names: Sequence[str], cache_name: str) -> Dict[str, Dict]:
+    """Registrations of each file, cached in `CACHE_DIR`. Only the files added or
+    modified since the last run are scanned, removed files are dropped.
+    """
+    path = _manifest_path(cache_name)
+    manifest = _read_manifest(path)
+    registry_names = sorted(registry_names)
+    cached = manifest.get("files", {}) if manifest.get("registries") == registry_names else {}
+
+    entries, n_scanned = {}, 0
+    for fpath in files:
+        stat = _file_stat(fpath)
+        entry = cached.get(str(fpath))
+        if entry is None or entry["stat"] != stat:
+            entry = {"stat": stat, **scan_registrations(fpath, registry_names)}
+            n_scanned += 1
+        entries[str(fpath)] = entry
+
+    if n_scanned or entries.keys() != cached.keys():
+        _write_manifest(path, {"version": MANIFEST_VERSION, "registries": registry_names, "files": entries})
+    return entries
+
+
+def load_source(fpath: Union[str, Path], module_name: Optional[str] = None):
+    """Import the source file once. Builtin modules are imported by `module_name`."""
+    fpath = str(fpath)
+    if fpath not in _LOADED_FILES:
+        if module_name is not None:
+            _LOADED_FILES[fpath] = importlib.import_module(module_name)
+        else:
+            _LOADED_FILES[fpath] = import_file(Path(fpath).stem, fpath)
+    return _LOADED_FILES[fpath]
+
+
+def register_lazy_sources(
+    registries: Mapping,
+    files: Sequence[Path],
+    cache_name: str,
+    module_names: Optional[Mapping[str, str]] = None,
+    loader: Callable = load_source,
+) -> None:
+    """Register lazy placeholders of the modules registered in `files`.
+
+    Args:
+        registries: registry name -> `DimRegistry` used in the files, eg. {"SEGMENTATION_ARCHI": ...}.
+        files: source files to scan.
+        cache_name: name of the manifest cache file.
+        module_names: file path -> importable module name, for the builtin modules.
+        loader: callable to import a file, called with `(fpath, module_name)`.
+    """
+    module_names = module_names or {}
+    files = sorted(Path(f) for f in files)
+    entries = load_manifest(files, list(registries), cache_name)
+    for fpath, entry in entries.items():
+        module_name = module_names.get(fpath)
+        if entry["eager"]:
+            loader(fpath, module_name)
+            continue
+        for registry, dim, name, metadata in entry["registrations"]:
+            registries[registry].register_lazy(
+                dim, name, lambda f=fpath, m=module_name: loader(f, m), source=fpath, metadata=metadata
+            )
@@ -1,18 +1,139 @@
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Sequence
 
 import os
 import inspect
+import importlib
 from strix.utilities.enum import DIMS, NETWORK_ARGS
 
 
+class LazyEntry:
+    """Placeholder of a registered module, which is loaded when it's first accessed.
+
+    Args:
+        loader: callable which either registers the real module as side effect
+            (eg. importing the file which contains the register decorators),
+            or returns the real module.
+        source: where the module comes from, used in error messages.
+    """
+
+    def __init__(self, loader: Callable[[], Any], source: str = "") -> None:
+        self.loader = loader
+        self.source = source
+
+    def __repr__(self) -> str:
+        return f"LazyEntry({self.source})"
+
+
+def lazy_import(module_name: str, attr_name: str) -> LazyEntry:
+    """Lazily register `attr_name` of module `module_name`."""
+    return LazyEntry(
+        lambda: getattr(importlib.import_module(module_name), attr_name), f"{module_name}.{attr_name}"
+    )
+
+
+class LazyRecord(dict):
+    """Placeholder of a registered dataset, holding the attributes known without importing
+    its file (eg. "PATH", "PROJECT" recorded in the registry manifest). Accessing any other
+    attribute (eg. "FN") loads the file and reads it from the real record.
+
+    Args:
+        loader: callable which registers the real record, eg. by importing the file.
+        metadata: attributes known before loading.
+        known: keys of the attributes known before loading, the ones not in `metadata`
+            are known to be absent.
+        owner: dict which the placeholder is registered in.
+        key: name of the placeholder in `owner`.
+        source: where the module comes from, used in error messages.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Any],
+        metadata: Dict,
+        known: Sequence[str],
+        owner: dict,
+        key: str,
+        source: str = "",
+    ) -> None:
+        super().__init__(metadata)
+        self.loader = loader
+        self.known = set(known)
+        self.owner = owner
+        self.key = key
+        self.source = source
+        self.record = None
+
+    def load(self) -> dict:
+        if self.record is None:
+            self.loader()
+            record = dict.get(self.owner, self.key)
+            if record is self:
+                raise KeyError(f"'{self.key}' is not registered by {self.source}")
+            self.record = record
+        return self.record
+
+    def __getitem__(self, key):
+        if self.record is None:
+            if super().__contains__(key):
+                return super().__getitem__(key)
+            if key in self.known:
+                raise KeyError(key)
+        return self.load()[key]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self) -> str:
+        return f"LazyRecord({self.source})"
+
+
+def _is_registered(module_dict, module_name):
+    # lazy placeholders can be replaced by the real module
+    return module_name in module_dict and not isinstance(
+        dict.get(module_dict, module_name), (LazyEntry, LazyRecord)
+    )
+
+
+class LazyDict(dict):
+    """Dict whose `LazyEntry` values are loaded on access.
+    Listing the keys doesn't load anything.
+    """
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if not isinstance(value, LazyEntry):
+            return value
+
+        loaded = value.loader()
+        current = super().__getitem__(key)
+        if current is value:  # not registered by the loader
+            if loaded is None:
+                raise KeyError(f"'{key}' is not registered by {value.source}")
+            super().__setitem__(key, loaded)
+            current = loaded
+        return current
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+
 def _register_generic(module_dict, module_name, module):
-    assert module_name not in module_dict
-    module_dict[module_name] = module
+    assert not _is_registered(module_dict, module_name)
+    dict.__setitem__(module_dict, module_name, module)
 
 
 def _register_generic_dim(module_dict, dim, module_name, module):
-    assert module_name not in module_dict.get(
-        dim
+    assert not _is_registered(
+        module_dict.get(dim), module_name
     ), f"{module_name} already registed in {module_dict.get(dim)}"
 
     module_dict[dim].update({module_name: module})
@@ -21,15 +142,15 @@ def _register_generic_dim(module_dict, dim, module_name, module):
 def _register_generic_data(
     module_dict, dim, module_name, train_fpath, test_fpath, module
 ):
-    assert module_name not in module_dict.get(
-        dim
+    assert not _is_registered(
+        module_dict.get(dim), module_name
     ), f"{module_name} already registed in {module_dict.get(dim)}"
 
     attr = {module_name: {"FN": module, "PATH": train_fpath, "TEST_PATH": test_fpath}}
     module_dict[dim].update(attr)
 
 
-class Registry(dict):
+class Registry(LazyDict):
     """
     A helper class for managing registering modules, it extends a dictionary
     and provides a register functions.
@@ -50,6 +171,9 @@ class Registry(dict):
 
     Access of module is just like using a dictionary, eg:
         f = some_registry["foo_modeul"]
+
+    Modules can also be registered lazily, they are imported on first access:
+        some_registry.register("foo_module", lazy_import("foo_package.foo_file", "foo"))
     """
 
     def __init__(self, *args, **kwargs):
@@ -80,8 +204,8 @@ class DimRegistry(dict):
             "2D": "2D",
             "3D": "3D",
         }
-        self["2D"] = {}
-        self["3D"] = {}
+        self["2D"] = LazyDict()
+        self["3D"] = LazyDict()
 
     def register(self, dim, module_name, module=None):
         assert dim in DIMS, "Only support '2D'&'3D' dataset now"
@@ -98,6 +222,17 @@ class DimRegistry(dict):
 
         return register_fn
 
+    def register_lazy(
+        self, dim, module_name, loader: Callable[[], Any], source: str = "", metadata: Optional[Dict] = None
+    ):
+        """Register a placeholder which is replaced by the real module when it's first accessed,
+        `loader` should register the real module, eg. by importing the file which registers it.
+        `metadata` of the module recorded by the manifest is not used by default.
+        """
+        dim = self.dim_mapping[dim]
+        if module_name not in self[dim]:
+            dict.__setitem__(self[dim], module_name, LazyEntry(loader, source))
+
 
 class NetworkRegistry(DimRegistry):
     def __init__(self, *args, **kwargs):
@@ -160,12 +295,32 @@ class DatasetRegistry(DimRegistry):
 
         return register_fn
 
+    def register_lazy(
+        self, dim, module_name, loader: Callable[[], Any], source: str = "", metadata: Optional[Dict] = None
+    ):
+        """Register a placeholder of the dataset, which is replaced by the real record when it's
+        first accessed. With `metadata` (eg. {"PATH": ..., "PROJECT": ..., "known": [...]}), the
+        known attributes are read without loading the dataset.
+        """
+        if metadata is None:
+            return super().register_lazy(dim, module_name, loader, source)
+
+        dim = self.dim_mapping[dim]
+        if module_name not in self[dim]:
+            metadata = dict(metadata)
+            known = metadata.pop("known", list(metadata))
+            for key in ("M_IN", "M_OUT"):  # stored as list in json
+                if metadata.get(key) is not None:
+                    metadata[key] = tuple(metadata[key])
+            record = LazyRecord(loader, metadata, known, self[dim], module_name, source)
+            dict.__setitem__(self[dim], module_name, record)
+
     def _get_keys(self, val):
         dims = ["2D", "3D"]
         results = []
         for d in dims:
-            for key, value in self[d].items():
-                if val == value["FN"]:
+            for key, value in dict.items(self[d]):  # skip the lazy ones, avoid loading them
+                if not isinstance(value, (LazyEntry, LazyRecord)) and val == value["FN"]:
                     results.append((d, key))
         return results
 
@@ -205,3 +360,27 @@ class DatasetRegistry(DimRegistry):
             return fn
 
         return register_proj
+
+    def device_augment(self, augmentor):
+        """Register batched augmentor applied on device after `prepare_batch` in train engine.
+        Eg. `@DATASET_MAPPING[FRAMEWORK].device_augment(BatchAugmentor([BatchRandAffine(...)]))`
+        """
+        def register_augmentor(fn):
+            dim_module_list = self._get_keys(fn)
+            for dim, module_name in dim_module_list:
+                self[dim][module_name].update({"DEVICE_AUG": augmentor})
+            return fn
+
+        return register_augmentor
+
+    def dataloader(self, **settings):
+        """Register per-phase dataloader settings, see `strix.data_io.dataloader`.
+        Eg. `@DATASET_MAPPING[FRAMEWORK].dataloader(train={"num_workers": "auto"}, valid={"num_workers": 8})`
+        """
+        def register_dataloader(fn):
+            dim_module_list = self._get_keys(fn)
+            for dim, module_name in dim_module_list:
+                self[dim][module_name].update({"DATALOADER": settings})
+            return fn
+
+        return register_dataloader
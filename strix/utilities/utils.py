@@ -10,19 +10,8 @@ from pathlib import Path
 from functools import partial
 from typing import List, Optional, Tuple, Union, TextIO, Any
 
-import matplotlib
-import pylab
 import torch
-from PIL import Image, ImageColor, ImageDraw
-
-matplotlib.use("Agg")
-import matplotlib.cm as mpl_color_map
-import matplotlib.colors as mcolors
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
 import numpy as np
-import tensorboard.compat.proto.event_pb2 as event_pb2
-from matplotlib.ticker import ScalarFormatter
 from strix.utilities.enum import LR_SCHEDULES
 from monai.networks import one_hot
 from monai_ex.utils import ensure_list, GenericException
@@ -84,7 +73,19 @@ def get_attr_(obj, name, default = None):
     return getattr(obj, name) if hasattr(obj, name) else default
 
 
+def _pyplot():
+    # matplotlib is slow to import, only load it for plotting
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
 def get_colors(num: int = None):
+    import matplotlib.colors as mcolors
+
     if num:
         return list(mcolors.TABLEAU_COLORS.values())[:num]
     else:
@@ -120,6 +121,9 @@ def apply_colormap_on_image(org_im, activation, colormap_name):
         activation_map (numpy arr): Activation map (grayscale) 0-255
         colormap_name (str): Name of the colormap
     """
+    import matplotlib.cm as mpl_color_map
+    from PIL import Image
+
     # Get colormap
     color_map = mpl_color_map.get_cmap(colormap_name)
     no_trans_heatmap = color_map(activation)
@@ -139,7 +143,9 @@ def apply_colormap_on_image(org_im, activation, colormap_name):
 def create_rgb_summary(label):
     num_colors = label.shape[1]
 
-    cm = pylab.get_cmap("gist_rainbow")
+    import matplotlib.cm as mpl_color_map
+
+    cm = mpl_color_map.get_cmap("gist_rainbow")
 
     new_label = np.zeros(
         (label.shape[0], label.shape[1], label.shape[2], 3), dtype=np.float32
@@ -349,6 +355,10 @@ def get_specify_file(target_dir, regex_kw, get_first=True):
 
 
 def plot_summary(summary, output_fpath):
+    import matplotlib.ticker as ticker
+    from matplotlib.ticker import ScalarFormatter
+
+    plt = _pyplot()
     try:
         f = plt.figure(1)
         plt.clf()
@@ -382,6 +392,8 @@ def plot_summary(summary, output_fpath):
 
 
 def dump_tensorboard(db_file, dump_keys=None, save_image=False, verbose=False):
+    import tensorboard.compat.proto.event_pb2 as event_pb2
+
     if not os.path.isfile(db_file):
         raise FileNotFoundError(f"db_file is not found: {db_file}")
 
@@ -532,6 +544,8 @@ def __generate_colors(colors, num_colors):
             "It seems that you passed a tuple of colors instead of a list of colors"
         )
 
+    from PIL import ImageColor
+
     out_dtype = torch.uint8
 
     colors_ = []
@@ -608,6 +622,8 @@ def draw_segmentation_contour(
     Returns:
         img (Tensor[C, H, W]): Image Tensor, with segmentation masks drawn on top.
     """
+    from PIL import Image, ImageDraw
+
     out_dtype = torch.uint8
     image, masks = __check_image_mask(image, masks)
     colors_ = __generate_colors(colors, masks.size()[0])